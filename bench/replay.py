@@ -0,0 +1,237 @@
+# bench/replay.py
+"""
+Оффлайн-бенчмарк: прогоняет корпус апдейтов через хендлеры из build_app()
+при стабах OpenAI / Google CSE / Telegram Bot API с настраиваемой задержкой.
+
+    python -m bench.replay --repeat 20 --concurrency 16 --openai-latency 0.8
+
+Отчёт: updates/sec, p50/p95/p99 по хендлерам и лаг event loop.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from telegram import Update
+
+from bench.stubs import StubProcess
+
+CORPUS = os.path.join(os.path.dirname(__file__), "corpus.jsonl")
+BOT_USERNAME = "DunaevAssistentBot"
+
+
+def load_corpus(path: str = CORPUS) -> list[dict]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def build_update(entry: dict, update_id: int) -> dict:
+    """Превращает запись корпуса в JSON апдейта Telegram."""
+    user = {"id": entry["from"]["id"], "is_bot": False, "first_name": "Bench", "username": entry["from"].get("username")}
+    message = {
+        "message_id": update_id,
+        "date": int(time.time()),
+        "chat": entry["chat"],
+        "from": user,
+    }
+    if entry.get("voice"):
+        message["voice"] = {"file_id": f"voice-{update_id}", "file_unique_id": f"uv-{update_id}", "duration": 3, "file_size": 4100}
+    elif entry.get("document"):
+        message["document"] = {"file_id": f"doc-{update_id}", "file_unique_id": f"ud-{update_id}", "file_size": 14000, **entry["document"]}
+        if entry.get("text"):
+            message["caption"] = entry["text"]
+    else:
+        text = entry.get("text", "")
+        message["text"] = text
+        if entry.get("command"):
+            command = text.split(" ", 1)[0]
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(command)}]
+    if entry.get("reply_to_bot"):
+        message["reply_to_message"] = {
+            "message_id": update_id - 1,
+            "date": int(time.time()),
+            "chat": entry["chat"],
+            "from": {"id": 1, "is_bot": True, "first_name": "Bot", "username": BOT_USERNAME},
+            "text": "Предыдущий ответ бота.",
+        }
+    return {"update_id": update_id, "message": message}
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    idx = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+async def _monitor_loop_lag(samples: list[float], stop: asyncio.Event, interval: float = 0.01):
+    """Лаг event loop: насколько позже запланированного просыпается sleep(interval)."""
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, time.perf_counter() - started - interval))
+
+
+async def replay(app, corpus: list[dict], repeat: int = 1, concurrency: int = 16) -> dict:
+    latencies: dict[str, list[float]] = defaultdict(list)
+    lag: list[float] = []
+    stop = asyncio.Event()
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(entry, update_id):
+        update = Update.de_json(build_update(entry, update_id), app.bot)
+        async with sem:
+            started = time.perf_counter()
+            # через процессор апдейтов, как в Application: там же гейт допуска
+            await app.update_processor.process_update(update, app.process_update(update))
+            latencies[entry["handler"]].append(time.perf_counter() - started)
+
+    async with app:
+        monitor = asyncio.create_task(_monitor_loop_lag(lag, stop))
+        started = time.perf_counter()
+        update_id = 1
+        tasks = []
+        for _ in range(repeat):
+            for entry in corpus:
+                tasks.append(asyncio.create_task(one(entry, update_id)))
+                update_id += 1
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await monitor
+    # как on_shutdown у бота: write-behind хранилища — на диск, пулы и http-клиент закрыты
+    ctx = app.bot_data.get("ctx")
+    if ctx is not None:
+        await ctx.shutdown()
+
+    total = sum(len(v) for v in latencies.values())
+    return {
+        "updates": total,
+        "elapsed": elapsed,
+        "updates_per_sec": total / elapsed if elapsed else 0.0,
+        "handlers": {
+            name: {
+                "count": len(samples),
+                "p50": percentile(samples, 50),
+                "p95": percentile(samples, 95),
+                "p99": percentile(samples, 99),
+            }
+            for name, samples in sorted(latencies.items())
+        },
+        "loop_lag": {
+            "p50": percentile(lag, 50),
+            "p99": percentile(lag, 99),
+            "max": max(lag, default=0.0),
+        },
+    }
+
+
+@contextmanager
+def _patched_env(values: dict):
+    saved = {k: os.environ.get(k) for k in values}
+    os.environ.update({k: str(v) for k, v in values.items()})
+    try:
+        yield
+    finally:
+        for k, v in saved.items():
+            if v is None:
+                os.environ.pop(k, None)
+            else:
+                os.environ[k] = v
+
+
+def run_benchmark(
+    corpus: list[dict],
+    repeat: int = 1,
+    concurrency: int = 16,
+    stream: bool = False,
+    extra_env: dict | None = None,
+    **latencies,
+) -> dict:
+    stubs = StubProcess(**latencies).start()
+    # базы бенчмарка удаляются вместе с каталогом, даже если прогон упал
+    with tempfile.TemporaryDirectory(prefix="gptbot-bench-") as tmp:
+        env = {
+            "TELEGRAM_TOKEN": "123456:bench",
+            "OPENAI_API_KEY": "bench",
+            "OPENAI_BASE_URL": stubs.urls["openai"],
+            "GOOGLE_CSE_API_KEY": "bench",
+            "GOOGLE_CSE_CX": "bench",
+            "GOOGLE_CSE_URL": stubs.urls["cse"],
+            "TELEGRAM_API_BASE_URL": stubs.urls["telegram_api"],
+            "TELEGRAM_FILE_BASE_URL": stubs.urls["telegram_file"],
+            "HISTORY_DB": os.path.join(tmp, "history.sqlite3"),
+            "LEDGER_DB": os.path.join(tmp, "usage.sqlite3"),
+            "STATE_DB": os.path.join(tmp, "state.sqlite3"),
+            "UPDATE_CONCURRENCY": str(concurrency),
+            "USER_RATE_PER_MIN": "1000000",
+            "USER_BURST": "1000000",
+            "METRICS_PORT": "0",
+            "STREAM_REPLIES": "1" if stream else "0",
+            **(extra_env or {}),
+        }
+        try:
+            with _patched_env(env):
+                from gptbot.app import build_app
+                from gptbot.config import Config
+                from gptbot.context import AppContext
+
+                ctx = AppContext(Config.from_env(os.environ))
+                app = build_app(ctx)
+                try:
+                    report = asyncio.run(replay(app, corpus, repeat=repeat, concurrency=concurrency))
+                finally:
+                    ctx.close()
+        finally:
+            stubs.stop()
+    report["backend_calls"] = stubs.calls
+    return report
+
+
+def format_report(report: dict) -> str:
+    lines = [
+        f"updates: {report['updates']} in {report['elapsed']:.2f}s → {report['updates_per_sec']:.1f} updates/sec",
+        f"{'handler':<16}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}",
+    ]
+    for name, st in report["handlers"].items():
+        lines.append(f"{name:<16}{st['count']:>7}{st['p50'] * 1000:>10.1f}{st['p95'] * 1000:>10.1f}{st['p99'] * 1000:>10.1f}")
+    lag = report["loop_lag"]
+    lines.append(f"event loop lag: p50 {lag['p50'] * 1000:.1f} ms, p99 {lag['p99'] * 1000:.1f} ms, max {lag['max'] * 1000:.1f} ms")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay-бенчмарк хендлеров бота на стабах")
+    parser.add_argument("--corpus", default=CORPUS)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--stream", action="store_true", help="STREAM_REPLIES=1")
+    parser.add_argument("--openai-latency", type=float, default=0.5)
+    parser.add_argument("--transcribe-latency", type=float, default=0.3)
+    parser.add_argument("--cse-latency", type=float, default=0.2)
+    parser.add_argument("--telegram-latency", type=float, default=0.02)
+    parser.add_argument("--json", action="store_true", help="вывести отчёт в JSON")
+    args = parser.parse_args(argv)
+
+    report = run_benchmark(
+        load_corpus(args.corpus),
+        repeat=args.repeat,
+        concurrency=args.concurrency,
+        stream=args.stream,
+        openai_latency=args.openai_latency,
+        transcribe_latency=args.transcribe_latency,
+        cse_latency=args.cse_latency,
+        telegram_latency=args.telegram_latency,
+    )
+    print(json.dumps(report, indent=2) if args.json else format_report(report))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,255 @@
+# bench/stubs.py
+"""
+Локальные стабы внешних API для бенчмарка и тестов: OpenAI (включая Batch API), Google CSE и Telegram Bot API.
+Задержка каждого бэкенда настраивается; запускаются в отдельном процессе,
+чтобы не искажать замер лага event loop бота.
+"""
+import asyncio
+import json
+import multiprocessing
+import time
+from collections import Counter
+from email.parser import BytesParser
+from email.policy import default as default_policy
+from urllib.parse import parse_qs
+
+from gptbot.http_listener import Response, start_server
+
+ANSWER = "Это ответ стаба. " * 20
+
+
+class StubBackends:
+    def __init__(
+        self,
+        openai_latency: float = 0.5,
+        transcribe_latency: float = 0.3,
+        cse_latency: float = 0.2,
+        telegram_latency: float = 0.02,
+        answer: str = ANSWER,
+    ):
+        self.openai_latency = openai_latency
+        self.transcribe_latency = transcribe_latency
+        self.cse_latency = cse_latency
+        self.telegram_latency = telegram_latency
+        self.answer = answer
+        self.calls = Counter()
+        self._message_id = 1000
+        self.files: dict[str, bytes] = {}
+        self.batches: dict[str, dict] = {}
+
+    # --------------------
+    # OpenAI
+    # --------------------
+    async def openai(self, req):
+        if req.path.endswith("/chat/completions"):
+            self.calls["openai.chat"] += 1
+            body = json.loads(req.body or b"{}")
+            await asyncio.sleep(self.openai_latency)
+            if body.get("stream"):
+                return self._sse(body.get("model", "stub"))
+            return _json(self._chat_body(body.get("model", "stub")))
+        if req.path.endswith("/audio/transcriptions"):
+            self.calls["openai.transcribe"] += 1
+            await asyncio.sleep(self.transcribe_latency)
+            return _json({"text": "расшифровка голосового сообщения"})
+        if req.path.endswith("/embeddings"):
+            self.calls["openai.embeddings"] += 1
+            return _json({
+                "object": "list",
+                "model": "stub",
+                "data": [{"object": "embedding", "index": 0, "embedding": [0.1] * 8}],
+                "usage": {"prompt_tokens": 5, "total_tokens": 5},
+            })
+        if "/files" in req.path or "/batches" in req.path:
+            return self._batch_api(req)
+        return Response(404, "not found")
+
+    def _chat_body(self, model: str) -> dict:
+        return {
+            "id": "chatcmpl-stub",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": self.answer}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 100, "completion_tokens": 50, "total_tokens": 150},
+        }
+
+    # --------------------
+    # Batch API: батч готов со второго опроса
+    # --------------------
+    def _batch_api(self, req):
+        parts = req.path.strip("/").split("/")[1:]  # без префикса v1
+        if parts == ["files"] and req.method == "POST":
+            self.calls["openai.files.create"] += 1
+            file_id = f"file-{len(self.files) + 1}"
+            self.files[file_id] = _multipart_file(req)
+            return _json({"id": file_id, "object": "file", "bytes": len(self.files[file_id]), "created_at": 0,
+                          "filename": "batch.jsonl", "purpose": "batch", "status": "processed"})
+        if parts[:1] == ["files"] and parts[-1:] == ["content"]:
+            self.calls["openai.files.content"] += 1
+            return Response(200, self.files.get(parts[1], b""), content_type="application/octet-stream")
+        if parts == ["batches"] and req.method == "POST":
+            self.calls["openai.batches.create"] += 1
+            body = json.loads(req.body)
+            batch_id = f"batch-{len(self.batches) + 1}"
+            self.batches[batch_id] = {"input": body["input_file_id"], "polls": 0, "output": None}
+            return _json(self._batch(batch_id, "validating"))
+        if parts[:1] == ["batches"] and len(parts) == 2:
+            self.calls["openai.batches.retrieve"] += 1
+            batch = self.batches.get(parts[1])
+            if batch is None:
+                return Response(404, "not found")
+            batch["polls"] += 1
+            if batch["polls"] < 2:
+                return _json(self._batch(parts[1], "in_progress"))
+            if batch["output"] is None:
+                rows = []
+                for line in self.files[batch["input"]].decode().splitlines():
+                    item = json.loads(line)
+                    rows.append({
+                        "id": f"req-{item['custom_id']}",
+                        "custom_id": item["custom_id"],
+                        "response": {"status_code": 200, "request_id": "stub", "body": self._chat_body(item["body"].get("model", "stub"))},
+                        "error": None,
+                    })
+                batch["output"] = f"file-{len(self.files) + 1}"
+                self.files[batch["output"]] = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in rows).encode()
+            return _json(self._batch(parts[1], "completed", output_file_id=batch["output"]))
+        return Response(404, "not found")
+
+    def _batch(self, batch_id: str, status: str, output_file_id=None) -> dict:
+        return {
+            "id": batch_id, "object": "batch", "endpoint": "/v1/chat/completions", "errors": None,
+            "input_file_id": self.batches[batch_id]["input"], "completion_window": "24h", "status": status,
+            "output_file_id": output_file_id, "created_at": 0,
+        }
+
+    def _sse(self, model: str) -> Response:
+        events = []
+        for word in self.answer.split(" "):
+            events.append({
+                "id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": 0, "model": model,
+                "choices": [{"index": 0, "delta": {"content": word + " "}, "finish_reason": None}],
+            })
+        events.append({
+            "id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": 0, "model": model,
+            "choices": [], "usage": {"prompt_tokens": 100, "completion_tokens": 50, "total_tokens": 150},
+        })
+        body = "".join(f"data: {json.dumps(e)}\n\n" for e in events) + "data: [DONE]\n\n"
+        return Response(200, body, content_type="text/event-stream")
+
+    # --------------------
+    # Google CSE
+    # --------------------
+    async def cse(self, req):
+        self.calls["cse"] += 1
+        await asyncio.sleep(self.cse_latency)
+        items = [
+            {"title": f"Результат {i}", "link": f"https://example.com/{i}", "snippet": "Сниппет результата поиска."}
+            for i in range(int(req.query.get("num", 8)))
+        ]
+        return _json({"items": items})
+
+    # --------------------
+    # Telegram Bot API
+    # --------------------
+    async def telegram(self, req):
+        if req.path.startswith("/file/"):
+            self.calls["telegram.file"] += 1
+            if "/documents/" in req.path:
+                return Response(200, _DOCUMENT, content_type="application/octet-stream")
+            return Response(200, b"OggS" + b"\0" * 4096, content_type="application/octet-stream")
+
+        method = req.path.rsplit("/", 1)[-1]
+        self.calls[f"telegram.{method}"] += 1
+        await asyncio.sleep(self.telegram_latency)
+        params = {k: v[-1] for k, v in parse_qs(req.body.decode()).items()} if req.body else {}
+
+        if method == "getMe":
+            return _ok({"id": 1, "is_bot": True, "first_name": "Bench", "username": "DunaevAssistentBot"})
+        if method == "getUpdates":
+            # long polling без новых апдейтов
+            await asyncio.sleep(min(float(params.get("timeout", 0) or 0), 0.5))
+            return _ok([])
+        if method == "getFile":
+            file_id = params.get("file_id", "f")
+            path = "documents/file.txt" if file_id.startswith("doc-") else "voice/file.oga"
+            return _ok({"file_id": file_id, "file_unique_id": f"u-{file_id}", "file_size": 4100, "file_path": path})
+        if method in ("sendMessage", "editMessageText"):
+            self._message_id += 1
+            return _ok({
+                "message_id": int(params.get("message_id", self._message_id)),
+                "date": int(time.time()),
+                "chat": {"id": int(params.get("chat_id", 0)), "type": "private"},
+                "text": params.get("text", ""),
+            })
+        return _ok(True)
+
+
+# текстовый документ для бенчмарка вложений
+_DOCUMENT = "\n".join(f"Пункт {i}. Условия договора поставки, сроки и ответственность сторон." for i in range(200)).encode()
+
+
+def _multipart_file(req) -> bytes:
+    """Содержимое поля file из multipart/form-data."""
+    head = f"Content-Type: {req.headers.get('content-type', '')}\r\n\r\n".encode()
+    msg = BytesParser(policy=default_policy).parsebytes(head + req.body)
+    for part in msg.iter_parts():
+        if part.get_param("name", header="content-disposition") == "file":
+            return part.get_payload(decode=True)
+    return b""
+
+
+def _json(data) -> Response:
+    return Response(200, json.dumps(data, ensure_ascii=False), content_type="application/json")
+
+
+def _ok(result) -> Response:
+    return _json({"ok": True, "result": result})
+
+
+async def _serve(stubs: StubBackends, ready, stop_event):
+    servers = {
+        "openai": await start_server(stubs.openai, "127.0.0.1", 0),
+        "cse": await start_server(stubs.cse, "127.0.0.1", 0),
+        "telegram": await start_server(stubs.telegram, "127.0.0.1", 0),
+    }
+    ready.put({name: srv.sockets[0].getsockname()[1] for name, srv in servers.items()})
+    while not stop_event.is_set():
+        await asyncio.sleep(0.1)
+    ready.put(dict(stubs.calls))
+    for srv in servers.values():
+        srv.close()
+
+
+def _process_main(kwargs, ready, stop_event):
+    asyncio.run(_serve(StubBackends(**kwargs), ready, stop_event))
+
+
+class StubProcess:
+    """Стабы в отдельном процессе. urls — базовые адреса для env бота, calls — счётчики после stop()."""
+
+    def __init__(self, **kwargs):
+        ctx = multiprocessing.get_context("spawn")
+        self._ready = ctx.Queue()
+        self._stop = ctx.Event()
+        self._proc = ctx.Process(target=_process_main, args=(kwargs, self._ready, self._stop), daemon=True)
+        self.urls: dict[str, str] = {}
+        self.calls: dict[str, int] = {}
+
+    def start(self):
+        self._proc.start()
+        ports = self._ready.get(timeout=30)
+        base = "http://127.0.0.1"
+        self.urls = {
+            "openai": f"{base}:{ports['openai']}/v1",
+            "cse": f"{base}:{ports['cse']}/customsearch/v1",
+            "telegram_api": f"{base}:{ports['telegram']}/bot",
+            "telegram_file": f"{base}:{ports['telegram']}/file/bot",
+        }
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self.calls = self._ready.get(timeout=30)
+        self._proc.join(timeout=10)
@@ -0,0 +1,5 @@
+"""
+Telegram GPT-бот. Состояние — в AppContext (gptbot.context), хендлеры — gptbot.handlers,
+сборка Application и режимы запуска — gptbot.app. Пакет нарочно ничего не импортирует здесь:
+gpt_bot.py включает профиль старта до первых тяжёлых импортов.
+"""
@@ -0,0 +1,8 @@
+# python -m gptbot [--profile-startup]
+from gptbot import startup
+
+startup.begin()
+
+from gptbot.app import main  # noqa: E402
+
+main()
@@ -0,0 +1,123 @@
+# admission.py
+import json
+import os
+import re
+import time
+
+from .logger import setup_logger
+
+logger = setup_logger()
+
+_GROUP_TYPES = frozenset(("group", "supergroup"))
+
+
+class Admission:
+    """
+    Допуск апдейта к хендлерам до диспетчеризации: в личке — только админы,
+    в рабочей группе — только упоминание бота или ответ на его сообщение.
+    Списки доступа — frozenset'ы, упоминание ищет один скомпилированный regex.
+    Отказ ничего не логирует и не создаёт: шум группы отсекается за пару сравнений.
+    config_path (ACCESS_CONFIG) — JSON {"admins", "limited_users", "chat_id", "bot_username"};
+    файл перечитывается при изменении, mtime проверяется не чаще раза в reload_interval секунд.
+    """
+
+    def __init__(
+        self,
+        admins,
+        chat_id: int,
+        bot_username: str,
+        limited=(),
+        config_path: str | None = None,
+        reload_interval: float = 5.0,
+        on_reload=None,
+    ):
+        self.config_path = config_path
+        self.reload_interval = reload_interval
+        self.on_reload = on_reload
+        self.admitted = 0
+        self.dropped = 0
+        self._mtime = None
+        self._next_check = 0.0
+        self._apply(admins, limited, chat_id, bot_username)
+        self.maybe_reload()
+
+    def _apply(self, admins, limited, chat_id: int, bot_username: str):
+        # сначала всё разбираем, потом подменяем — битый конфиг не оставит половину настроек
+        parsed = (
+            frozenset(int(a) for a in admins),
+            frozenset(int(u) for u in limited),
+            int(chat_id),
+            str(bot_username),
+            # как прежний `BOT_USERNAME.lower() in text.lower()`, но без копий текста
+            re.compile(re.escape(bot_username), re.IGNORECASE),
+        )
+        self.admins, self.limited, self.chat_id, self.bot_username, self.mention = parsed
+
+    # --------------------
+    # Конфиг
+    # --------------------
+    def maybe_reload(self) -> bool:
+        if not self.config_path:
+            return False
+        now = time.monotonic()
+        if now < self._next_check:
+            return False
+        self._next_check = now + self.reload_interval
+        try:
+            mtime = os.stat(self.config_path).st_mtime
+        except OSError:
+            return False
+        if mtime == self._mtime:
+            return False
+        try:
+            with open(self.config_path, encoding="utf-8") as f:
+                data = json.load(f)
+            self._apply(
+                data.get("admins", self.admins),
+                data.get("limited_users", self.limited),
+                data.get("chat_id", self.chat_id),
+                data.get("bot_username", self.bot_username),
+            )
+        except (OSError, ValueError, TypeError):
+            logger.exception("access config %s is invalid, keeping previous settings", self.config_path)
+            return False
+        self._mtime = mtime
+        logger.info(
+            "access config loaded: %d admins, %d limited, chat %s", len(self.admins), len(self.limited), self.chat_id
+        )
+        if self.on_reload is not None:
+            self.on_reload(self)
+        return True
+
+    # --------------------
+    # Проверка
+    # --------------------
+    def is_admin(self, user_id: int) -> bool:
+        return user_id in self.admins
+
+    def allows(self, user, chat, message) -> bool:
+        if chat.type == "private":
+            return user is not None and user.id in self.admins
+        if chat.id != self.chat_id or chat.type not in _GROUP_TYPES:
+            return False
+        text = message.text or message.caption
+        if text and self.mention.search(text):
+            return True
+        reply = getattr(message, "reply_to_message", None)
+        if reply is None:
+            return False
+        author = reply.from_user
+        return author is not None and author.username == self.bot_username
+
+    def admit(self, update) -> bool:
+        """Гейт перед диспетчеризацией; апдейты без сообщения (служебные) пропускаются как есть."""
+        self.maybe_reload()
+        message = update.effective_message
+        chat = update.effective_chat
+        if message is None or chat is None:
+            return True
+        if self.allows(update.effective_user, chat, message):
+            self.admitted += 1
+            return True
+        self.dropped += 1
+        return False
@@ -0,0 +1,246 @@
+# app.py
+"""Сборка Application вокруг AppContext и режимы запуска: polling, webhook, шарды."""
+import asyncio
+import os
+import secrets
+
+from telegram import Update
+from telegram.ext import ApplicationBuilder, CommandHandler, MessageHandler, TypeHandler, filters
+from telegram.ext.filters import Document
+
+from . import context, handlers, lifecycle, logger as log, metrics, shards, startup, webhook
+from .config import BASE_DIR, Config
+from .context import AppContext
+from .handlers import bind
+from .logger import bind_update, setup_logger
+
+startup.mark("импорты")
+
+logger = setup_logger()
+
+
+def queue_cache_warmup(ctx: AppContext, path: str):
+    """Вопросы из файла (по одному на строку) уходят в батч; ответы лягут в кэш ответов."""
+    if not (ctx.batch_queue and ctx.response_cache.enabled and path and os.path.exists(path)):
+        return
+    with open(path, encoding="utf-8") as f:
+        prompts = [line.strip() for line in f if line.strip()]
+    model = ctx.router.default_model
+    for prompt in prompts:
+        ctx.batch_queue.submit(
+            "warm",
+            {"model": model, "messages": [{"role": "user", "content": prompt}]},
+            meta={"model": model, "prompt": prompt},
+            key=f"warm:{model}:{prompt}",
+        )
+    logger.info("batch: queued %d warm-up prompts", len(prompts))
+
+
+def temp_dirs(ctx: AppContext) -> list[str]:
+    return [BASE_DIR, ctx.deep_search.cache_dir if ctx.deep_search else None]
+
+
+async def serve_metrics(config: Config):
+    """Локальный /metrics, если задан METRICS_PORT; у каждого шарда свой порт: METRICS_PORT + номер шарда."""
+    if not config.metrics_port:
+        return None
+    return await metrics.serve(config.metrics_host, config.metrics_port + (config.shard_index or 0))
+
+
+async def on_startup(ctx: AppContext, app):
+    """post_init: поднимаем локальный /metrics, если задан METRICS_PORT, и фоновые батчи."""
+    logger.info("Bot username: %s", app.bot.username)
+    lifecycle.cleanup_temp(*temp_dirs(ctx))
+    # апдейты, не доделанные до прошлой остановки, обрабатываются первыми
+    # у шарда свой checkpoint: чужие апдейты (другие пользователи, другая история) он не подхватывает
+    await lifecycle.restore_checkpoint(app, ctx.config.update_checkpoint + ctx.config.shard_suffix())
+    # у тенантов реестр метрик общий — /metrics поднимает serve_tenants, один на процесс
+    if ctx.owns_shared:
+        app.bot_data["metrics_server"] = await serve_metrics(ctx.config)
+    # openai импортируется в фоне, пока бот уже забирает апдейты, — первый запрос к модели его не ждёт
+    ctx.client.preload()
+    if ctx.batch_queue:
+        queue_cache_warmup(ctx, ctx.config.cache_warmup_file)
+        app.bot_data["batch_task"] = asyncio.create_task(ctx.batch_queue.run())
+
+
+async def on_shutdown(ctx: AppContext, app):
+    task = app.bot_data.pop("batch_task", None)
+    if task is not None:
+        task.cancel()
+    await close_server(app.bot_data.pop("metrics_server", None))
+    # всё отложенное — на диск до выхода процесса
+    await ctx.shutdown()
+    lifecycle.cleanup_temp(*temp_dirs(ctx))
+
+
+async def close_server(server):
+    if server is not None:
+        server.close()
+        await server.wait_closed()
+
+
+# --------------------
+# Main
+# --------------------
+def build_app(ctx: AppContext):
+    config = ctx.config
+    # апдейты обрабатываются параллельно — иначе медленный ответ одному держит всех;
+    # процессор знает, что в работе, и при остановке дожидается или сохраняет это в checkpoint
+    processor = lifecycle.DrainingUpdateProcessor(
+        config.update_concurrency,
+        checkpoint_path=config.update_checkpoint + config.shard_suffix(),
+        # шум группы (не упоминание и не ответ боту) отсекается здесь, до хендлеров
+        admit=ctx.admission.admit,
+    )
+    builder = (
+        ApplicationBuilder()
+        .token(config.telegram_token)
+        .concurrent_updates(processor)
+        .post_init(lambda app: on_startup(ctx, app))
+        .post_shutdown(lambda app: on_shutdown(ctx, app))
+    )
+    # свой Bot API сервер (local bot api или стаб бенчмарка)
+    if config.telegram_api_base_url:
+        builder = builder.base_url(config.telegram_api_base_url)
+    if config.telegram_file_base_url:
+        builder = builder.base_file_url(config.telegram_file_base_url)
+    if startup.PROFILE:
+        builder = builder.get_updates_request(startup.probe_request(startup.PROFILE.finish))
+    app = builder.build()
+    app.bot_data["ctx"] = ctx
+
+    # correlation id на каждый апдейт — раньше всех остальных хендлеров
+    app.add_handler(TypeHandler(Update, bind_update), group=-1)
+
+    # Команды
+    app.add_handler(CommandHandler("start", bind(ctx, handlers.start)))
+    app.add_handler(CommandHandler("help", bind(ctx, handlers.help_cmd)))
+    app.add_handler(CommandHandler("model", bind(ctx, handlers.set_model)))
+    app.add_handler(CommandHandler("quota", bind(ctx, handlers.quota)))
+    app.add_handler(CommandHandler("reset", bind(ctx, handlers.reset)))
+    app.add_handler(CommandHandler("search", bind(ctx, handlers.search_cmd)))
+    app.add_handler(CommandHandler("web", bind(ctx, handlers.search_web)))
+    app.add_handler(CommandHandler("stats", bind(ctx, handlers.stats_cmd)))
+
+    # Сообщения
+    #app.add_handler(MessageHandler(filters.ALL, bind(ctx, handlers.debug_log)), group=0)
+    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, bind(ctx, handlers.handle_text)))
+    app.add_handler(MessageHandler(filters.VOICE, bind(ctx, handlers.handle_voice)))
+    app.add_handler(MessageHandler(filters.PHOTO | Document.ALL, bind(ctx, handlers.handle_attachment)))
+    app.add_handler(MessageHandler(filters.VIDEO, bind(ctx, handlers.handle_unsupported)))
+
+    app.add_error_handler(bind(ctx, handlers.error_handler))
+    return app
+
+
+def webhook_settings(config: Config) -> dict:
+    secret = config.webhook_secret
+    if not secret:
+        # без секрета любой, кто достучится до порта, прислал бы апдейт «от админа»;
+        # случайный секрет уходит в setWebhook при каждом старте
+        secret = secrets.token_urlsafe(32)
+        logger.warning("WEBHOOK_SECRET не задан — сгенерирован случайный секрет на время работы")
+    return {
+        "host": config.webhook_listen,
+        "port": config.webhook_port,
+        "path": config.webhook_path,
+        "secret_token": secret,
+    }
+
+
+def shard_worker(index: int, inbox):
+    """Процесс-воркер шарда: свой AppContext и Application, апдейты своих чатов — из очереди супервизора."""
+    os.environ["SHARD_INDEX"] = str(index)
+    ctx = AppContext(Config.from_env())
+    app = build_app(ctx)
+    asyncio.run(shards.serve_inbox(app, inbox, drain_timeout=ctx.config.shutdown_grace))
+    ctx.close()
+
+
+async def serve_tenants(registry, drain_timeout: float):
+    """
+    Все тенанты на одном event loop: у каждого свой Application и polling, остановка общая.
+    Задача тенанта помечает свои логи и расход токенов (logger.tenant, context.active) —
+    задачи Application наследуют эти значения.
+    """
+    stop = asyncio.Event()
+    # процесс один — и /metrics один: порт и хост из окружения процесса, общего для всех тенантов
+    server = await serve_metrics(next(iter(registry)).config)
+
+    async def run(ctx: AppContext):
+        log.tenant.set(ctx.config.name)
+        context.active.set(ctx)
+        try:
+            await lifecycle.run_polling(build_app(ctx), drain_timeout=drain_timeout, stop=stop)
+        except Exception:
+            # один упавший бот (например, отозванный токен) гасит остальных штатно, а не бросает их
+            logger.exception("tenant %s failed, stopping all tenants", ctx.config.name)
+            stop.set()
+            raise
+
+    try:
+        results = await asyncio.gather(*(run(ctx) for ctx in registry), return_exceptions=True)
+    finally:
+        await close_server(server)
+        await registry.shutdown()
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+
+
+def run_tenants(path: str):
+    """TENANTS_CONFIG: несколько ботов в одном процессе — общие клиенты OpenAI/HTTP, поиск и метрики."""
+    from .tenants import TenantRegistry, load_configs
+
+    registry = TenantRegistry(load_configs(path))
+    try:
+        asyncio.run(serve_tenants(registry, next(iter(registry)).config.shutdown_grace))
+    finally:
+        registry.close()
+
+
+def main():
+    tenants_config = Config.tenants_config()
+    if tenants_config:
+        # тенанты работают только в одном процессе и через polling: WORKERS и RUN_MODE=webhook не применяются
+        logger.info("GPT-боты запущены из %s", tenants_config)
+        run_tenants(tenants_config)
+        return
+
+    config = Config.from_env()
+    run_mode = config.run_mode
+    # WORKERS > 1: супервизор принимает апдейты и раздаёт их процессам по user_id (shard_of)
+    workers = config.workers
+    stop = None
+    if startup.PROFILE:
+        # --profile-startup меряет однопроцессный polling и гасит бота после первого getUpdates
+        run_mode, workers = "polling", 1
+        stop = asyncio.Event()
+        startup.PROFILE.on_finish = stop.set
+    logger.info("GPT-бот запущен! Текущая модель: %s, режим: %s", config.default_model, run_mode)
+
+    if workers > 1:
+        # самому супервизору клиенты и хранилища не нужны — AppContext есть у каждого воркера
+        supervisor = shards.Supervisor(workers, shard_worker)
+        base_url = config.telegram_api_base_url or "https://api.telegram.org/bot"
+        if run_mode == "webhook":
+            settings = webhook_settings(config)
+            asyncio.run(webhook.register(config.telegram_token, config.webhook_url, settings["secret_token"], base_url=base_url))
+            ingress = lambda dispatch, stop: webhook.listen(dispatch, stop, **settings)
+        else:
+            ingress = lambda dispatch, stop: shards.poll_updates(config.telegram_token, dispatch, stop, base_url=base_url)
+        asyncio.run(supervisor.run(ingress, drain_timeout=config.shutdown_grace))
+        return
+
+    ctx = AppContext(config)
+    startup.mark("AppContext")
+    app = build_app(ctx)
+    if run_mode == "webhook":
+        settings = webhook_settings(config)
+        asyncio.run(webhook.serve(app, webhook_url=config.webhook_url, drain_timeout=config.shutdown_grace, **settings))
+    else:
+        startup.mark("build_app")
+        asyncio.run(lifecycle.run_polling(app, drain_timeout=config.shutdown_grace, stop=stop))
+
+    ctx.close()
@@ -0,0 +1,310 @@
+# attachments.py
+import asyncio
+import base64
+import importlib.util
+import io
+import os
+
+import httpx
+
+from .cache import TTLCache
+from .context_window import count_tokens
+from .logger import setup_logger
+
+logger = setup_logger()
+
+# больше Bot API через getFile всё равно не отдаёт
+MAX_FILE_BYTES = 20 * 1024 * 1024
+TEXT_EXTENSIONS = {".txt", ".md", ".csv", ".tsv", ".json", ".log", ".xml", ".yaml", ".yml", ".ini", ".py", ".sql"}
+IMAGE_TYPES = {"image/jpeg", "image/png", "image/webp", "image/gif"}
+_DOCX_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_DOCX_MIME = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+
+class FileTooLarge(ValueError):
+    def __init__(self, limit: int):
+        self.limit = limit
+        super().__init__(f"Файл больше {limit // (1024 * 1024)} МБ")
+
+
+class UnsupportedFile(ValueError):
+    pass
+
+
+class DownloadFailed(RuntimeError):
+    """Файл не скачался. В тексте нет URL: ссылка на файл Telegram содержит токен бота."""
+
+
+def vision_size(width: int, height: int, detail: str = "auto") -> tuple[int, int]:
+    """
+    Разрешение, до которого OpenAI всё равно уменьшит картинку перед vision-моделью:
+    low — 512 по длинной стороне, иначе 2048 по длинной и 768 по короткой. Больше слать незачем.
+    """
+    long_limit, short_limit = (512, 512) if detail == "low" else (2048, 768)
+    scale = min(1.0, long_limit / max(width, height), short_limit / min(width, height))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def pick_photo(sizes, detail: str = "auto"):
+    """Telegram хранит фото в нескольких разрешениях — берём наименьшее, которого хватает модели."""
+    largest = max(sizes, key=lambda s: s.width * s.height)
+    target_w, target_h = vision_size(largest.width, largest.height, detail)
+    for size in sorted(sizes, key=lambda s: s.width * s.height):
+        # ±1 пиксель на округление при масштабировании на стороне Telegram
+        if size.width >= target_w - 1 and size.height >= target_h - 1:
+            return size
+    return largest
+
+
+def document_kind(file_name: str | None, mime_type: str | None) -> str | None:
+    ext = os.path.splitext(file_name or "")[1].lower()
+    mime = (mime_type or "").lower()
+    if mime in IMAGE_TYPES:
+        return "image"
+    if ext == ".pdf" or mime == "application/pdf":
+        return "pdf"
+    if ext == ".docx" or mime == _DOCX_MIME:
+        return "docx"
+    if ext in TEXT_EXTENSIONS or mime.startswith("text/"):
+        return "text"
+    return None
+
+
+# --------------------
+# CPU-bound части — в пуле процессов
+# --------------------
+def prepare_image(data: bytes, detail: str = "auto", quality: int = 85) -> bytes:
+    """Уменьшение до vision_size и перекодирование в JPEG. Нужен Pillow."""
+    from PIL import Image
+
+    img = Image.open(io.BytesIO(data))
+    target = vision_size(img.width, img.height, detail)
+    # JPEG декодируется сразу в уменьшенном масштабе — быстрее и меньше памяти
+    img.draft("RGB", target)
+    resized = img.size != target
+    if img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+    if resized:
+        img = img.resize(target, Image.LANCZOS)
+    out = io.BytesIO()
+    img.save(out, "JPEG", quality=quality, optimize=True)
+    if not resized and len(out.getvalue()) >= len(data) and data[:3] == b"\xff\xd8\xff":
+        return data
+    return out.getvalue()
+
+
+def extract_document(data: bytes, kind: str, max_chars: int) -> str:
+    """Текст документа, не больше max_chars: разбор останавливается, как только лимит набран."""
+    if kind == "pdf":
+        return _pdf_text(data, max_chars)
+    if kind == "docx":
+        return _docx_text(data, max_chars)
+    if kind == "text":
+        return _decode(data[: max_chars * 4])[:max_chars]
+    raise UnsupportedFile(f"Формат {kind} не поддерживается")
+
+
+def _decode(data: bytes) -> str:
+    try:
+        return data.decode("utf-8-sig")
+    except UnicodeDecodeError as e:
+        # обрезали посреди многобайтного символа — это не повод уходить в cp1251
+        if e.start >= len(data) - 3:
+            return data[: e.start].decode("utf-8-sig")
+        return data.decode("cp1251", errors="replace")
+
+
+def _pdf_text(data: bytes, max_chars: int) -> str:
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        raise UnsupportedFile("Для PDF нужен пакет pypdf")
+    parts, used = [], 0
+    # постранично: длинный PDF не разбирается целиком, если начало уже заполнило лимит
+    for page in PdfReader(io.BytesIO(data)).pages:
+        text = page.extract_text() or ""
+        parts.append(text)
+        used += len(text)
+        if used >= max_chars:
+            break
+    return "\n".join(parts)[:max_chars]
+
+
+def _docx_text(data: bytes, max_chars: int) -> str:
+    """DOCX — zip с word/document.xml; читаем потоково через iterparse, без python-docx."""
+    import zipfile
+    from xml.etree import ElementTree
+
+    parts, para, used = [], [], 0
+    with zipfile.ZipFile(io.BytesIO(data)) as archive, archive.open("word/document.xml") as f:
+        for _, el in ElementTree.iterparse(f, events=("end",)):
+            if el.tag == _DOCX_NS + "t":
+                para.append(el.text or "")
+            elif el.tag == _DOCX_NS + "tab":
+                para.append("\t")
+            elif el.tag == _DOCX_NS + "p":
+                line = "".join(para)
+                para = []
+                el.clear()
+                parts.append(line)
+                used += len(line) + 1
+                if used >= max_chars:
+                    break
+    return "\n".join(parts)[:max_chars]
+
+
+def fit_to_budget(model: str, text: str, max_tokens: int, query: str = "") -> tuple[str, bool]:
+    """
+    (текст, обрезан ли) в пределах max_tokens. Если документ не влезает — фрагменты,
+    релевантные подписи к файлу, затем начало документа; порядок фрагментов сохраняется.
+    """
+    from .deep_search import chunk_text, rank_chunks
+
+    chunks = chunk_text(text)
+    costs = [count_tokens(model, c) for c in chunks]
+    if sum(costs) <= max_tokens:
+        return text, False
+
+    ranked = [int(i) for i, _ in rank_chunks(query, [(str(i), c) for i, c in enumerate(chunks)], len(text))] if query else []
+    picked, used = set(), 0
+    for i in ranked + list(range(len(chunks))):
+        if i in picked or used + costs[i] > max_tokens:
+            continue
+        picked.add(i)
+        used += costs[i]
+    return "\n[…]\n".join(chunks[i] for i in sorted(picked)), True
+
+
+class AttachmentPipeline:
+    """
+    Фото и документы для модели. Файл Telegram читается потоком в память с потолком размера,
+    картинки ужимаются до разрешения, больше которого vision-модель всё равно не смотрит,
+    текст PDF/DOCX/TXT извлекается до лимита и режется под бюджет токенов.
+    Разбор и перекодирование — в пуле процессов, результат кэшируется по file_unique_id:
+    повторно присланный файл не скачивается и не разбирается.
+    Pillow и pypdf необязательны: без Pillow фото берётся из готовых размеров Telegram.
+    http — общий клиент приложения, если передан.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = MAX_FILE_BYTES,
+        detail: str = "auto",
+        max_chars: int = 200_000,
+        workers: int = 2,
+        cache_size: int = 128,
+        cache_bytes: int = 64 * 1024 * 1024,
+        cache_ttl: float = 3600.0,
+        timeout: float = 30.0,
+        http: httpx.AsyncClient | None = None,
+    ):
+        self.max_bytes = max_bytes
+        self.detail = detail
+        self.max_chars = max_chars
+        self.workers = workers
+        self.timeout = timeout
+        # data: URL картинки — мегабайты base64, поэтому потолок и по суммарному размеру
+        self.cache = TTLCache(maxsize=cache_size, ttl=cache_ttl, max_weight=cache_bytes, weigh=len)
+        self.has_pillow = importlib.util.find_spec("PIL") is not None
+        self._pool = None
+        self._http = http
+        self._own_http = http is None
+
+    @property
+    def pool(self):
+        if self._pool is None:
+            from concurrent.futures import ProcessPoolExecutor
+
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self._pool
+
+    @property
+    def http(self) -> httpx.AsyncClient:
+        if self._http is None:
+            self._http = httpx.AsyncClient(timeout=self.timeout)
+        return self._http
+
+    async def close(self):
+        if self._http is not None and self._own_http:
+            await self._http.aclose()
+            self._http = None
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    # --------------------
+    # Скачивание
+    # --------------------
+    async def download(self, attachment) -> bytes:
+        """Photo/Document → bytes; больше max_bytes не читаем ни байта сверх лимита."""
+        if attachment.file_size and attachment.file_size > self.max_bytes:
+            raise FileTooLarge(self.max_bytes)
+        tg_file = await attachment.get_file()
+        path = tg_file.file_path or ""
+        if not path.startswith(("http://", "https://")):
+            # local Bot API server отдаёт путь на диске
+            buf = io.BytesIO()
+            await tg_file.download_to_memory(buf)
+            if buf.tell() > self.max_bytes:
+                raise FileTooLarge(self.max_bytes)
+            return buf.getvalue()
+
+        try:
+            async with self.http.stream("GET", path, timeout=self.timeout) as resp:
+                resp.raise_for_status()
+                if int(resp.headers.get("content-length") or 0) > self.max_bytes:
+                    raise FileTooLarge(self.max_bytes)
+                buf = bytearray()
+                async for chunk in resp.aiter_bytes():
+                    buf += chunk
+                    if len(buf) > self.max_bytes:
+                        raise FileTooLarge(self.max_bytes)
+        # текст ошибок httpx содержит URL с токеном бота — наружу только статус или тип ошибки
+        except httpx.HTTPStatusError as e:
+            raise DownloadFailed(f"Telegram не отдал файл (HTTP {e.response.status_code})") from None
+        except httpx.HTTPError as e:
+            raise DownloadFailed(f"Файл не скачался ({type(e).__name__})") from None
+        return bytes(buf)
+
+    # --------------------
+    # Картинки
+    # --------------------
+    async def image_url(self, attachment, mime_type: str = "image/jpeg") -> str:
+        """
+        data: URL для image_url в сообщении модели. attachment — список PhotoSize (фото)
+        или Document с картинкой; фото уже нужного размера, ужимать стоит только документы.
+        """
+        photo = isinstance(attachment, (list, tuple))
+        if photo:
+            attachment = pick_photo(attachment, self.detail)
+        key = ("image", attachment.file_unique_id, self.detail)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        data = await self.download(attachment)
+        if not photo and self.has_pillow:
+            loop = asyncio.get_running_loop()
+            data = await loop.run_in_executor(self.pool, prepare_image, data, self.detail)
+            mime_type = "image/jpeg"
+        url = f"data:{mime_type};base64,{base64.b64encode(data).decode()}"
+        self.cache.set(key, url)
+        return url
+
+    # --------------------
+    # Документы
+    # --------------------
+    async def document_text(self, document) -> str:
+        kind = document_kind(document.file_name, document.mime_type)
+        if kind in (None, "image"):
+            raise UnsupportedFile(f"Формат {document.mime_type or document.file_name} не поддерживается")
+        key = ("text", document.file_unique_id)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        data = await self.download(document)
+        loop = asyncio.get_running_loop()
+        text = (await loop.run_in_executor(self.pool, extract_document, data, kind, self.max_chars)).strip()
+        self.cache.set(key, text)
+        return text
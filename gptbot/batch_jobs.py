@@ -0,0 +1,255 @@
+# batch_jobs.py
+import asyncio
+import io
+import json
+import os
+import time
+import uuid
+from types import SimpleNamespace
+
+from . import metrics
+from .logger import setup_logger
+
+logger = setup_logger()
+
+ENDPOINT = "/v1/chat/completions"
+_DONE = {"completed"}
+_FAILED = {"failed", "expired", "cancelled"}
+
+
+class BatchQueue:
+    """
+    Фоновые задачи без требований к задержке (свёртка истории, прогрев кэша)
+    копятся и уходят одним JSONL через OpenAI Batch API — это примерно вдвое дешевле синхронных вызовов.
+    Результаты раздаются обработчикам по виду задачи (register), очередь и отправленные батчи
+    сохраняются в JSON-файле и переживают рестарт. Файл пишется в потоке, частые изменения
+    склеиваются в одну запись; save() при остановке дожидается последней.
+    Пока у бота есть живые запросы (busy()), отправка и разбор результатов откладываются.
+    """
+
+    def __init__(
+        self,
+        client,
+        state_path: str,
+        max_batch: int = 500,
+        flush_interval: float = 300.0,
+        poll_interval: float = 60.0,
+        completion_window: str = "24h",
+        busy=None,
+    ):
+        self.client = client
+        self.state_path = state_path
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.poll_interval = poll_interval
+        self.completion_window = completion_window
+        self.busy = busy or (lambda: False)
+        self.handlers: dict = {}
+        # ожидают отправки: [{"custom_id", "kind", "key", "body", "meta", "queued_at"}]
+        self.pending: list[dict] = []
+        # отправлены: batch_id -> {"submitted_at", "items": {custom_id: {"kind", "key", "meta"}}}
+        self.batches: dict[str, dict] = {}
+        self.completed = 0
+        self.failed = 0
+        self._dirty = False
+        self._saving: asyncio.Task | None = None
+        self._load()
+
+    def register(self, kind: str, handler):
+        """handler(meta: dict, content: str) — корутина, применяет результат к состоянию бота."""
+        self.handlers[kind] = handler
+
+    # --------------------
+    # Очередь
+    # --------------------
+    def in_flight(self, key: str) -> bool:
+        if any(item["key"] == key for item in self.pending):
+            return True
+        return any(item["key"] == key for b in self.batches.values() for item in b["items"].values())
+
+    def submit(self, kind: str, body: dict, meta: dict | None = None, key: str | None = None) -> bool:
+        """Ставит запрос chat.completions в очередь; задача с тем же key, которая ещё не выполнена, не дублируется."""
+        if key and self.in_flight(key):
+            return False
+        self.pending.append({
+            "custom_id": f"{kind}:{uuid.uuid4().hex}",
+            "kind": kind,
+            "key": key,
+            "body": body,
+            "meta": meta or {},
+            "queued_at": time.time(),
+        })
+        self._save_later()
+        return True
+
+    def due(self) -> bool:
+        if not self.pending:
+            return False
+        return len(self.pending) >= self.max_batch or time.time() - self.pending[0]["queued_at"] >= self.flush_interval
+
+    # --------------------
+    # Отправка и опрос
+    # --------------------
+    async def flush(self) -> str | None:
+        """Отправляет накопленное одним батчем; возвращает id батча."""
+        items, self.pending = self.pending[: self.max_batch], self.pending[self.max_batch:]
+        if not items:
+            return None
+        lines = [
+            json.dumps({"custom_id": it["custom_id"], "method": "POST", "url": ENDPOINT, "body": it["body"]}, ensure_ascii=False)
+            for it in items
+        ]
+        data = ("\n".join(lines) + "\n").encode()
+        try:
+            upload = await self.client.files.create(file=("batch.jsonl", data, "application/jsonl"), purpose="batch")
+            batch = await self.client.batches.create(
+                input_file_id=upload.id,
+                endpoint=ENDPOINT,
+                completion_window=self.completion_window,
+            )
+        except Exception:
+            logger.exception("batch: submit failed, %d items return to queue", len(items))
+            self.pending = items + self.pending
+            self._save_later()
+            return None
+
+        self.batches[batch.id] = {
+            "submitted_at": time.time(),
+            "items": {it["custom_id"]: {"kind": it["kind"], "key": it["key"], "meta": it["meta"]} for it in items},
+        }
+        self._save_later()
+        logger.info("batch: submitted %s with %d requests", batch.id, len(items))
+        return batch.id
+
+    async def poll(self):
+        for batch_id in list(self.batches):
+            try:
+                batch = await self.client.batches.retrieve(batch_id)
+            except Exception:
+                logger.exception("batch: retrieve %s failed", batch_id)
+                continue
+            if batch.status in _DONE:
+                await self._collect(batch_id, batch)
+            elif batch.status in _FAILED:
+                items = self.batches.pop(batch_id)["items"]
+                self.failed += len(items)
+                logger.warning("batch: %s %s, dropped %d requests", batch_id, batch.status, len(items))
+                self._save_later()
+
+    async def _collect(self, batch_id: str, batch):
+        items = self.batches[batch_id]["items"]
+        text = ""
+        if getattr(batch, "output_file_id", None):
+            content = await self.client.files.content(batch.output_file_id)
+            text = content.text if hasattr(content, "text") else content.read().decode()
+
+        for line in io.StringIO(text):
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            item = items.get(row.get("custom_id"))
+            response = row.get("response") or {}
+            if item is None:
+                continue
+            if row.get("error") or response.get("status_code") != 200:
+                self.failed += 1
+                logger.warning("batch: %s failed: %s", row.get("custom_id"), row.get("error") or response.get("status_code"))
+                continue
+            await self._apply(item, response.get("body") or {})
+
+        self.batches.pop(batch_id)
+        self._save_later()
+        logger.info("batch: %s done (%d requests)", batch_id, len(items))
+
+    async def _apply(self, item: dict, body: dict):
+        usage = body.get("usage")
+        if usage:
+            # свёртка истории — расход конкретного пользователя, прогрев кэша — общий
+            user_id = (item.get("meta") or {}).get("user_id", "batch")
+            metrics.record_usage(body.get("model", "-"), user_id, SimpleNamespace(**usage), batch=True)
+        handler = self.handlers.get(item["kind"])
+        if handler is None:
+            logger.warning("batch: no handler for %s", item["kind"])
+            return
+        try:
+            content = body["choices"][0]["message"]["content"] or ""
+            await handler(item["meta"], content)
+            self.completed += 1
+        except Exception:
+            self.failed += 1
+            logger.exception("batch: handler %s failed", item["kind"])
+
+    # --------------------
+    # Фоновый цикл
+    # --------------------
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            if self.busy():
+                continue
+            try:
+                if self.due():
+                    await self.flush()
+                if self.batches:
+                    await self.poll()
+            except Exception:
+                logger.exception("batch: background loop error")
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self.pending),
+            "batches": len(self.batches),
+            "in_batches": sum(len(b["items"]) for b in self.batches.values()),
+            "completed": self.completed,
+            "failed": self.failed,
+        }
+
+    # --------------------
+    # Состояние на диске
+    # --------------------
+    def _load(self):
+        try:
+            with open(self.state_path, encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return
+        self.pending = state.get("pending", [])
+        self.batches = state.get("batches", {})
+
+    def _save_later(self):
+        """Состояние изменилось: запись уходит в поток, пока она идёт — новые изменения ждут следующей."""
+        self._dirty = True
+        if self._saving is not None and not self._saving.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._dirty = False
+            self._write(self._snapshot())
+            return
+        self._saving = loop.create_task(self._save_dirty())
+
+    async def _save_dirty(self):
+        while self._dirty:
+            self._dirty = False
+            try:
+                await asyncio.to_thread(self._write, self._snapshot())
+            except OSError:
+                logger.exception("batch: state save failed")
+
+    async def save(self):
+        """Дожидается записи всех изменений (вызывать при остановке)."""
+        if self._saving is not None:
+            await self._saving
+        if self._dirty:
+            await self._save_dirty()
+
+    def _snapshot(self) -> dict:
+        # копии снимаются в event loop: поток пишет их, пока очередь продолжает меняться
+        return {"pending": list(self.pending), "batches": dict(self.batches)}
+
+    def _write(self, state: dict):
+        tmp = self.state_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp, self.state_path)
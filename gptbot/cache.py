@@ -0,0 +1,69 @@
+# cache.py
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    Простой LRU-кэш с временем жизни записей.
+    Не потокобезопасен — рассчитан на использование из одного event loop.
+    max_weight и weigh(value) — дополнительный потолок по суммарному «весу» (например, байтам):
+    старые записи вытесняются, пока сумма не уложится; запись тяжелее потолка не кэшируется.
+    """
+
+    def __init__(self, maxsize: int = 256, ttl: float = 600.0, max_weight: int | None = None, weigh=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_weight = max_weight
+        self.weigh = weigh if weigh is not None else (lambda value: 0)
+        self.weight = 0
+        self._data: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        item = self._data.get(key, _MISSING)
+        if item is _MISSING:
+            self.misses += 1
+            return default
+        expires_at, value, _ = item
+        if expires_at < time.monotonic():
+            self._drop(key)
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value, ttl: float | None = None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        weight = self.weigh(value)
+        self._drop(key)
+        self._data[key] = (expires_at, value, weight)
+        self.weight += weight
+        while len(self._data) > self.maxsize or (self.max_weight is not None and self.weight > self.max_weight):
+            self._drop(next(iter(self._data)))
+
+    def pop(self, key, default=None):
+        item = self._drop(key)
+        return default if item is _MISSING else item[1]
+
+    def _drop(self, key):
+        item = self._data.pop(key, _MISSING)
+        if item is not _MISSING:
+            self.weight -= item[2]
+        return item
+
+    def clear(self):
+        self._data.clear()
+        self.weight = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
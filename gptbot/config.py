@@ -0,0 +1,282 @@
+# config.py
+import os
+from dataclasses import dataclass, field
+
+# корень проекта: базы, лог и кэш страниц по умолчанию лежат рядом с gpt_bot.py
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# списки доступа по умолчанию; ACCESS_CONFIG переопределяет их с перечитыванием на лету
+ADMINS = {1091992386, 1687504544}
+LIMITED_USERS = {111111111, 222222222, 333333333}
+CHAT_ID = -1001785925671
+BOT_USERNAME = "DunaevAssistentBot"
+
+_TRUE = ("1", "true", "yes")
+
+
+def _flag(env, name: str, default: str = "0") -> bool:
+    return env.get(name, default).lower() in _TRUE
+
+
+def _float_or_none(env, name: str) -> float | None:
+    value = env.get(name)
+    return float(value) if value else None
+
+
+def _path(env, name: str, default: str) -> str:
+    return env.get(name, os.path.join(BASE_DIR, default))
+
+
+def _ids(env, name: str, default: set) -> set:
+    """ADMINS="1,2,3" — множество id; пусто или не задано — значения по умолчанию."""
+    value = env.get(name)
+    if not value:
+        return set(default)
+    return {int(part) for part in value.replace(";", ",").split(",") if part.strip()}
+
+
+@dataclass
+class Config:
+    """
+    Настройки бота из переменных окружения (и .env). Читаются один раз — в Config.from_env;
+    дальше подсистемы получают значения отсюда, а не из os.getenv.
+    """
+
+    telegram_token: str
+    openai_api_key: str
+    # имя тенанта (TENANTS_CONFIG): метка метрик и префикс в логах; у одиночного бота пусто
+    name: str = ""
+    default_model: str = "gpt-3.5-turbo"
+    decision_model: str = "gpt-4o-mini"
+    openai_base_url: str | None = None
+    telegram_api_base_url: str | None = None
+    telegram_file_base_url: str | None = None
+
+    # LLM
+    llm_timeout: float = 60.0
+    llm_max_concurrency: int = 8
+    llm_retries: int = 2
+    llm_backoff: float = 0.5
+    llm_hedge_percentile: float = 0.0
+    llm_fallbacks: str = ""
+    llm_fallback_api_key: str | None = None
+
+    # учёт расходов
+    ledger_db: str = os.path.join(BASE_DIR, "usage.sqlite3")
+    ledger_prices: str | None = None
+    budget_soft_limit: float | None = None
+    budget_hard_limit: float | None = None
+    budget_user_soft_limit: float | None = None
+    budget_user_hard_limit: float | None = None
+    # как часто воркер досчитывает расход соседей из общей базы (только при WORKERS > 1)
+    ledger_refresh: float = 2.0
+
+    # маршрутизация моделей
+    model_routing: bool = False
+    router_cheap_model: str | None = None
+    router_strong_model: str | None = None
+    router_decision: bool = True
+    router_short_chars: int = 200
+    router_long_chars: int = 1200
+
+    # история и контекст
+    history_db: str = os.path.join(BASE_DIR, "history.sqlite3")
+    history_max_turns: int = 40
+    history_max_users: int = 1000
+    context_token_budget: int = 3000
+    context_summary: bool = False
+
+    # доступ и общее состояние
+    state_db: str = os.path.join(BASE_DIR, "state.sqlite3")
+    access_config: str | None = None
+    admins: set = field(default_factory=lambda: set(ADMINS))
+    limited_users: set = field(default_factory=lambda: set(LIMITED_USERS))
+    chat_id: int = CHAT_ID
+    bot_username: str = BOT_USERNAME
+    shard_index: int | None = None
+
+    # планировщик
+    scheduler_max_concurrency: int = 8
+    user_rate: float = 12 / 60
+    user_burst: float = 3.0
+    limited_rate: float = 3 / 60
+    limited_burst: float = 1.0
+    update_concurrency: int = 16
+    update_checkpoint: str = os.path.join(BASE_DIR, "pending_updates")
+
+    # поиск
+    google_cse_api_key: str | None = None
+    google_cse_cx: str | None = None
+    google_cse_url: str | None = None
+    search_cache_size: int = 512
+    search_cache_ttl: float = 600.0
+    search_speculative: bool = False
+    deep_search: bool = False
+    page_cache_dir: str = os.path.join(BASE_DIR, "page_cache")
+    deep_search_top_k: int = 3
+    deep_search_bytes: int = 1_500_000
+    deep_search_timeout: float = 8.0
+    deep_search_workers: int = 2
+
+    # кэш ответов и батчи
+    response_cache: bool = False
+    response_cache_ttl: float = 3600.0
+    response_cache_web_ttl: float = 600.0
+    response_cache_embeddings: str | None = None
+    response_cache_similarity: float = 0.93
+    batch_jobs: bool = False
+    batch_state: str = os.path.join(BASE_DIR, "batch_state.json")
+    batch_max_size: int = 500
+    batch_flush_interval: float = 300.0
+    batch_poll_interval: float = 60.0
+    cache_warmup_file: str = ""
+
+    # голос, файлы, ответы
+    voice_transcode: bool = False
+    voice_workers: int = 2
+    file_max_bytes: int = 20 * 1024 * 1024
+    image_detail: str = "auto"
+    attachment_workers: int = 2
+    attachment_cache_bytes: int = 64 * 1024 * 1024
+    vision_model: str = "gpt-4o-mini"
+    document_token_budget: int | None = None
+    stream_replies: bool = False
+    stream_edit_interval: float = 1.0
+
+    # запуск процесса
+    run_mode: str = "polling"
+    workers: int = 1
+    webhook_listen: str = "0.0.0.0"
+    webhook_port: int = 8443
+    webhook_path: str = "/telegram"
+    webhook_secret: str | None = None
+    # полный адрес для setWebhook: WEBHOOK_URL + WEBHOOK_PATH
+    webhook_url: str = "/telegram"
+    metrics_host: str = "127.0.0.1"
+    metrics_port: int = 0
+    # сколько секунд при остановке ждать хендлеры в работе (меньше, чем даёт оркестратор до SIGKILL)
+    shutdown_grace: float = 25.0
+
+    @staticmethod
+    def tenants_config(env=None) -> str | None:
+        """TENANTS_CONFIG читается до Config: у процесса с тенантами своего TELEGRAM_TOKEN может не быть."""
+        if env is None:
+            from dotenv import load_dotenv
+
+            load_dotenv()
+            env = os.environ
+        return env.get("TENANTS_CONFIG") or None
+
+    @classmethod
+    def from_env(cls, env=None) -> "Config":
+        """env — словарь переменных; по умолчанию os.environ после load_dotenv()."""
+        if env is None:
+            from dotenv import load_dotenv
+
+            load_dotenv()
+            env = os.environ
+        token = env.get("TELEGRAM_TOKEN")
+        api_key = env.get("OPENAI_API_KEY")
+        if not token or not api_key:
+            raise RuntimeError("TELEGRAM_TOKEN или OPENAI_API_KEY не заданы в .env")
+
+        default_model = env.get("OPENAI_MODEL", "gpt-3.5-turbo")
+        decision_model = env.get("DECISION_MODEL", "gpt-4o-mini")
+        shard = env.get("SHARD_INDEX")
+        webhook_path = env.get("WEBHOOK_PATH", "/telegram")
+        return cls(
+            telegram_token=token,
+            openai_api_key=api_key,
+            name=env.get("TENANT_NAME", ""),
+            default_model=default_model,
+            decision_model=decision_model,
+            openai_base_url=env.get("OPENAI_BASE_URL") or None,
+            telegram_api_base_url=env.get("TELEGRAM_API_BASE_URL") or None,
+            telegram_file_base_url=env.get("TELEGRAM_FILE_BASE_URL") or None,
+            llm_timeout=float(env.get("LLM_TIMEOUT", "60")),
+            llm_max_concurrency=int(env.get("LLM_MAX_CONCURRENCY", "8")),
+            llm_retries=int(env.get("LLM_RETRIES", "2")),
+            llm_backoff=float(env.get("LLM_BACKOFF", "0.5")),
+            llm_hedge_percentile=float(env.get("LLM_HEDGE_PERCENTILE", "0")),
+            llm_fallbacks=env.get("LLM_FALLBACKS", ""),
+            llm_fallback_api_key=env.get("LLM_FALLBACK_API_KEY") or None,
+            ledger_db=_path(env, "LEDGER_DB", "usage.sqlite3"),
+            ledger_prices=env.get("LEDGER_PRICES") or None,
+            budget_soft_limit=_float_or_none(env, "BUDGET_SOFT_LIMIT"),
+            budget_hard_limit=_float_or_none(env, "BUDGET_HARD_LIMIT"),
+            budget_user_soft_limit=_float_or_none(env, "BUDGET_USER_SOFT_LIMIT"),
+            budget_user_hard_limit=_float_or_none(env, "BUDGET_USER_HARD_LIMIT"),
+            ledger_refresh=float(env.get("LEDGER_REFRESH", "2")),
+            model_routing=_flag(env, "MODEL_ROUTING"),
+            router_cheap_model=env.get("ROUTER_CHEAP_MODEL", decision_model),
+            router_strong_model=env.get("ROUTER_STRONG_MODEL", default_model),
+            router_decision=_flag(env, "ROUTER_DECISION", "1"),
+            router_short_chars=int(env.get("ROUTER_SHORT_CHARS", "200")),
+            router_long_chars=int(env.get("ROUTER_LONG_CHARS", "1200")),
+            history_db=_path(env, "HISTORY_DB", "history.sqlite3"),
+            history_max_turns=int(env.get("HISTORY_MAX_TURNS", "40")),
+            history_max_users=int(env.get("HISTORY_MAX_USERS", "1000")),
+            context_token_budget=int(env.get("CONTEXT_TOKEN_BUDGET", "3000")),
+            context_summary=_flag(env, "CONTEXT_SUMMARY"),
+            state_db=_path(env, "STATE_DB", "state.sqlite3"),
+            access_config=env.get("ACCESS_CONFIG") or None,
+            admins=_ids(env, "ADMINS", ADMINS),
+            limited_users=_ids(env, "LIMITED_USERS", LIMITED_USERS),
+            chat_id=int(env.get("CHAT_ID") or CHAT_ID),
+            bot_username=env.get("BOT_USERNAME") or BOT_USERNAME,
+            shard_index=int(shard) if shard else None,
+            scheduler_max_concurrency=int(env.get("SCHEDULER_MAX_CONCURRENCY", "8")),
+            user_rate=float(env.get("USER_RATE_PER_MIN", "12")) / 60,
+            user_burst=float(env.get("USER_BURST", "3")),
+            limited_rate=float(env.get("LIMITED_RATE_PER_MIN", "3")) / 60,
+            limited_burst=float(env.get("LIMITED_BURST", "1")),
+            update_concurrency=int(env.get("UPDATE_CONCURRENCY", "16")),
+            update_checkpoint=_path(env, "UPDATE_CHECKPOINT", "pending_updates"),
+            google_cse_api_key=env.get("GOOGLE_CSE_API_KEY") or env.get("GOOGLE_API_KEY"),
+            google_cse_cx=env.get("GOOGLE_CSE_CX") or env.get("GOOGLE_CSE_ID"),
+            google_cse_url=env.get("GOOGLE_CSE_URL") or None,
+            search_cache_size=int(env.get("SEARCH_CACHE_SIZE", "512")),
+            search_cache_ttl=float(env.get("SEARCH_CACHE_TTL", "600")),
+            search_speculative=_flag(env, "SEARCH_SPECULATIVE"),
+            deep_search=_flag(env, "DEEP_SEARCH"),
+            page_cache_dir=_path(env, "PAGE_CACHE_DIR", "page_cache"),
+            deep_search_top_k=int(env.get("DEEP_SEARCH_TOP_K", "3")),
+            deep_search_bytes=int(env.get("DEEP_SEARCH_BYTES", "1500000")),
+            deep_search_timeout=float(env.get("DEEP_SEARCH_TIMEOUT", "8")),
+            deep_search_workers=int(env.get("DEEP_SEARCH_WORKERS", "2")),
+            response_cache=_flag(env, "RESPONSE_CACHE"),
+            response_cache_ttl=float(env.get("RESPONSE_CACHE_TTL", "3600")),
+            response_cache_web_ttl=float(env.get("RESPONSE_CACHE_WEB_TTL", "600")),
+            response_cache_embeddings=env.get("RESPONSE_CACHE_EMBEDDINGS") or None,
+            response_cache_similarity=float(env.get("RESPONSE_CACHE_SIMILARITY", "0.93")),
+            batch_jobs=_flag(env, "BATCH_JOBS"),
+            batch_state=_path(env, "BATCH_STATE", "batch_state.json"),
+            batch_max_size=int(env.get("BATCH_MAX_SIZE", "500")),
+            batch_flush_interval=float(env.get("BATCH_FLUSH_INTERVAL", "300")),
+            batch_poll_interval=float(env.get("BATCH_POLL_INTERVAL", "60")),
+            cache_warmup_file=env.get("CACHE_WARMUP_FILE", ""),
+            voice_transcode=_flag(env, "VOICE_TRANSCODE"),
+            voice_workers=int(env.get("VOICE_WORKERS", "2")),
+            file_max_bytes=int(float(env.get("FILE_MAX_MB", "20")) * 1024 * 1024),
+            image_detail=env.get("IMAGE_DETAIL", "auto"),
+            attachment_workers=int(env.get("ATTACHMENT_WORKERS", "2")),
+            attachment_cache_bytes=int(float(env.get("ATTACHMENT_CACHE_MB", "64")) * 1024 * 1024),
+            vision_model=env.get("VISION_MODEL", "gpt-4o-mini"),
+            document_token_budget=int(env["DOCUMENT_TOKEN_BUDGET"]) if env.get("DOCUMENT_TOKEN_BUDGET") else None,
+            stream_replies=_flag(env, "STREAM_REPLIES"),
+            stream_edit_interval=float(env.get("STREAM_EDIT_INTERVAL", "1.0")),
+            run_mode=env.get("RUN_MODE", "polling").lower(),
+            # WEBHOOK_WORKERS — старое имя
+            workers=int(env.get("WORKERS") or env.get("WEBHOOK_WORKERS") or "1"),
+            webhook_listen=env.get("WEBHOOK_LISTEN", "0.0.0.0"),
+            webhook_port=int(env.get("WEBHOOK_PORT", "8443")),
+            webhook_path=webhook_path,
+            webhook_secret=env.get("WEBHOOK_SECRET") or None,
+            webhook_url=env.get("WEBHOOK_URL", "").rstrip("/") + webhook_path,
+            metrics_host=env.get("METRICS_HOST", "127.0.0.1"),
+            metrics_port=int(env.get("METRICS_PORT", "0")),
+            shutdown_grace=float(env.get("SHUTDOWN_GRACE", "25")),
+        )
+
+    def shard_suffix(self) -> str:
+        return f"-{self.shard_index}" if self.shard_index is not None else ""
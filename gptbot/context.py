@@ -0,0 +1,354 @@
+# context.py
+import asyncio
+import contextvars
+
+from telegram import Update
+
+from . import metrics
+from .admission import Admission
+from .attachments import AttachmentPipeline
+from .config import Config
+from .context_window import ContextBuilder
+from .history import HistoryStore
+from .ledger import UsageLedger, load_prices
+from .llm import AsyncLLM, LazyClient, parse_fallbacks
+from .logger import setup_logger
+from .response_cache import ResponseCache
+from .router import Router
+from .scheduler import Scheduler
+from .search import CSE_URL, SearchEngine
+from .shared_state import SharedState
+from .voice import VoicePipeline
+
+logger = setup_logger()
+
+# AppContext, чьи апдейты обрабатываются в текущей задаче: по нему расход токенов
+# попадает в ledger своего тенанта (задачи Application наследуют значение при создании)
+active = contextvars.ContextVar("app_context", default=None)
+
+
+def openai_client(api_key: str, base_url: str | None, timeout: float) -> LazyClient:
+    """AsyncOpenAI при первом запросе, а не на старте: импорт openai стоит дороже всего остального."""
+
+    def create():
+        from openai import AsyncOpenAI
+
+        # повторы делает AsyncLLM (с джиттером и фолбэком), встроенные повторы SDK выключены
+        return AsyncOpenAI(api_key=api_key, base_url=base_url, timeout=timeout, max_retries=0)
+
+    return LazyClient(create)
+
+
+def http_client() -> LazyClient:
+    """Один пул соединений на все исходящие запросы, кроме OpenAI: CSE, страницы deep search, файлы Telegram."""
+
+    def create():
+        import httpx
+
+        return httpx.AsyncClient(
+            timeout=15.0,
+            limits=httpx.Limits(max_connections=50, max_keepalive_connections=20),
+        )
+
+    return LazyClient(create)
+
+
+def credentials(config: Config) -> tuple:
+    """Учётные данные внешних API: тенанты делят SharedClients, только если они совпадают."""
+    return (
+        config.openai_api_key,
+        config.openai_base_url,
+        config.llm_fallback_api_key,
+        config.llm_fallbacks,
+        config.google_cse_api_key,
+        config.google_cse_cx,
+        config.google_cse_url,
+    )
+
+
+class SharedClients:
+    """
+    То, что тенанты одного процесса делят между собой: клиент OpenAI с его пулом соединений
+    и общим потолком запросов, пул HTTP, поиск с кэшем CSE, пулы процессов голоса и файлов.
+    Настройки берутся из конфига, с которым объект создан; тенанты с другими credentials()
+    получают свой SharedClients. name — метка gauges, когда таких наборов в процессе несколько.
+    """
+
+    def __init__(self, config: Config, name: str = ""):
+        self.http = http_client()
+
+        self.client = openai_client(config.openai_api_key, config.openai_base_url, config.llm_timeout)
+        fallback_key = config.llm_fallback_api_key or config.openai_api_key
+        # потолок одновременных запросов к OpenAI на весь процесс
+        self.llm = AsyncLLM(
+            self.client,
+            max_concurrency=config.llm_max_concurrency,
+            timeout=config.llm_timeout,
+            retries=config.llm_retries,
+            backoff=config.llm_backoff,
+            hedge_percentile=config.llm_hedge_percentile,
+            # LLM_FALLBACKS="gpt-4o-mini,llama3@http://localhost:11434/v1" — по порядку, после основной модели
+            fallbacks=parse_fallbacks(
+                config.llm_fallbacks,
+                lambda base_url: openai_client(fallback_key, base_url, config.llm_timeout),
+            ),
+        )
+
+        self.search = SearchEngine(
+            config.google_cse_api_key,
+            config.google_cse_cx,
+            cache_size=config.search_cache_size,
+            cache_ttl=config.search_cache_ttl,
+            speculative=config.search_speculative,
+            base_url=config.google_cse_url or CSE_URL,
+            http=self.http,
+        )
+
+        # deep search: текст top-K страниц в промпт саммари (по умолчанию выключен)
+        self.deep_search = None
+        if config.deep_search:
+            from .deep_search import DeepSearch
+
+            self.deep_search = DeepSearch(
+                config.page_cache_dir,
+                top_k=config.deep_search_top_k,
+                byte_budget=config.deep_search_bytes,
+                total_timeout=config.deep_search_timeout,
+                workers=config.deep_search_workers,
+                http=self.http,
+            )
+
+        # OGG/Opus уходит в whisper напрямую; VOICE_TRANSCODE=1 — WAV через пул процессов
+        self.voice = VoicePipeline(self.llm, transcode=config.voice_transcode, workers=config.voice_workers)
+
+        # фото и документы: потоковое скачивание с потолком, ужатие картинок и разбор текста — в пуле процессов
+        self.attachments = AttachmentPipeline(
+            max_bytes=config.file_max_bytes,
+            detail=config.image_detail,
+            workers=config.attachment_workers,
+            cache_bytes=config.attachment_cache_bytes,
+            http=self.http,
+        )
+
+        labels = {"clients": name} if name else {}
+        gauge = metrics.REGISTRY.gauge
+        gauge("gptbot_search_cache_hit_ratio", "Доля попаданий кэша CSE", lambda: self.search.cache.hit_rate, **labels)
+        gauge(
+            "gptbot_search_p95_seconds", "p95 задержки поиска",
+            lambda: self.search.stats()["p95_latency"], **labels,
+        )
+
+    async def shutdown(self):
+        await self.search.close()
+        if self.deep_search:
+            await self.deep_search.close()
+        await self.attachments.close()
+        if self.http.loaded:
+            await self.http.aclose()
+
+    def close(self):
+        self.voice.close()
+
+
+class AppContext:
+    """
+    Всё состояние бота в одном объекте: конфиг, клиент OpenAI, общий пул HTTP-соединений,
+    хранилища и подсистемы. Собирается из Config один раз на процесс (или шард)
+    и передаётся хендлерам явно (handlers.bind) — модульных глобалов нет.
+    shared — клиенты, общие для нескольких ботов процесса (tenants); без него AppContext
+    создаёт свои. Бюджеты, история, доступ и лимиты у каждого AppContext свои.
+    Закрытие в два шага: shutdown() — внутри event loop (сеть, сброс на диск), close() — после него.
+    """
+
+    def __init__(self, config: Config, shared: SharedClients | None = None):
+        self.config = config
+        self.owns_shared = shared is None
+        self.shared = shared or SharedClients(config)
+        self.http = self.shared.http
+        self.client = self.shared.client
+        self.llm = self.shared.llm
+        self.search = self.shared.search
+        self.deep_search = self.shared.deep_search
+        self.voice = self.shared.voice
+        self.attachments = self.shared.attachments
+
+        # учёт расходов: токены × цены моделей, агрегаты месяца в памяти, лимиты по желанию
+        self.ledger = UsageLedger(
+            config.ledger_db,
+            prices=load_prices(config.ledger_prices),
+            soft_limit=config.budget_soft_limit,
+            hard_limit=config.budget_hard_limit,
+            user_soft_limit=config.budget_user_soft_limit,
+            user_hard_limit=config.budget_user_hard_limit,
+            # у шардов база расходов одна на всех: лимиты сверяются с суммой по всем воркерам
+            refresh_interval=config.ledger_refresh if config.shard_index is not None else None,
+        )
+        metrics.add_usage_hook(self.record_spend)
+
+        # режимы пользователей, модели чатов и лимиты — в общей базе:
+        # их видят все воркеры (WORKERS > 1) и они переживают рестарт
+        self.state = SharedState(config.state_db)
+        self.user_modes = self.state.modes
+
+        # маршрутизация: модель по чату (/model) или автоматически — дешёвая для простых, сильная для сложных
+        self.router = Router(
+            self.llm,
+            config.default_model,
+            cheap_model=config.router_cheap_model or config.decision_model,
+            strong_model=config.router_strong_model or config.default_model,
+            decision_model=config.decision_model if config.router_decision else None,
+            enabled=config.model_routing,
+            short_chars=config.router_short_chars,
+            long_chars=config.router_long_chars,
+            # у шардов участники группы обслуживаются разными воркерами — /model группы держим в общей базе
+            overrides=self.state.chat_models if config.shard_index is not None else None,
+        )
+
+        # история переживает рестарт: SQLite (WAL) + LRU в памяти
+        self.history = HistoryStore(
+            config.history_db,
+            max_turns=config.history_max_turns,
+            max_users_in_memory=config.history_max_users,
+        )
+
+        # контекст режется по токенам, а не по числу сообщений;
+        # вытесненные ходы по желанию сворачиваются в summary дешёвой моделью
+        self.context_builder = ContextBuilder(
+            budget_tokens=config.context_token_budget,
+            summary_model=config.decision_model if config.context_summary else None,
+            llm=self.llm,
+        )
+
+        # допуск до хендлеров: админы в личке, в группе — упоминание или ответ боту
+        self.admission = Admission(
+            config.admins,
+            config.chat_id,
+            config.bot_username,
+            limited=config.limited_users,
+            config_path=config.access_config,
+            on_reload=self.apply_access,
+        )
+
+        # честная очередь и лимиты перед каждым походом в OpenAI / Google
+        self.scheduler = Scheduler(
+            max_concurrency=config.scheduler_max_concurrency,
+            user_rate=config.user_rate,
+            user_burst=config.user_burst,
+            limited_rate=config.limited_rate,
+            limited_burst=config.limited_burst,
+            admins=self.admission.admins,
+            limited=self.admission.limited,
+            # в одном процессе bucket'ы в памяти; шарды делят их через SQLite — лимит на пользователя, а не на воркер
+            buckets=self.state.bucket if config.shard_index is not None else None,
+        )
+
+        # кэш ответов на повторяющиеся вопросы (по умолчанию выключен)
+        self.response_cache = ResponseCache(
+            enabled=config.response_cache,
+            chat_ttl=config.response_cache_ttl,
+            web_ttl=config.response_cache_web_ttl,
+            llm=self.llm,
+            embedding_model=config.response_cache_embeddings,
+            similarity=config.response_cache_similarity,
+        )
+
+        # фоновые задачи (свёртка истории, прогрев кэша) через Batch API — по умолчанию выключено
+        self.batch_queue = None
+        if config.batch_jobs:
+            self._init_batch_queue()
+
+        # доля бюджета контекста под текст документа; остальное — подпись и история
+        self.document_token_budget = config.document_token_budget or self.context_builder.budget_tokens * 2 // 3
+
+        self._register_gauges()
+
+    def _init_batch_queue(self):
+        from .batch_jobs import BatchQueue
+
+        scheduler = self.scheduler
+        self.batch_queue = BatchQueue(
+            self.client,
+            self.config.batch_state + self.config.shard_suffix(),
+            max_batch=self.config.batch_max_size,
+            flush_interval=self.config.batch_flush_interval,
+            poll_interval=self.config.batch_poll_interval,
+            # интерактивные запросы важнее: пока они идут, батчи ждут
+            busy=lambda: scheduler.active > 0 or scheduler.queue_depth > 0,
+        )
+        self.context_builder.batch = self.batch_queue
+
+        async def apply_fold(meta, content):
+            await self.context_builder.apply_summary(self.history, meta["user_id"], meta["dropped"], content)
+
+        async def apply_warm(meta, content):
+            await self.response_cache.store(meta["model"], meta["prompt"], content)
+
+        self.batch_queue.register("fold", apply_fold)
+        self.batch_queue.register("warm", apply_warm)
+
+    def _gauge_labels(self) -> dict:
+        return {"tenant": self.config.name} if self.config.name else {}
+
+    def _register_gauges(self):
+        # gauges для /metrics читаются в момент скрейпа; у тенантов — серия с меткой tenant
+        labels = self._gauge_labels()
+        gauge = metrics.REGISTRY.gauge
+        gauge("gptbot_queue_depth", "Запросов в очереди планировщика", lambda: self.scheduler.queue_depth, **labels)
+        gauge("gptbot_inflight_requests", "Запросов в работе", lambda: self.scheduler.active, **labels)
+        gauge("gptbot_response_cache_hits", "Попадания кэша ответов", lambda: self.response_cache.hits, **labels)
+        gauge(
+            "gptbot_response_cache_tokens_saved", "Сэкономленные токены",
+            lambda: self.response_cache.tokens_saved, **labels,
+        )
+        gauge("gptbot_updates_dropped", "Апдейты, отсеянные до хендлеров", lambda: self.admission.dropped, **labels)
+        gauge("gptbot_spend_usd", "Расходы OpenAI API за текущий месяц", lambda: self.ledger.total, **labels)
+
+    # --------------------
+    # Доступ и учёт
+    # --------------------
+    def is_admin(self, user_id: int) -> bool:
+        return self.admission.is_admin(user_id)
+
+    def is_allowed(self, update: Update) -> bool:
+        """
+        Повторная проверка в хендлере. Основной отсев — admission.admit до диспетчеризации,
+        поэтому здесь нет логирования: сюда доходят только адресованные боту апдейты.
+        """
+        return self.admission.allows(update.effective_user, update.effective_chat, update.message)
+
+    def apply_access(self, access: Admission):
+        """ACCESS_CONFIG перечитан — админы и ограниченные пользователи обновляются и в планировщике."""
+        scheduler = getattr(self, "scheduler", None)
+        if scheduler is not None:
+            scheduler.set_access(access.admins, access.limited)
+
+    def record_spend(self, model, user_id, usage, batch=False):
+        # хук общий на процесс: расход пишет только тенант, чей апдейт (или батч) сейчас обрабатывается
+        owner = active.get()
+        if owner is not None and owner is not self:
+            return
+        self.ledger.record(model, user_id, usage, batch=batch)
+
+    @property
+    def cse_enabled(self) -> bool:
+        return bool(self.config.google_cse_api_key and self.config.google_cse_cx)
+
+    # --------------------
+    # Остановка
+    # --------------------
+    async def shutdown(self):
+        """Внутри event loop: закрыть сетевые клиенты и пулы (если они свои), всё отложенное — на диск."""
+        if self.owns_shared:
+            await self.shared.shutdown()
+        await asyncio.to_thread(self.history.flush)
+        await asyncio.to_thread(self.ledger.flush)
+        if self.batch_queue:
+            await self.batch_queue.save()
+
+    def close(self):
+        metrics.remove_usage_hook(self.record_spend)
+        self.history.close()
+        self.ledger.close()
+        self.state.close()
+        if self.owns_shared:
+            self.shared.close()
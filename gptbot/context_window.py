@@ -0,0 +1,148 @@
+# context_window.py
+from functools import lru_cache
+
+from . import metrics
+from .logger import setup_logger
+
+logger = setup_logger()
+
+# служебные токены на одно сообщение в chat-формате (роль, разделители)
+MESSAGE_OVERHEAD = 4
+TRUNCATED_MARK = "\n[…текст обрезан…]"
+SUMMARY_PREFIX = "Краткое содержание предыдущего диалога: "
+
+
+@lru_cache(maxsize=32)
+def get_encoder(model: str):
+    """
+    Токенизатор под модель (tiktoken, если установлен). Кэшируется — загрузка BPE дорогая.
+    Без tiktoken возвращает None, и считаем токены приближённо.
+    """
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+
+
+@lru_cache(maxsize=8192)
+def count_tokens(model: str, text: str) -> int:
+    """Число токенов в тексте; мемоизируется, т.к. одна и та же история считается на каждый запрос."""
+    enc = get_encoder(model)
+    if enc is None:
+        # грубая оценка: ~3 символа на токен для смеси кириллицы и латиницы
+        return max(1, len(text) // 3)
+    return len(enc.encode(text))
+
+
+def message_tokens(model: str, message: dict) -> int:
+    return count_tokens(model, message.get("content") or "") + MESSAGE_OVERHEAD
+
+
+def truncate_to_tokens(model: str, text: str, max_tokens: int) -> str:
+    if count_tokens(model, text) <= max_tokens:
+        return text
+    enc = get_encoder(model)
+    if enc is None:
+        return text[: max_tokens * 3] + TRUNCATED_MARK
+    return enc.decode(enc.encode(text)[:max_tokens]) + TRUNCATED_MARK
+
+
+class ContextBuilder:
+    """
+    Собирает контекст запроса в пределах бюджета токенов:
+    сначала новое сообщение, затем самые свежие ходы истории, пока влезают.
+    """
+
+    def __init__(self, budget_tokens: int = 3000, summary_model: str | None = None, llm=None, batch=None):
+        self.budget_tokens = budget_tokens
+        self.summary_model = summary_model
+        self.llm = llm
+        # BatchQueue: свёртка уходит в Batch API вместо синхронного вызова
+        self.batch = batch
+
+    def build(self, model: str, history: list[dict], user_input: str, prefix: list[dict] | None = None):
+        """
+        Возвращает (messages, dropped): сообщения для API и ходы истории, не влезшие в бюджет.
+        Слишком длинное сообщение пользователя обрезается, чтобы не упереться в лимит контекста.
+        """
+        prefix = list(prefix or [])
+        budget = self.budget_tokens - sum(message_tokens(model, m) for m in prefix)
+
+        user_text = truncate_to_tokens(model, user_input, max(1, budget - MESSAGE_OVERHEAD))
+        user_msg = {"role": "user", "content": user_text}
+        budget -= message_tokens(model, user_msg)
+
+        kept = []
+        cut = len(history)
+        for i in range(len(history) - 1, -1, -1):
+            cost = message_tokens(model, history[i])
+            if cost > budget:
+                break
+            budget -= cost
+            kept.append(history[i])
+            cut = i
+        kept.reverse()
+
+        # summary прошлой свёртки — системное сообщение в начале истории, его держим всегда
+        dropped = history[:cut]
+        if dropped and _is_summary(dropped[0]) and message_tokens(model, dropped[0]) <= budget:
+            kept.insert(0, dropped.pop(0))
+
+        return prefix + kept + [user_msg], dropped
+
+    @property
+    def can_summarize(self) -> bool:
+        return bool(self.llm and self.summary_model)
+
+    async def fold(self, history_store, user_id: int, dropped: list[dict]):
+        """
+        Сворачивает вытесненные ходы в одно системное сообщение-summary и
+        подменяет ими начало истории пользователя.
+        """
+        if not dropped or not self.can_summarize:
+            return
+        if self.batch is not None:
+            self.batch.submit(
+                "fold",
+                {"model": self.summary_model, "messages": self.summary_messages(dropped)},
+                meta={"user_id": user_id, "dropped": dropped},
+                key=f"fold:{user_id}",
+            )
+            return
+        try:
+            resp = await self.llm.chat(self.summary_model, self.summary_messages(dropped))
+            summary = resp.choices[0].message.content
+        except Exception:
+            logger.exception("context fold failed for %s", user_id)
+            return
+        # свёртка — такой же платный вызов: в /quota, /stats и лимиты пользователя
+        metrics.record_usage(self.summary_model, user_id, getattr(resp, "usage", None))
+        await self.apply_summary(history_store, user_id, dropped, summary)
+
+    @staticmethod
+    def summary_messages(dropped: list[dict]) -> list[dict]:
+        transcript = "\n".join(f"{m['role']}: {m['content']}" for m in dropped)
+        return [
+            {"role": "system", "content": "Сожми диалог в 3–5 предложений, сохрани факты, имена и договорённости."},
+            {"role": "user", "content": transcript},
+        ]
+
+    @staticmethod
+    async def apply_summary(history_store, user_id: int, dropped: list[dict], summary: str):
+        # холодный пользователь подгружается в потоке, а не в event loop
+        current = await history_store.aget(user_id)
+        # пока шло summary, история могла пополниться — убираем только свёрнутый префикс
+        if current[: len(dropped)] != dropped:
+            return
+        history_store.replace(
+            user_id,
+            [{"role": "system", "content": SUMMARY_PREFIX + summary.strip()}] + current[len(dropped):],
+        )
+
+
+def _is_summary(message: dict) -> bool:
+    return message.get("role") == "system" and (message.get("content") or "").startswith(SUMMARY_PREFIX)
@@ -0,0 +1,248 @@
+# deep_search.py
+import asyncio
+import hashlib
+import json
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from html.parser import HTMLParser
+from urllib.parse import urlparse
+
+import httpx
+
+from .logger import setup_logger
+
+logger = setup_logger()
+
+_SKIP_TAGS = {"script", "style", "noscript", "nav", "header", "footer", "aside", "form", "svg", "iframe"}
+_BLOCK_TAGS = {"p", "div", "li", "h1", "h2", "h3", "h4", "section", "article", "br", "tr", "pre", "blockquote"}
+_WORD = re.compile(r"\w{3,}", re.UNICODE)
+_HEADERS = {"User-Agent": "Mozilla/5.0 (compatible; gptbot-deep-search)"}
+
+
+class _TextExtractor(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts: list[str] = []
+        self._skip = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _SKIP_TAGS:
+            self._skip += 1
+        elif tag in _BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in _SKIP_TAGS and self._skip:
+            self._skip -= 1
+        elif tag in _BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_data(self, data):
+        if not self._skip:
+            self.parts.append(data)
+
+
+def extract_text(raw: bytes, content_type: str = "") -> str:
+    """Читаемый текст страницы. CPU-bound — выполняется в пуле процессов."""
+    charset = "utf-8"
+    m = re.search(r"charset=([\w-]+)", content_type or "")
+    if m:
+        charset = m.group(1)
+    html = raw.decode(charset, errors="replace")
+    if content_type and "html" not in content_type:
+        # текстовые форматы отдаём как есть, бинарные (pdf, картинки) пропускаем
+        return html.strip() if content_type.startswith("text/") else ""
+
+    parser = _TextExtractor()
+    parser.feed(html)
+    parser.close()
+    lines = (re.sub(r"[ \t\xa0]+", " ", line).strip() for line in "".join(parser.parts).split("\n"))
+    # короткие строки — обычно меню и кнопки
+    return "\n".join(line for line in lines if len(line) > 40)
+
+
+def chunk_text(text: str, size: int = 800) -> list[str]:
+    chunks, current = [], ""
+    for para in text.split("\n"):
+        if current and len(current) + len(para) > size:
+            chunks.append(current)
+            current = ""
+        current = f"{current}\n{para}" if current else para
+        while len(current) > size:
+            chunks.append(current[:size])
+            current = current[size:]
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def rank_chunks(query: str, chunks: list[tuple[str, str]], max_chars: int) -> list[tuple[str, str]]:
+    """Самые релевантные (url, chunk) по пересечению слов с запросом, в пределах max_chars."""
+    terms = {w.lower() for w in _WORD.findall(query)}
+    scored = []
+    for i, (url, chunk) in enumerate(chunks):
+        words = [w.lower() for w in _WORD.findall(chunk)]
+        score = sum(1 for w in words if w in terms) / (1 + len(words) ** 0.5)
+        scored.append((score, -i, url, chunk))
+    scored.sort(reverse=True)
+
+    picked, used = [], 0
+    for score, _, url, chunk in scored:
+        if score <= 0 or used + len(chunk) > max_chars:
+            continue
+        picked.append((url, chunk))
+        used += len(chunk)
+    return picked
+
+
+class DeepSearch:
+    """
+    Глубокий поиск: параллельно качает top-K страниц из выдачи CSE,
+    извлекает текст в пуле процессов и отдаёт самые релевантные фрагменты для саммари.
+    Общее время ограничено total_timeout, объём скачивания — byte_budget.
+    Страницы кэшируются на диске по URL + ETag. http — общий клиент приложения, если передан.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str,
+        top_k: int = 3,
+        per_host: int = 2,
+        byte_budget: int = 1_500_000,
+        page_bytes: int = 500_000,
+        timeout: float = 5.0,
+        total_timeout: float = 8.0,
+        max_context_chars: int = 6000,
+        cache_ttl: float = 86400.0,
+        workers: int = 2,
+        http: httpx.AsyncClient | None = None,
+    ):
+        self.cache_dir = cache_dir
+        self.top_k = top_k
+        self.per_host = per_host
+        self.byte_budget = byte_budget
+        self.page_bytes = page_bytes
+        self.timeout = timeout
+        self.total_timeout = total_timeout
+        self.max_context_chars = max_context_chars
+        self.cache_ttl = cache_ttl
+        self.workers = workers
+        os.makedirs(cache_dir, exist_ok=True)
+
+        self._http = http
+        self._own_http = http is None
+        self._pool: ProcessPoolExecutor | None = None
+        self._host_limits: dict[str, asyncio.Semaphore] = {}
+
+    @property
+    def http(self) -> httpx.AsyncClient:
+        if self._http is None:
+            self._http = httpx.AsyncClient(
+                timeout=self.timeout,
+                follow_redirects=True,
+                limits=httpx.Limits(max_connections=self.top_k * self.per_host, max_keepalive_connections=self.top_k),
+                headers=_HEADERS,
+            )
+        return self._http
+
+    async def close(self):
+        if self._http is not None and self._own_http:
+            await self._http.aclose()
+            self._http = None
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    async def enrich(self, query: str, results: list[dict]) -> list[tuple[str, str]]:
+        """Возвращает [(url, фрагмент)] для промпта саммари; пусто, если ничего не успели."""
+        budget = {"left": self.byte_budget}
+        urls = [it["link"] for it in results[: self.top_k] if it.get("link")]
+        tasks = [asyncio.create_task(self._page_text(url, budget)) for url in urls]
+        if not tasks:
+            return []
+
+        done, pending = await asyncio.wait(tasks, timeout=self.total_timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            logger.info("deep search: %d/%d pages timed out", len(pending), len(tasks))
+
+        chunks = []
+        for url, task in zip(urls, tasks):
+            if task in done and not task.cancelled() and task.exception() is None and task.result():
+                chunks += [(url, c) for c in chunk_text(task.result())]
+        return rank_chunks(query, chunks, self.max_context_chars)
+
+    # --------------------
+    # Fetch + cache
+    # --------------------
+    def _cache_path(self, url: str) -> str:
+        return os.path.join(self.cache_dir, hashlib.sha1(url.encode()).hexdigest() + ".json")
+
+    def _read_cache(self, url: str) -> dict | None:
+        try:
+            with open(self._cache_path(url), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_cache(self, url: str, etag: str | None, text: str):
+        path = self._cache_path(url)
+        tmp = f"{path}.{os.getpid()}.{id(text)}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"url": url, "etag": etag, "fetched_at": time.time(), "text": text}, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    async def _page_text(self, url: str, budget: dict) -> str:
+        cached = await asyncio.to_thread(self._read_cache, url)
+        if cached and not cached.get("etag") and time.time() - cached.get("fetched_at", 0) < self.cache_ttl:
+            return cached["text"]
+
+        headers = dict(_HEADERS)
+        if cached and cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+
+        host = urlparse(url).netloc
+        limit = self._host_limits.setdefault(host, asyncio.Semaphore(self.per_host))
+        try:
+            async with limit:
+                # настройки запроса явно: клиент может быть общим для всего приложения
+                async with self.http.stream(
+                    "GET", url, headers=headers, follow_redirects=True, timeout=self.timeout
+                ) as resp:
+                    if resp.status_code == 304 and cached:
+                        return cached["text"]
+                    if resp.status_code != 200:
+                        return ""
+                    raw = await self._read_limited(resp, budget)
+                    etag = resp.headers.get("etag")
+                    content_type = resp.headers.get("content-type", "")
+        except (httpx.HTTPError, OSError) as e:
+            logger.info("deep search: %s failed: %s", url, e)
+            return cached["text"] if cached else ""
+
+        text = await self._extract(raw, content_type)
+        await asyncio.to_thread(self._write_cache, url, etag, text)
+        return text
+
+    async def _read_limited(self, resp: httpx.Response, budget: dict) -> bytes:
+        """Читает тело, пока не упрёмся в лимит страницы или общий бюджет байт."""
+        buf = bytearray()
+        async for part in resp.aiter_bytes():
+            allowed = min(self.page_bytes - len(buf), budget["left"])
+            if allowed <= 0:
+                break
+            part = part[:allowed]
+            buf += part
+            budget["left"] -= len(part)
+        return bytes(buf)
+
+    async def _extract(self, raw: bytes, content_type: str) -> str:
+        if self.workers <= 0:
+            return await asyncio.to_thread(extract_text, raw, content_type)
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._pool, extract_text, raw, content_type)
@@ -0,0 +1,196 @@
+# delivery.py
+import asyncio
+import html
+import re
+from datetime import timedelta
+from functools import lru_cache
+
+from telegram.constants import ParseMode
+from telegram.error import BadRequest, RetryAfter
+
+from .logger import setup_logger
+
+logger = setup_logger()
+
+TELEGRAM_MAX_LEN = 4096
+
+_FENCE = re.compile(r"^```([\w+-]*)[ \t]*\n(.*?)(?:^```[ \t]*$|\Z)", re.S | re.M)
+_INLINE_CODE = re.compile(r"`([^`\n]+)`")
+_LINK = re.compile(r"\[([^\]\n]+)\]\((https?://[^)\s]+)\)")
+_BOLD = re.compile(r"\*\*(?=\S)(.+?)(?<=\S)\*\*|__(?=\S)(.+?)(?<=\S)__")
+_ITALIC = re.compile(r"(?<![\w*])\*(?=[^\s*])(.+?)(?<=[^\s*])\*(?![\w*])|(?<!\w)_(?=\S)(.+?)(?<=\S)_(?!\w)")
+_STRIKE = re.compile(r"~~(?=\S)(.+?)(?<=\S)~~")
+_HEADING = re.compile(r"^#{1,6}\s+(.+?)\s*#*$", re.M)
+_BULLET = re.compile(r"^(\s*)[-*]\s+", re.M)
+
+
+# --------------------
+# Разбиение
+# --------------------
+def _blocks(text: str) -> list[tuple[str, str, str]]:
+    """Текст → [(kind, lang, body)]: блоки кода целиком, остальное — по абзацам."""
+    blocks, pos = [], 0
+    for m in _FENCE.finditer(text):
+        blocks += [("text", "", p) for p in text[pos:m.start()].split("\n\n") if p.strip()]
+        blocks.append(("code", m.group(1), m.group(2).rstrip("\n")))
+        pos = m.end()
+    blocks += [("text", "", p) for p in text[pos:].split("\n\n") if p.strip()]
+    return blocks
+
+
+def _fence(lang: str, body: str) -> str:
+    return f"```{lang}\n{body}\n```"
+
+
+def _hard_split(text: str, limit: int, sep: str) -> list[str]:
+    """Режет по разделителю, куски длиннее лимита — по словам, в крайнем случае посимвольно."""
+    parts, current = [], ""
+    for piece in text.split(sep):
+        candidate = f"{current}{sep}{piece}" if current else piece
+        if len(candidate) <= limit:
+            current = candidate
+            continue
+        if current:
+            parts.append(current)
+        while len(piece) > limit:
+            cut = piece.rfind(" ", 0, limit) if sep != " " else -1
+            cut = cut if cut > limit // 2 else limit
+            parts.append(piece[:cut])
+            piece = piece[cut:].lstrip(" ")
+        current = piece
+    if current:
+        parts.append(current)
+    return parts
+
+
+def _split_block(kind: str, lang: str, body: str, limit: int) -> list[str]:
+    if kind == "text":
+        if len(body) <= limit:
+            return [body]
+        return [p for line in _hard_split(body, limit, "\n") for p in ([line] if len(line) <= limit else _hard_split(line, limit, " "))]
+
+    # блок кода: режем по строкам и каждый кусок снова оборачиваем в ```lang
+    overhead = len(_fence(lang, ""))
+    if len(body) + overhead <= limit:
+        return [_fence(lang, body)]
+    return [_fence(lang, part) for part in _hard_split(body, limit - overhead, "\n")]
+
+
+def split_message(text: str, limit: int = TELEGRAM_MAX_LEN) -> list[str]:
+    """
+    Делит ответ на части не длиннее limit по границам абзацев,
+    не разрывая блоки кода (слишком длинный блок режется по строкам и закрывается в каждой части).
+    """
+    if len(text) <= limit:
+        return [text] if text else []
+
+    parts, current = [], ""
+    for kind, lang, body in _blocks(text):
+        for piece in _split_block(kind, lang, body, limit):
+            candidate = f"{current}\n\n{piece}" if current else piece
+            if len(candidate) <= limit:
+                current = candidate
+            else:
+                parts.append(current)
+                current = piece
+    if current:
+        parts.append(current)
+    return [p for p in parts if p]
+
+
+# --------------------
+# Markdown → HTML
+# --------------------
+def _inline(text: str) -> str:
+    codes: list[str] = []
+
+    def stash(m):
+        codes.append(f"<code>{html.escape(m.group(1), quote=False)}</code>")
+        return f"\x00{len(codes) - 1}\x00"
+
+    text = _INLINE_CODE.sub(stash, text)
+    text = html.escape(text, quote=False)
+    text = _LINK.sub(lambda m: '<a href="%s">%s</a>' % (m.group(2).replace('"', "&quot;"), m.group(1)), text)
+    text = _HEADING.sub(r"<b>\1</b>", text)
+    text = _BULLET.sub(r"\1• ", text)
+    text = _BOLD.sub(lambda m: f"<b>{m.group(1) or m.group(2)}</b>", text)
+    text = _ITALIC.sub(lambda m: f"<i>{m.group(1) or m.group(2)}</i>", text)
+    text = _STRIKE.sub(r"<s>\1</s>", text)
+    return re.sub(r"\x00(\d+)\x00", lambda m: codes[int(m.group(1))], text)
+
+
+@lru_cache(maxsize=512)
+def markdown_to_html(text: str) -> str:
+    """Markdown от модели → HTML, который принимает Telegram (parse_mode=HTML)."""
+    out, pos = [], 0
+    for m in _FENCE.finditer(text):
+        out.append(_inline(text[pos:m.start()]))
+        lang, body = m.group(1), html.escape(m.group(2).rstrip("\n"), quote=False)
+        cls = f' class="language-{lang}"' if lang else ""
+        out.append(f"<pre><code{cls}>{body}</code></pre>")
+        pos = m.end()
+    out.append(_inline(text[pos:]))
+    return "".join(out)
+
+
+def render_parts(text: str, limit: int = TELEGRAM_MAX_LEN) -> list[tuple[str, str]]:
+    """[(html, исходный markdown)] — после конвертации каждая часть тоже укладывается в лимит."""
+    rendered = []
+    for part in split_message(text, limit):
+        body = markdown_to_html(part)
+        if len(body) <= TELEGRAM_MAX_LEN or limit < 256:
+            rendered.append((body, part))
+            continue
+        # экранирование раздуло часть — делим исходник мельче
+        smaller = int(limit * TELEGRAM_MAX_LEN / len(body) * 0.9)
+        rendered += render_parts(part, smaller)
+    return rendered
+
+
+# --------------------
+# Отправка
+# --------------------
+def retry_seconds(e: RetryAfter) -> float:
+    delay = e.retry_after
+    if isinstance(delay, timedelta):
+        return delay.total_seconds()
+    return float(delay)
+
+
+async def _send(message, text: str, parse_mode: str | None, attempts: int, **kwargs):
+    for attempt in range(attempts):
+        try:
+            return await message.reply_text(text, parse_mode=parse_mode, **kwargs)
+        except RetryAfter as e:
+            if attempt == attempts - 1:
+                raise
+            delay = retry_seconds(e)
+            logger.info("delivery: flood control chat=%s, ждём %.1fs", message.chat_id, delay)
+            await asyncio.sleep(delay)
+
+
+async def send_long(message, text: str, markdown: bool = True, attempts: int = 5, **kwargs) -> list:
+    """
+    Отправляет ответ любой длины ответом на message: части уходят по порядку,
+    на RetryAfter ждём сколько просит Telegram и повторяем ту же часть.
+    Если Telegram не принял HTML — эта часть уходит как обычный текст.
+    kwargs (например reply_markup) прикрепляются к последней части.
+    """
+    if markdown:
+        parts = render_parts(text)
+    else:
+        parts = [(p, None) for p in split_message(text)]
+    if not parts:
+        parts = [(text or "Пустой ответ от модели.", None)]
+
+    sent = []
+    for i, (body, source) in enumerate(parts):
+        extra = kwargs if i == len(parts) - 1 else {}
+        try:
+            sent.append(await _send(message, body, ParseMode.HTML if source is not None else None, attempts, **extra))
+        except BadRequest as e:
+            if source is None or "parse" not in str(e).lower():
+                raise
+            logger.warning("delivery: HTML не принят (%s), отправляем текстом", e)
+            sent.append(await _send(message, source, None, attempts, **extra))
+    return sent
@@ -0,0 +1,650 @@
+# handlers.py
+"""
+Хендлеры Telegram. Каждый получает AppContext первым аргументом: в Application
+они регистрируются через bind(ctx, handler), так что состояние бота передаётся явно.
+"""
+import asyncio
+import contextvars
+import functools
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime
+
+from telegram import KeyboardButton, ReplyKeyboardMarkup, Update
+from telegram.ext import ContextTypes
+
+from . import metrics
+from .attachments import DownloadFailed, FileTooLarge, UnsupportedFile, document_kind, fit_to_budget
+from .context import AppContext
+from .delivery import send_long
+from .logger import payload, setup_logger
+from .metrics import stage
+from .streaming import stream_reply
+from .voice import duration_seconds
+
+logger = setup_logger()
+
+WEB_BUTTON = "🌐 Веб-поиск"
+CHAT_BUTTON = "💬 Обычный чат"
+main_keyboard = ReplyKeyboardMarkup(
+    [[KeyboardButton(WEB_BUTTON), KeyboardButton(CHAT_BUTTON)]],
+    resize_keyboard=True
+)
+
+
+def bind(ctx: AppContext, handler):
+    """handler(ctx, update, context) → колбэк для Application с тем же именем (его видят логи и бенчмарк)."""
+
+    @functools.wraps(handler)
+    async def callback(update, context):
+        return await handler(ctx, update, context)
+
+    return callback
+
+
+# --------------------
+# Helpers
+# --------------------
+async def budget_state(ctx: AppContext, update: Update) -> str | None:
+    """ok | soft по бюджету пользователя; жёсткий лимит — None (пользователю уже ответили)."""
+    if ctx.ledger.stale():
+        await asyncio.to_thread(ctx.ledger.refresh)
+    state = ctx.ledger.check(update.effective_user.id)
+    if state == "hard":
+        logger.warning("[%s] бюджет исчерпан, запрос отклонён", update.effective_user.id)
+        await update.message.reply_text("🚫 Лимит бюджета на этот месяц исчерпан, попробуйте позже.")
+        return None
+    return state
+
+def budget_downgrade(ctx: AppContext, update: Update, model: str, state: str) -> str:
+    """На мягком лимите — дешёвая модель вместо выбранной."""
+    if state == "soft" and model != ctx.router.cheap_model:
+        logger.info("[%s] мягкий лимит бюджета: %s → %s", update.effective_user.id, model, ctx.router.cheap_model)
+        return ctx.router.cheap_model
+    return model
+
+async def budget_model(ctx: AppContext, update: Update, model: str) -> str | None:
+    """Модель с учётом бюджета: мягкий лимит — дешёвая модель, жёсткий — None (пользователю уже ответили)."""
+    state = await budget_state(ctx, update)
+    if state is None:
+        return None
+    return budget_downgrade(ctx, update, model, state)
+
+def format_exc(e: Exception) -> str:
+    return f"{type(e).__name__}: {e}"
+
+# слот уже взят выше по стеку этой задачи (handle_text → do_web_search): второй не берём
+_in_slot = contextvars.ContextVar("in_slot", default=False)
+
+@asynccontextmanager
+async def request_slot(ctx: AppContext, update: Update, handler: str):
+    """Слот планировщика под один запрос пользователя; при ожидании сообщаем позицию в очереди."""
+    if _in_slot.get():
+        yield
+        return
+    message = update.message
+
+    async def on_queued(position: int):
+        await message.reply_text(f"⏳ Запрос в очереди, позиция {position}")
+
+    started = time.perf_counter()
+    async with ctx.scheduler.slot(update.effective_chat.id, update.effective_user.id, on_queued=on_queued):
+        metrics.STAGE_SECONDS.observe(time.perf_counter() - started, handler=handler, stage="queue")
+        token = _in_slot.set(True)
+        try:
+            yield
+        finally:
+            _in_slot.reset(token)
+
+async def google_search(ctx: AppContext, query: str, num_results: int = 8, date_restrict: str | None = "m6"):
+    """
+    Устойчивый поиск через SearchEngine: кэш + параллельный фолбэк
+      1) любой язык + dateRestrict
+      2) (если пусто) без lr и без dateRestrict
+    """
+    return await ctx.search.search(query, num_results=num_results, date_restrict=date_restrict)
+
+async def summarize_search_results(
+    ctx: AppContext,
+    user_query: str,
+    results: list,
+    user_id: int | None = None,
+    pages: list[tuple[str, str]] | None = None,
+    model: str | None = None,
+) -> str:
+    if not results:
+        return "Ничего не нашёл по запросу."
+
+    logger.debug("CSE raw: %s", payload(results))
+    blocks = []
+    for i, it in enumerate(results, 1):
+        blocks.append(f"{i}. {it['title']}\n{it['snippet']}\n{it['link']}")
+    corpus = "\n\n".join(blocks)
+    if pages:
+        # фрагменты скачанных страниц (deep search) — самые релевантные куски текста
+        corpus += "\n\nФрагменты страниц:\n\n" + "\n\n".join(f"[{url}]\n{chunk}" for url, chunk in pages)
+
+    today = datetime.utcnow().strftime("%Y-%m-%d")
+
+    logger.info("Дата поиска %s", today)
+
+    system_prompt = (
+        "Ты ассистент-аналитик результатов веб-поиска. У тебя НЕТ прямого доступа в интернет; "
+        "используй ТОЛЬКО предоставленные сниппеты, фрагменты страниц и ссылки. "
+        f"Текущая дата: {today}. "
+        "Всегда предпочитай более свежую информацию и официальные/авторитетные источники "
+        "(например, страницы производителя, крупные профильные издания). "
+        "При противоречиях выбирай данные с более поздними годами/датами. "
+        "Не выдумывай фактов. Если данных не хватает — задай 1 короткий уточняющий вопрос."
+    )
+
+    user_prompt = (
+        f"Вопрос пользователя: «{user_query}».\n\n"
+        "Ниже результаты поиска (заголовок / сниппет / ссылка). "
+        "Сам выбери, что важно показать и в каком формате (прямой ответ; или 3–6 пунктов; или краткая выжимка). "
+        "В конце добавь раздел «Источники» с 2–4 наиболее релевантными ссылками.\n\n"
+        f"{corpus}"
+    )
+
+    # Формируем аргументы для API
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt},
+    ]
+    kwargs = {}
+    model = model or ctx.router.default_model
+
+    # 🔧 убираем temperature для gpt-5-nano
+    if not model.startswith("gpt-5-nano"):
+        kwargs["temperature"] = 0.2
+
+    # правильный вызов
+    logger.info("Старт запроса")
+    resp = await ctx.llm.chat(model, messages, **kwargs)
+    logger.info("Конец запроса")
+    metrics.record_usage(model, user_id, resp.usage)
+
+    return resp.choices[0].message.content
+
+# --------------------
+# Handlers
+# --------------------
+async def start(ctx: AppContext, update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not ctx.is_allowed(update):
+        return
+    user_id = update.effective_user.id
+    base = "Привет! Я Telegram-ассистент с поддержкой текста и голосовых сообщений.\n\n"
+    common_cmds = "Команды:\n/start — приветствие\n/help — помощь"
+    if ctx.is_admin(user_id):
+        extra = "\n/model <name> — сменить модель для этого чата\n/quota — расходы OpenAI API за месяц\n/stats — статистика поиска и кэша"
+        text = base + common_cmds + extra
+    else:
+        text = base + common_cmds
+
+    await update.message.reply_text(text, reply_markup=main_keyboard)
+
+async def help_cmd(ctx: AppContext, update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not ctx.is_allowed(update):
+         return
+    user_id = update.effective_user.id
+    base = "Доступные команды:\n/start — приветствие\n/help — помощь"
+    if ctx.is_admin(user_id):
+        extra = "\n/model <name> — сменить модель для этого чата\n/quota — расходы OpenAI API за месяц\n/stats — статистика поиска и кэша"
+        await update.message.reply_text(base + extra)
+    else:
+        await update.message.reply_text(base)
+
+async def set_model(ctx: AppContext, update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not ctx.is_allowed(update):
+        return
+    user_id = update.effective_user.id
+    if not ctx.is_admin(user_id):
+        await update.message.reply_text("🚫 У вас нет прав на смену модели.")
+        return
+    
+    chat_id = update.effective_chat.id
+    if not context.args:
+        if chat_id in ctx.router.overrides:
+            mode = "закреплена для этого чата"
+        elif ctx.router.enabled:
+            mode = f"авто: {ctx.router.cheap_model} / {ctx.router.strong_model}"
+        else:
+            mode = "по умолчанию"
+        await update.message.reply_text(
+            f"Текущая модель: {ctx.router.model_for(chat_id)} ({mode})\n"
+            "Использование: /model gpt-4o или /model gpt-3.5-turbo, /model auto — сбросить"
+        )
+        return
+    new_model = context.args[0].strip()
+    if new_model.lower() in ("auto", "default"):
+        ctx.router.set_model(chat_id, None)
+        await update.message.reply_text(f"✅ Модель для этого чата: автоматически (по умолчанию {ctx.router.default_model})")
+        return
+    ctx.router.set_model(chat_id, new_model)
+    await update.message.reply_text(f"✅ Модель для этого чата установлена: {new_model}")
+
+async def quota(ctx: AppContext, update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not ctx.is_allowed(update):
+        return
+    user_id = update.effective_user.id
+    if not ctx.is_admin(user_id):
+        await update.message.reply_text("🚫 У вас нет прав на смену модели.")
+        return
+    """Расходы за текущий месяц по локальному учёту — без запросов к OpenAI."""
+    if ctx.ledger.stale():
+        await asyncio.to_thread(ctx.ledger.refresh)
+    st = ctx.ledger.summary()
+    lines = [f"💰 Расходы OpenAI API за {st['period']}: ${st['total']:.4f}"]
+    if st["soft_limit"] is not None or st["hard_limit"] is not None:
+        soft = f"${st['soft_limit']:.2f}" if st["soft_limit"] is not None else "—"
+        hard = f"${st['hard_limit']:.2f}" if st["hard_limit"] is not None else "—"
+        lines.append(f"— Лимиты: мягкий {soft}, жёсткий {hard}")
+    if st["models"]:
+        lines.append("\nПо моделям:")
+        lines += [f"— {m}: ${cost:.4f} ({p} вх. / {c} вых. токенов)" for m, p, c, cost in st["models"]]
+    if st["users"]:
+        lines.append("\nПо пользователям:")
+        lines += [f"— {user}: ${cost:.4f}" for user, cost in st["users"]]
+    await update.message.reply_text("\n".join(lines))
+
+async def handle_text(ctx: AppContext, update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not ctx.is_allowed(update):
+        return
+
+    message = update.message
+    chat = update.effective_chat
+    user = update.effective_user
+    user_id = user.id
+
+    raw_text = message.text or ""
+    user_input = raw_text.replace(f"@{ctx.admission.bot_username}", "").strip()
+
+    logger.info("[%s] @%s - TEXT: %s", user.id, user.username or 'no_username', payload(user_input))
+
+    # --- Переключение режима через кнопки (только в приватке) ---
+    if chat.type == "private":
+        if user_input == WEB_BUTTON:
+            ctx.user_modes[user_id] = "web"
+            await message.reply_text(
+                "✅ Режим: 🌐 веб-поиск.\nПросто напиши запрос, я сначала схожу в интернет.",
+                reply_markup=main_keyboard,
+            )
+            return
+
+        if user_input == CHAT_BUTTON:
+            ctx.user_modes[user_id] = "chat"
+            await message.reply_text(
+                "✅ Режим: 💬 обычный чат.\nОтветы только от модели без интернета.",
+                reply_markup=main_keyboard,
+            )
+            return
+
+    # бюджет — до платного вызова роутера (DECISION_MODEL): на жёстком лимите не тратим и его
+    budget = await budget_state(ctx, update)
+    if budget is None:
+        return
+
+    try:
+        # роутер и ответ — в одном слоте планировщика: одна очередь и один токен лимита на запрос
+        async with request_slot(ctx, update, "handle_text"):
+            with stage("handle_text", "route"):
+                route = await ctx.router.route(chat.id, user_id, user_input)
+            model = budget_downgrade(ctx, update, route.model, budget)
+
+            # --- Веб-режим или роутер решил, что нужны свежие данные → идём в интернет ---
+            web_mode = chat.type == "private" and ctx.user_modes[user_id] == "web"
+            if web_mode or (route.web and ctx.cse_enabled):
+                await do_web_search(ctx, user_input, update, model=model)
+                return
+
+            # --- Обычный GPT-ответ ---
+            messages = []
+
+            # 1) ГРУППЫ: если это reply на сообщение бота — добавим предыдущий ответ как контекст
+            if chat.type in ("group", "supergroup") and message.reply_to_message:
+                reply_msg = message.reply_to_message
+                if reply_msg.from_user and reply_msg.from_user.username == ctx.admission.bot_username:
+                    prev_text = reply_msg.text or ""
+                    if prev_text:
+                        # это сообщение бота → роль assistant
+                        messages.append({"role": "assistant", "content": prev_text})
+
+            # 2) ПРИВАТНЫЕ ЧАТЫ: индивидуальный контекст ТОЛЬКО для админов
+            history = await ctx.history.aget(user_id) if chat.type == "private" and ctx.is_admin(user_id) else []
+            messages, dropped = ctx.context_builder.build(model, history, user_input, prefix=messages)
+            if dropped and ctx.context_builder.can_summarize:
+                context.application.create_task(ctx.context_builder.fold(ctx.history, user_id, dropped))
+
+            cacheable = ctx.response_cache.cacheable(messages)
+
+            with stage("handle_text", "cache"):
+                cached = await ctx.response_cache.lookup(model, user_input) if cacheable else None
+            if cached is not None:
+                answer_text = cached
+                logger.info("[BOT -> %s] Ответ (cache): %s", user.id, payload(answer_text))
+            elif ctx.config.stream_replies:
+                with stage("handle_text", "stream"):
+                    answer_text = await stream_reply(
+                        context.bot,
+                        message,
+                        ctx.llm.stream_chat(
+                            model,
+                            messages,
+                            on_usage=lambda u: metrics.record_usage(model, user_id, u),
+                        ),
+                        min_interval=ctx.config.stream_edit_interval,
+                    )
+                logger.info("[BOT -> %s] Ответ (stream): %s", user.id, payload(answer_text))
+            else:
+                with stage("handle_text", "llm"):
+                    resp = await ctx.llm.chat(model, messages)
+                metrics.record_usage(model, user_id, resp.usage)
+                answer_text = resp.choices[0].message.content
+                logger.debug("LOG Choices %s", payload(resp.choices))
+                logger.info("[BOT -> %s] Ответ: %s", user.id, payload(answer_text))
+
+        # отправка и кэш — уже после освобождения слота
+        if cached is not None or not ctx.config.stream_replies:
+            with stage("handle_text", "reply"):
+                await send_long(message, answer_text)
+        if cached is None and cacheable:
+            usage = None if ctx.config.stream_replies else getattr(resp, "usage", None)
+            await ctx.response_cache.store(
+                model, user_input, answer_text,
+                tokens=usage.total_tokens if usage else None,
+            )
+
+        if chat.type == "private" and ctx.is_admin(user_id):
+            # лучше сохранять и пользователя, и ассистента
+            ctx.history.append(user_id, "user", user_input)
+            ctx.history.append(user_id, "assistant", answer_text)
+
+    except Exception as e:
+        metrics.ERRORS.inc(handler="handle_text")
+        logger.exception("handle_text error")
+        await message.reply_text(f"❌ Ошибка: {format_exc(e)}")
+
+
+async def do_web_search(ctx: AppContext, user_input: str, update: Update, model: str | None = None):
+    message = update.message
+    chat = update.effective_chat
+    user = update.effective_user
+    user_id = user.id
+    model = model or ctx.router.model_for(chat.id)
+
+    logger.info("[%s] @%s - WEB TEXT: %s", user.id, user.username or 'no_username', payload(user_input))
+
+    try:
+        answer_text = await ctx.response_cache.lookup(model, user_input, kind="web")
+        if answer_text is None:
+            logger.info("Запрос в интернете")
+            async with request_slot(ctx, update, "do_web_search"):
+                with stage("do_web_search", "cse"):
+                    raw_results = await google_search(ctx, user_input, num_results=8, date_restrict="m6")
+                pages = None
+                if ctx.deep_search and raw_results:
+                    with stage("do_web_search", "deep"):
+                        pages = await ctx.deep_search.enrich(user_input, raw_results)
+                with stage("do_web_search", "summarize"):
+                    answer_text = (
+                        await summarize_search_results(ctx, user_input, raw_results, user_id=user_id, pages=pages, model=model)
+                        if raw_results else
+                        "Ничего не нашёл по запросу."
+                    )
+            if raw_results:
+                await ctx.response_cache.store(model, user_input, answer_text, kind="web")
+
+        logger.info("[BOT -> %s] Ответ (WEB): %s", user.id, payload(answer_text))
+        with stage("do_web_search", "reply"):
+            await send_long(message, answer_text)
+
+        if chat.type == "private" and ctx.is_admin(user_id):
+            ctx.history.append(user_id, "assistant", answer_text)
+
+    except Exception as e:
+        metrics.ERRORS.inc(handler="do_web_search")
+        logger.exception("do_web_search error")
+        await message.reply_text(f"❌ Ошибка веб-поиска: {format_exc(e)}")
+
+async def search_web(ctx: AppContext, update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not ctx.is_allowed(update):
+        return
+
+    message = update.message
+    raw_text = message.text or ""
+
+    # "/web запрос..." → убираем саму команду
+    query = raw_text.split(" ", 1)
+    if len(query) < 2 or not query[1].strip():
+        await message.reply_text("⚠️ Укажи запрос после команды: /web <текст>")
+        return
+
+    user_input = query[1].strip()
+    model = await budget_model(ctx, update, ctx.router.model_for(update.effective_chat.id))
+    if model is None:
+        return
+    await do_web_search(ctx, user_input, update, model=model)
+
+
+async def handle_voice(ctx: AppContext, update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not ctx.is_allowed(update):
+        return
+
+    user = update.effective_user
+    chat = update.effective_chat
+    user_id = user.id
+
+    logger.info("[%s] @%s - VOICE: получено голосовое сообщение", user.id, user.username or 'no_username')
+    # бюджет проверяем до скачивания и Whisper: на жёстком лимите платить за распознавание незачем
+    budget = await budget_state(ctx, update)
+    if budget is None:
+        return
+    try:
+        async with request_slot(ctx, update, "handle_voice"):
+            # 1–3. Скачиваем в память и распознаём речь (Whisper), без временных файлов
+            with stage("handle_voice", "download"):
+                audio = await ctx.voice.download(update.message.voice)
+            with stage("handle_voice", "transcribe"):
+                text = await ctx.voice.transcribe_bytes(audio)
+            ctx.ledger.record_audio(ctx.voice.model, user_id, duration_seconds(update.message.voice.duration))
+            logger.info("[%s] - VOICE TEXT: %s", user.id, payload(text))
+
+            # 4. Выбираем модель и формируем сообщения для GPT (в пределах бюджета токенов)
+            model = budget_downgrade(ctx, update, (await ctx.router.route(chat.id, user_id, text)).model, budget)
+            history = await ctx.history.aget(user_id) if chat.type == "private" and ctx.is_admin(user_id) else []
+            messages, dropped = ctx.context_builder.build(model, history, text)
+            if dropped and ctx.context_builder.can_summarize:
+                context.application.create_task(ctx.context_builder.fold(ctx.history, user_id, dropped))
+
+            # 5. Отвечаем GPT
+            with stage("handle_voice", "llm"):
+                resp = await ctx.llm.chat(model, messages)
+        metrics.record_usage(model, user_id, resp.usage)
+        answer_text = resp.choices[0].message.content
+
+        logger.info("[BOT -> %s] Ответ: %s", user.id, payload(answer_text))
+
+        # 6. Отправляем ответ
+        with stage("handle_voice", "reply"):
+            # распознавание и ответ уже оплачены — длинный ответ делим на части, а не теряем
+            await send_long(update.message, f"🗣️ Ты сказал: {text}\n\n🤖 {answer_text}")
+
+        # 7. Сохраняем историю для админов в приватке
+        if chat.type == "private" and ctx.is_admin(user_id):
+            ctx.history.append(user_id, "assistant", answer_text)
+
+    except Exception as e:
+        metrics.ERRORS.inc(handler="handle_voice")
+        logger.exception("[%s] - VOICE ERROR: %s", user.id, e)
+        await update.message.reply_text(f"❌ Ошибка при обработке голосового: {format_exc(e)}")
+
+async def handle_attachment(ctx: AppContext, update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Фото и документы (PDF, DOCX, текст, картинки файлом): содержимое уходит модели вместе с подписью."""
+    if not ctx.is_allowed(update):
+        return
+
+    message = update.message
+    chat = update.effective_chat
+    user = update.effective_user
+    user_id = user.id
+    document = message.document
+    caption = (message.caption or "").replace(f"@{ctx.admission.bot_username}", "").strip()
+    kind = "image" if message.photo else document_kind(document.file_name, document.mime_type)
+
+    logger.info("[%s] @%s - FILE (%s): %s", user.id, user.username or 'no_username', kind or document.mime_type, payload(caption))
+    if kind is None:
+        await message.reply_text("❌ Этот формат пока не поддерживается. Пришлите фото, PDF, DOCX или текстовый файл.")
+        return
+
+    # бюджет — до платного вызова роутера
+    budget = await budget_state(ctx, update)
+    if budget is None:
+        return
+
+    history = await ctx.history.aget(user_id) if chat.type == "private" and ctx.is_admin(user_id) else []
+    try:
+        async with request_slot(ctx, update, "handle_attachment"):
+            # картинкам нужна vision-модель; документ — обычный текстовый запрос
+            if kind == "image":
+                model = ctx.router.overrides.get(chat.id) or ctx.config.vision_model
+            else:
+                model = (await ctx.router.route(chat.id, user_id, caption)).model
+            model = budget_downgrade(ctx, update, model, budget)
+
+            if kind == "image":
+                with stage("handle_attachment", "image"):
+                    url = await ctx.attachments.image_url(
+                        message.photo or document,
+                        mime_type=(document.mime_type if document else None) or "image/jpeg",
+                    )
+                prompt = caption or "Опиши, что на изображении."
+                messages, dropped = ctx.context_builder.build(model, history, prompt)
+                messages[-1]["content"] = [
+                    {"type": "text", "text": messages[-1]["content"]},
+                    {"type": "image_url", "image_url": {"url": url, "detail": ctx.attachments.detail}},
+                ]
+                history_text = f"[изображение] {prompt}"
+            else:
+                with stage("handle_attachment", "extract"):
+                    text = await ctx.attachments.document_text(document)
+                if not text:
+                    await message.reply_text("❌ Не нашёл в файле текста.")
+                    return
+                doc_text, truncated = fit_to_budget(model, text, ctx.document_token_budget, query=caption)
+                name = document.file_name or "документ"
+                prefix = [{
+                    "role": "system",
+                    "content": f"Содержимое файла {name}{' (фрагменты)' if truncated else ''}:\n{doc_text}",
+                }]
+                prompt = caption or "Кратко перескажи содержание документа."
+                messages, dropped = ctx.context_builder.build(model, history, prompt, prefix=prefix)
+                history_text = f"[файл {name}] {prompt}"
+            if dropped and ctx.context_builder.can_summarize:
+                context.application.create_task(ctx.context_builder.fold(ctx.history, user_id, dropped))
+
+            with stage("handle_attachment", "llm"):
+                resp = await ctx.llm.chat(model, messages)
+        metrics.record_usage(model, user_id, resp.usage)
+        answer_text = resp.choices[0].message.content
+        logger.info("[BOT -> %s] Ответ (FILE): %s", user.id, payload(answer_text))
+
+        with stage("handle_attachment", "reply"):
+            await send_long(message, answer_text)
+
+        if chat.type == "private" and ctx.is_admin(user_id):
+            ctx.history.append(user_id, "user", history_text)
+            ctx.history.append(user_id, "assistant", answer_text)
+
+    except (FileTooLarge, UnsupportedFile) as e:
+        await message.reply_text(f"❌ {e}")
+    except DownloadFailed as e:
+        metrics.ERRORS.inc(handler="handle_attachment")
+        logger.warning("[%s] - FILE DOWNLOAD: %s", user.id, e)
+        await message.reply_text("❌ Не удалось скачать файл, попробуйте прислать его ещё раз.")
+    except Exception as e:
+        metrics.ERRORS.inc(handler="handle_attachment")
+        logger.exception("[%s] - FILE ERROR: %s", user.id, type(e).__name__)
+        # текст исключения в чат не отдаём: в нём может оказаться ссылка на файл с токеном бота
+        await message.reply_text("❌ Ошибка при обработке файла, попробуйте позже.")
+
+async def handle_unsupported(ctx: AppContext, update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not ctx.is_allowed(update):
+        return
+    user = update.effective_user
+    kind = type(update.message.effective_attachment)
+    caption = update.message.caption or "(без подписи)"
+
+    logger.info("[%s] @%s - UNSUPPORTED: %s - Caption: %s", user.id, user.username or 'no_username', kind, payload(caption))
+    await update.message.reply_text("❌ Извините, видео я пока не обрабатываю.")
+
+async def search_cmd(ctx: AppContext, update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not context.args:
+        await update.message.reply_text("⚠️ Укажи запрос: /search <текст>")
+        return
+    
+    query = " ".join(context.args)
+    try:
+        async with request_slot(ctx, update, "search_cmd"):
+            with stage("search_cmd", "cse"):
+                results = await google_search(ctx, query)
+        if not results:
+            await update.message.reply_text("Ничего не найдено.")
+            return
+        
+        blocks = []
+        for i, it in enumerate(results, 1):
+            blocks.append(f"{i}. {it['title']}\n{it['snippet']}\n{it['link']}")
+        reply_text = "\n\n".join(blocks)
+
+        with stage("search_cmd", "reply"):
+            await send_long(update.message, reply_text, markdown=False)
+    except Exception as e:
+        metrics.ERRORS.inc(handler="search_cmd")
+        await update.message.reply_text(f"Ошибка поиска: {e}")
+
+
+async def stats_cmd(ctx: AppContext, update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not ctx.is_allowed(update):
+        return
+    if not ctx.is_admin(update.effective_user.id):
+        await update.message.reply_text("🚫 Команда доступна только администраторам.")
+        return
+    st = ctx.search.stats()
+    rc = ctx.response_cache.stats()
+    rt = ctx.router.stats()
+    bq = ctx.batch_queue.stats() if ctx.batch_queue else None
+    by_model = ", ".join(f"{m}: {n}" for m, n in rt["by_model"].items()) or "—"
+    await update.message.reply_text(
+        "📊 Поиск:\n"
+        f"— Запросов: {st['searches']} (ошибок CSE: {st['errors']})\n"
+        f"— Кэш: {st['cache_hits']} попаданий / {st['cache_misses']} промахов "
+        f"({st['cache_hit_rate']:.0%})\n"
+        f"— p95 задержка: {st['p95_latency'] * 1000:.0f} мс\n\n"
+        "💾 Кэш ответов:\n"
+        f"— Попаданий: {rc['hits']} (похожих: {rc['semantic_hits']}), промахов: {rc['misses']} "
+        f"({rc['hit_rate']:.0%})\n"
+        f"— Сэкономлено токенов: ~{rc['tokens_saved']}\n\n"
+        f"🧭 Маршрутизация ({'вкл' if rt['enabled'] else 'выкл'}), последние {rt['recent']}:\n"
+        f"— Модели: {by_model}\n"
+        f"— С веб-поиском: {rt['web']}, чатов со своей моделью: {rt['overrides']}"
+        + (
+            f"\n\n📦 Батчи: в очереди {bq['pending']}, в обработке {bq['in_batches']} ({bq['batches']} батчей), "
+            f"готово {bq['completed']}, ошибок {bq['failed']}"
+            if bq else ""
+        )
+    )
+
+async def debug_log(ctx: AppContext, update: Update, context: ContextTypes.DEFAULT_TYPE):
+    try:
+        logger.debug("RAW UPDATE: %s", payload(update.to_dict()))
+    except Exception as e:
+        logger.exception("Failed to log raw update: %s", e)
+
+async def reset(ctx: AppContext, update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = update.effective_user.id
+    if update.effective_chat.type == "private":
+        ctx.history.clear(user_id)
+        await update.message.reply_text("🧹 Контекст очищен.")
+async def error_handler(ctx: AppContext, update, context):
+    metrics.ERRORS.inc(handler="unhandled")
+    logger.exception("Unhandled error: %s", context.error)
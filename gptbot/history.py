@@ -0,0 +1,223 @@
+# history.py
+import asyncio
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+
+from .logger import setup_logger
+
+logger = setup_logger()
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS turns (
+    id      INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    role    TEXT    NOT NULL,
+    content TEXT    NOT NULL,
+    ts      REAL    NOT NULL
+);
+CREATE INDEX IF NOT EXISTS turns_user ON turns (user_id, id);
+"""
+
+
+class HistoryStore:
+    """
+    История диалогов: LRU-слой в памяти поверх SQLite (WAL).
+    Запись идёт write-behind через фоновый поток пачками, поэтому append не блокирует хендлер.
+    Пользователь подгружается из базы лениво — при первом обращении после рестарта или вытеснения;
+    из хендлеров — через aget(), чтобы чтение базы шло в потоке, а не в event loop.
+    Перед чтением ждём только отложенные записи этого пользователя, а не всю очередь.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_turns: int = 5,
+        max_users_in_memory: int = 1000,
+        flush_interval: float = 1.0,
+        batch_size: int = 200,
+    ):
+        self.path = path
+        self.max_turns = max_turns
+        self.max_users_in_memory = max_users_in_memory
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+
+        self._mem: OrderedDict[int, deque] = OrderedDict()
+        self._queue: queue.Queue = queue.Queue()
+        self._read_lock = threading.Lock()
+        # user_id -> число его операций, ещё не записанных в базу
+        self._pending: dict[int, int] = {}
+        self._written = threading.Condition()
+
+        self._reader = self._connect()
+        self._reader.executescript(_SCHEMA)
+
+        self._closed = False
+        self._writer = threading.Thread(target=self._write_loop, name="history-writer", daemon=True)
+        self._writer.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    # --------------------
+    # Public API
+    # --------------------
+    def get(self, user_id: int) -> list[dict]:
+        """Последние ходы пользователя (копия), с ленивой подгрузкой из базы (блокирующей)."""
+        return list(self._turns(user_id))
+
+    async def aget(self, user_id: int) -> list[dict]:
+        """Как get, но промах кэша читает базу в потоке — холодный пользователь не держит остальные чаты."""
+        turns = self._mem.get(user_id)
+        if turns is None:
+            loaded = await asyncio.to_thread(self._load, user_id)
+            # пока читали, пользователя могли подгрузить или дописать — берём то, что уже в памяти
+            turns = self._mem.get(user_id)
+            if turns is None:
+                turns = self._remember(user_id, deque(loaded, maxlen=self.max_turns))
+        self._mem.move_to_end(user_id)
+        return list(turns)
+
+    def append(self, user_id: int, role: str, content: str):
+        # базу здесь не читаем: пользователя, вытесненного из памяти после aget, дописываем только в очередь —
+        # следующий aget подгрузит его вместе с этой записью (_load ждёт его отложенные операции)
+        turns = self._mem.get(user_id)
+        if turns is not None:
+            turns.append({"role": role, "content": content})
+            self._mem.move_to_end(user_id)
+        self._enqueue(("append", user_id, role, content, time.time()))
+
+    def replace(self, user_id: int, turns: list[dict]):
+        """Полностью заменяет историю пользователя (например, свёрткой в summary)."""
+        self._remember(user_id, deque(turns, maxlen=self.max_turns))
+        self._enqueue(("replace", user_id, [dict(t) for t in turns], time.time()))
+
+    def clear(self, user_id: int):
+        self._mem.pop(user_id, None)
+        self._enqueue(("clear", user_id))
+
+    def flush(self):
+        """Блокирующе дожидается, пока все отложенные записи окажутся в базе."""
+        self._queue.join()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._writer.join()
+        self._reader.close()
+
+    def __len__(self):
+        return len(self._mem)
+
+    # --------------------
+    # Memory tier
+    # --------------------
+    def _turns(self, user_id: int) -> deque:
+        turns = self._mem.get(user_id)
+        if turns is None:
+            turns = self._remember(user_id, deque(self._load(user_id), maxlen=self.max_turns))
+        self._mem.move_to_end(user_id)
+        return turns
+
+    def _remember(self, user_id: int, turns: deque) -> deque:
+        self._mem[user_id] = turns
+        self._mem.move_to_end(user_id)
+        while len(self._mem) > self.max_users_in_memory:
+            self._mem.popitem(last=False)
+        return turns
+
+    def _load(self, user_id: int) -> list[dict]:
+        # отложенные записи этого пользователя могли ещё не доехать до базы — ждём только их
+        with self._written:
+            self._written.wait_for(lambda: user_id not in self._pending)
+        with self._read_lock:
+            rows = self._reader.execute(
+                "SELECT role, content FROM turns WHERE user_id = ? ORDER BY id DESC LIMIT ?",
+                (user_id, self.max_turns),
+            ).fetchall()
+        return [{"role": role, "content": content} for role, content in reversed(rows)]
+
+    # --------------------
+    # Write-behind
+    # --------------------
+    def _enqueue(self, op: tuple):
+        with self._written:
+            self._pending[op[1]] = self._pending.get(op[1], 0) + 1
+        self._queue.put(op)
+
+    def _done(self, ops: list):
+        with self._written:
+            for op in ops:
+                left = self._pending.get(op[1], 0) - 1
+                if left > 0:
+                    self._pending[op[1]] = left
+                else:
+                    self._pending.pop(op[1], None)
+            self._written.notify_all()
+
+    def _write_loop(self):
+        conn = self._connect()
+        stop = False
+        while not stop:
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            batch = [first]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if None in batch:
+                stop = True
+            ops = [op for op in batch if op is not None]
+            try:
+                if ops:
+                    self._apply(conn, ops)
+            except Exception:
+                logger.exception("history write-behind failed (%d ops)", len(ops))
+            finally:
+                self._done(ops)
+                for _ in batch:
+                    self._queue.task_done()
+        conn.close()
+
+    def _apply(self, conn: sqlite3.Connection, ops: list):
+        touched = set()
+        with conn:
+            for op in ops:
+                kind, user_id = op[0], op[1]
+                if kind == "append":
+                    _, _, role, content, ts = op
+                    conn.execute(
+                        "INSERT INTO turns (user_id, role, content, ts) VALUES (?, ?, ?, ?)",
+                        (user_id, role, content, ts),
+                    )
+                    touched.add(user_id)
+                elif kind == "replace":
+                    _, _, turns, ts = op
+                    conn.execute("DELETE FROM turns WHERE user_id = ?", (user_id,))
+                    conn.executemany(
+                        "INSERT INTO turns (user_id, role, content, ts) VALUES (?, ?, ?, ?)",
+                        [(user_id, t["role"], t["content"], ts) for t in turns],
+                    )
+                    touched.add(user_id)
+                elif kind == "clear":
+                    conn.execute("DELETE FROM turns WHERE user_id = ?", (user_id,))
+                    touched.discard(user_id)
+            # в базе держим не больше max_turns на пользователя
+            for user_id in touched:
+                conn.execute(
+                    "DELETE FROM turns WHERE user_id = ? AND id NOT IN "
+                    "(SELECT id FROM turns WHERE user_id = ? ORDER BY id DESC LIMIT ?)",
+                    (user_id, user_id, self.max_turns),
+                )
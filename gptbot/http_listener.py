@@ -0,0 +1,108 @@
+# http_listener.py
+import asyncio
+from dataclasses import dataclass, field
+from urllib.parse import parse_qs, urlsplit
+
+from .logger import setup_logger
+
+logger = setup_logger()
+
+MAX_BODY = 10 * 1024 * 1024
+# на чтение всего запроса (строка, заголовки, тело); молчащее keep-alive соединение закрывается
+READ_TIMEOUT = 30.0
+
+_REASONS = {
+    200: "OK", 204: "No Content", 400: "Bad Request", 403: "Forbidden",
+    404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large",
+    429: "Too Many Requests", 500: "Internal Server Error", 503: "Service Unavailable",
+}
+
+
+@dataclass
+class Request:
+    method: str
+    path: str
+    query: dict
+    headers: dict
+    body: bytes
+
+
+@dataclass
+class Response:
+    status: int = 200
+    body: bytes | str = b""
+    content_type: str = "text/plain; charset=utf-8"
+    headers: dict = field(default_factory=dict)
+
+
+async def _read_request(reader: asyncio.StreamReader) -> Request | None:
+    line = await reader.readline()
+    if not line:
+        return None
+    method, target, _ = line.decode("latin-1").split(" ", 2)
+    headers = {}
+    while True:
+        raw = await reader.readline()
+        if raw in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = raw.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    length = int(headers.get("content-length") or 0)
+    if length > MAX_BODY:
+        raise ValueError("body too large")
+    body = await reader.readexactly(length) if length else b""
+    url = urlsplit(target)
+    query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+    return Request(method.upper(), url.path, query, headers, body)
+
+
+def _encode(resp: Response, keep_alive: bool) -> bytes:
+    body = resp.body.encode() if isinstance(resp.body, str) else resp.body
+    head = [
+        f"HTTP/1.1 {resp.status} {_REASONS.get(resp.status, 'Unknown')}",
+        f"Content-Type: {resp.content_type}",
+        f"Content-Length: {len(body)}",
+        f"Connection: {'keep-alive' if keep_alive else 'close'}",
+    ]
+    head += [f"{k}: {v}" for k, v in resp.headers.items()]
+    return ("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body
+
+
+async def start_server(
+    handler, host: str, port: int, reuse_port: bool = False, read_timeout: float = READ_TIMEOUT
+) -> asyncio.Server:
+    """
+    Минимальный HTTP/1.1 сервер на asyncio (keep-alive, Content-Length).
+    handler — async-функция Request -> Response. Хватает для webhook, /metrics и стабов.
+    Запрос, не дочитанный за read_timeout, закрывает соединение: висящие сокеты не копятся.
+    """
+
+    async def on_connection(reader, writer):
+        try:
+            while True:
+                try:
+                    req = await asyncio.wait_for(_read_request(reader), read_timeout)
+                except asyncio.TimeoutError:
+                    break
+                except (ValueError, asyncio.IncompleteReadError):
+                    writer.write(_encode(Response(400, "bad request"), keep_alive=False))
+                    break
+                if req is None:
+                    break
+                try:
+                    resp = await handler(req)
+                except Exception:
+                    logger.exception("http handler failed: %s %s", req.method, req.path)
+                    resp = Response(500, "internal error")
+                keep_alive = req.headers.get("connection", "").lower() != "close"
+                writer.write(_encode(resp, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(on_connection, host, port, reuse_port=reuse_port or None)
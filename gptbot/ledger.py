@@ -0,0 +1,297 @@
+# ledger.py
+import json
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+
+from .logger import setup_logger
+
+logger = setup_logger()
+
+# USD за 1M токенов: (вход, выход). Совпадение по самому длинному префиксу имени модели.
+DEFAULT_PRICES = {
+    "gpt-3.5-turbo": (0.5, 1.5),
+    "gpt-4o": (2.5, 10.0),
+    "gpt-4o-mini": (0.15, 0.6),
+    "gpt-4.1": (2.0, 8.0),
+    "gpt-4.1-mini": (0.4, 1.6),
+    "gpt-4.1-nano": (0.1, 0.4),
+    "gpt-5": (1.25, 10.0),
+    "gpt-5-mini": (0.25, 2.0),
+    "gpt-5-nano": (0.05, 0.4),
+    # эмбеддинги семантического кэша: только вход
+    "text-embedding-3-small": (0.02, 0.0),
+    "text-embedding-3-large": (0.13, 0.0),
+    "text-embedding-ada-002": (0.1, 0.0),
+}
+# USD за минуту аудио
+AUDIO_PRICES = {"whisper-1": 0.006}
+BATCH_DISCOUNT = 0.5
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS usage (
+    id                INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts                REAL    NOT NULL,
+    period            TEXT    NOT NULL,
+    user_id           TEXT    NOT NULL,
+    model             TEXT    NOT NULL,
+    prompt_tokens     INTEGER NOT NULL,
+    completion_tokens INTEGER NOT NULL,
+    cost              REAL    NOT NULL
+);
+CREATE INDEX IF NOT EXISTS usage_period ON usage (period);
+"""
+
+
+def current_period() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m")
+
+
+def load_prices(spec: str | None) -> dict:
+    """LEDGER_PRICES: JSON {"model": [вход, выход]} поверх цен по умолчанию."""
+    prices = dict(DEFAULT_PRICES)
+    if spec:
+        prices.update({k: tuple(v) for k, v in json.loads(spec).items()})
+    return prices
+
+
+class UsageLedger:
+    """
+    Локальный учёт расходов: токены из resp.usage × цены моделей, агрегаты текущего месяца в памяти.
+    /quota читает только память; строки пишутся в SQLite пачками фоновым потоком.
+    Мягкий лимит переводит запросы на дешёвую модель, жёсткий — отклоняет их.
+    refresh_interval — база общая с другими процессами (WORKERS > 1): раз в столько секунд
+    refresh() досчитывает в память их расход, чтобы лимит был один на всех, а не на воркер.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        prices: dict | None = None,
+        soft_limit: float | None = None,
+        hard_limit: float | None = None,
+        user_soft_limit: float | None = None,
+        user_hard_limit: float | None = None,
+        flush_interval: float = 5.0,
+        batch_size: int = 200,
+        refresh_interval: float | None = None,
+    ):
+        self.path = path
+        self.prices = prices or dict(DEFAULT_PRICES)
+        self.soft_limit = soft_limit
+        self.hard_limit = hard_limit
+        self.user_soft_limit = user_soft_limit
+        self.user_hard_limit = user_hard_limit
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.refresh_interval = refresh_interval
+
+        self.period = current_period()
+        self.total = 0.0
+        self.by_user: dict[str, float] = {}
+        # model -> [prompt_tokens, completion_tokens, cost]
+        self.by_model: dict[str, list] = {}
+        self._unknown: set[str] = set()
+        self._lock = threading.Lock()
+        # что из базы уже учтено в памяти: (period, user, model) -> [prompt, completion, cost];
+        # коммит писателя и refresh() идут под _sync, иначе свои строки посчитались бы дважды
+        self._seen: dict[tuple, list] = {}
+        self._sync = threading.Lock()
+        self._refreshed = time.monotonic()
+
+        conn = sqlite3.connect(path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(_SCHEMA)
+        self._load(conn)
+        if refresh_interval is None:
+            conn.close()
+            conn = None
+        self._reader = conn
+
+        self._queue: queue.Queue = queue.Queue()
+        self._closed = False
+        self._writer = threading.Thread(target=self._write_loop, name="ledger-writer", daemon=True)
+        self._writer.start()
+
+    # --------------------
+    # Учёт
+    # --------------------
+    def price(self, model: str) -> tuple[float, float] | None:
+        best = None
+        for name in self.prices:
+            if model.startswith(name) and (best is None or len(name) > len(best)):
+                best = name
+        return self.prices[best] if best else None
+
+    def record(self, model: str, user_id, usage, batch: bool = False) -> float:
+        """Учитывает resp.usage одного вызова; возвращает стоимость в USD."""
+        if usage is None:
+            return 0.0
+        prompt = getattr(usage, "prompt_tokens", 0) or 0
+        completion = getattr(usage, "completion_tokens", 0) or 0
+        price = self.price(model)
+        if price is None:
+            if model not in self._unknown:
+                self._unknown.add(model)
+                logger.warning("ledger: нет цены для модели %s, стоимость не учитывается", model)
+            cost = 0.0
+        else:
+            cost = (prompt * price[0] + completion * price[1]) / 1_000_000
+            if batch:
+                cost *= BATCH_DISCOUNT
+        self._add(model, user_id, prompt, completion, cost)
+        return cost
+
+    def record_audio(self, model: str, user_id, seconds: float) -> float:
+        cost = AUDIO_PRICES.get(model, 0.0) * seconds / 60
+        self._add(model, user_id, 0, 0, cost)
+        return cost
+
+    def _add(self, model: str, user_id, prompt: int, completion: int, cost: float):
+        user = str(user_id) if user_id is not None else "-"
+        period = current_period()
+        self._count(period, user, model, prompt, completion, cost)
+        self._queue.put((time.time(), period, user, model, prompt, completion, cost))
+
+    def _count(self, period: str, user: str, model: str, prompt: int, completion: int, cost: float):
+        with self._lock:
+            if period != self.period:
+                # новый месяц — лимиты считаются с нуля
+                self.period, self.total, self.by_user, self.by_model = period, 0.0, {}, {}
+            self.total += cost
+            self.by_user[user] = self.by_user.get(user, 0.0) + cost
+            row = self.by_model.setdefault(model, [0, 0, 0.0])
+            row[0] += prompt
+            row[1] += completion
+            row[2] += cost
+
+    # --------------------
+    # Общая база
+    # --------------------
+    def stale(self) -> bool:
+        """Пора ли перечитать расход соседних процессов (только при refresh_interval)."""
+        return self.refresh_interval is not None and time.monotonic() - self._refreshed >= self.refresh_interval
+
+    def refresh(self):
+        """Досчитывает в память строки, записанные в базу другими процессами. Блокирует — звать через to_thread."""
+        if self._reader is None:
+            return
+        period = current_period()
+        with self._sync:
+            self._refreshed = time.monotonic()
+            rows = self._reader.execute(
+                "SELECT user_id, model, SUM(prompt_tokens), SUM(completion_tokens), SUM(cost) "
+                "FROM usage WHERE period = ? GROUP BY user_id, model",
+                (period,),
+            ).fetchall()
+            for user, model, prompt, completion, cost in rows:
+                seen = self._seen.setdefault((period, user, model), [0, 0, 0.0])
+                delta = (prompt - seen[0], completion - seen[1], cost - seen[2])
+                if delta[0] or delta[1] or delta[2] > 1e-12:
+                    self._count(period, user, model, *delta)
+                    seen[:] = [prompt, completion, cost]
+
+    # --------------------
+    # Лимиты
+    # --------------------
+    def check(self, user_id) -> str:
+        """ok | soft | hard — по общему и персональному расходу за текущий месяц."""
+        spent_user = self.by_user.get(str(user_id), 0.0)
+        if (self.hard_limit is not None and self.total >= self.hard_limit) or (
+            self.user_hard_limit is not None and spent_user >= self.user_hard_limit
+        ):
+            return "hard"
+        if (self.soft_limit is not None and self.total >= self.soft_limit) or (
+            self.user_soft_limit is not None and spent_user >= self.user_soft_limit
+        ):
+            return "soft"
+        return "ok"
+
+    def summary(self, top: int = 10) -> dict:
+        with self._lock:
+            users = sorted(self.by_user.items(), key=lambda kv: kv[1], reverse=True)[:top]
+            models = sorted(
+                ((m, p, c, cost) for m, (p, c, cost) in self.by_model.items()),
+                key=lambda row: row[3],
+                reverse=True,
+            )
+            return {
+                "period": self.period,
+                "total": self.total,
+                "soft_limit": self.soft_limit,
+                "hard_limit": self.hard_limit,
+                "users": users,
+                "models": models,
+            }
+
+    # --------------------
+    # Хранение
+    # --------------------
+    def _load(self, conn: sqlite3.Connection):
+        rows = conn.execute(
+            "SELECT user_id, model, SUM(prompt_tokens), SUM(completion_tokens), SUM(cost) "
+            "FROM usage WHERE period = ? GROUP BY user_id, model",
+            (self.period,),
+        ).fetchall()
+        for user, model, prompt, completion, cost in rows:
+            self._seen[(self.period, user, model)] = [prompt, completion, cost]
+            self.total += cost
+            self.by_user[user] = self.by_user.get(user, 0.0) + cost
+            row = self.by_model.setdefault(model, [0, 0, 0.0])
+            row[0] += prompt
+            row[1] += completion
+            row[2] += cost
+
+    def flush(self):
+        self._queue.join()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._writer.join()
+        if self._reader is not None:
+            self._reader.close()
+
+    def _write_loop(self):
+        conn = sqlite3.connect(self.path)
+        stop = False
+        while not stop:
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            # копим пачку до batch_size строк или flush_interval секунд
+            batch = [first]
+            deadline = time.monotonic() + self.flush_interval
+            while first is not None and batch[-1] is not None and len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            if None in batch:
+                stop = True
+            rows = [row for row in batch if row is not None]
+            try:
+                if rows:
+                    with self._sync:
+                        with conn:
+                            conn.executemany(
+                                "INSERT INTO usage (ts, period, user_id, model, prompt_tokens, completion_tokens, cost) "
+                                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                rows,
+                            )
+                        for _, period, user, model, prompt, completion, cost in rows:
+                            seen = self._seen.setdefault((period, user, model), [0, 0, 0.0])
+                            seen[0] += prompt
+                            seen[1] += completion
+                            seen[2] += cost
+            except Exception:
+                logger.exception("ledger write failed (%d rows)", len(rows))
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+        conn.close()
@@ -0,0 +1,188 @@
+# lifecycle.py
+import asyncio
+import glob
+import json
+import os
+import re
+import signal
+import time
+
+from telegram import Update
+from telegram.ext import SimpleUpdateProcessor
+
+from .logger import setup_logger
+
+logger = setup_logger()
+
+# недописанные атомарные записи самого бота: checkpoint и состояние батчей (<файл>.json.tmp),
+# страницы deep search (<хэш>.json.<pid>.<id>.tmp); чужие *.tmp в каталоге не трогаем
+TEMP_PATTERNS = ("*.json.tmp", "*.json.*.tmp")
+
+
+class DrainingUpdateProcessor(SimpleUpdateProcessor):
+    """
+    Параллельная обработка апдейтов с учётом того, что сейчас в работе.
+    При остановке drain() ждёт хендлеры до дедлайна, а недоделанные апдейты
+    сохраняет в checkpoint — после рестарта они обрабатываются заново.
+    admit(update) -> bool — гейт до диспетчеризации: отклонённый апдейт не доходит до хендлеров.
+    process_update у PTB финальный (семафор слотов), поэтому всё — в do_process_update.
+    """
+
+    def __init__(self, max_concurrent_updates: int, checkpoint_path: str | None = None, admit=None):
+        super().__init__(max_concurrent_updates)
+        self.checkpoint_path = checkpoint_path
+        self.admit = admit
+        self.inflight: dict[asyncio.Task, Update] = {}
+        # после дедлайна drain() апдейты, дождавшиеся слота, не запускаются, а идут в checkpoint
+        self._closed = False
+        self._late: list[Update] = []
+
+    async def do_process_update(self, update, coroutine):
+        if self.admit is not None and isinstance(update, Update) and not self.admit(update):
+            # корутина Application.process_update так и не запускается
+            coroutine.close()
+            return
+        if self._closed:
+            coroutine.close()
+            if isinstance(update, Update):
+                self._late.append(update)
+            return
+        task = asyncio.current_task()
+        self.inflight[task] = update
+        try:
+            await coroutine
+        finally:
+            self.inflight.pop(task, None)
+
+    async def drain(self, update_queue: asyncio.Queue, timeout: float) -> int:
+        """Ждёт очередь и хендлеры в работе не дольше timeout; возвращает число сохранённых в checkpoint апдейтов."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        # пока есть ждущие слота, все слоты заняты, и inflight не пуст
+        while (self.inflight or not update_queue.empty()) and loop.time() < deadline:
+            tasks = list(self.inflight)
+            if tasks:
+                await asyncio.wait(tasks, timeout=min(0.5, max(0.0, deadline - loop.time())))
+            else:
+                await asyncio.sleep(0.05)
+
+        self._closed = True
+        leftovers = []
+        while not update_queue.empty():
+            item = update_queue.get_nowait()
+            update_queue.task_done()
+            if isinstance(item, Update):
+                leftovers.append(item)
+        pending = list(self.inflight.items())
+        leftovers += [update for _, update in pending]
+        for task, _ in pending:
+            task.cancel()
+        if pending:
+            await asyncio.wait([task for task, _ in pending], timeout=1.0)
+        # освободившиеся слоты достаются ждавшим апдейтам — они сразу попадают в _late
+        seen = -1
+        while seen != len(self._late):
+            seen = len(self._late)
+            for _ in range(3):
+                await asyncio.sleep(0)
+        leftovers += self._late
+        if leftovers:
+            self._checkpoint(leftovers)
+        return len(leftovers)
+
+    def _checkpoint(self, updates: list[Update]):
+        if not self.checkpoint_path:
+            logger.warning("shutdown: %d updates dropped (no checkpoint path)", len(updates))
+            return
+        # у каждого процесса свой файл — воркеры webhook-режима не мешают друг другу
+        path = f"{self.checkpoint_path}-{os.getpid()}.json"
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump([u.to_dict() for u in updates], f, ensure_ascii=False)
+        os.replace(path + ".tmp", path)
+        logger.warning("shutdown: %d unfinished updates saved to %s", len(updates), path)
+
+
+async def restore_checkpoint(app, checkpoint_path: str | None) -> int:
+    """Возвращает в очередь апдейты, не обработанные до прошлой остановки. Вызывать до app.start()."""
+    if not checkpoint_path:
+        return 0
+    restored = 0
+    # строго <путь>-<pid>.json: pending_updates-*.json иначе подхватил бы и файлы тенантов
+    # (pending_updates-<tenant>-<pid>.json), а тенант «a» — файлы тенанта «a-b»
+    own = re.compile(re.escape(checkpoint_path) + r"-\d+\.json")
+    for path in glob.glob(f"{glob.escape(checkpoint_path)}-[0-9]*.json"):
+        if not own.fullmatch(path):
+            continue
+        claimed = path + ".restoring"
+        try:
+            # rename атомарен: файл достаётся только одному воркеру
+            os.rename(path, claimed)
+        except OSError:
+            continue
+        try:
+            with open(claimed, encoding="utf-8") as f:
+                for data in json.load(f):
+                    await app.update_queue.put(Update.de_json(data, app.bot))
+                    restored += 1
+        except (OSError, ValueError):
+            logger.exception("checkpoint %s is unreadable, skipped", claimed)
+        os.remove(claimed)
+    if restored:
+        logger.info("startup: %d updates restored from checkpoint", restored)
+    return restored
+
+
+def cleanup_temp(*dirs: str, min_age: float = 60.0) -> int:
+    """Удаляет брошенные временные файлы; свежие не трогаем — их может дописывать соседний воркер."""
+    removed = 0
+    now = time.time()
+    for directory in filter(None, dirs):
+        for pattern in TEMP_PATTERNS:
+            for path in glob.glob(os.path.join(glob.escape(directory), pattern)):
+                try:
+                    if now - os.path.getmtime(path) < min_age:
+                        continue
+                    os.remove(path)
+                    removed += 1
+                except OSError:
+                    pass
+    if removed:
+        logger.info("cleanup: removed %d temp files", removed)
+    return removed
+
+
+async def graceful_stop(app, timeout: float):
+    """Приём новых апдейтов уже остановлен: дожидаемся работы в процессе и останавливаем Application."""
+    processor = app.update_processor
+    if isinstance(processor, DrainingUpdateProcessor):
+        saved = await processor.drain(app.update_queue, timeout)
+        logger.info("shutdown: drained, %d updates checkpointed", saved)
+    await app.stop()
+    if app.post_stop:
+        await app.post_stop(app)
+
+
+async def run_polling(app, drain_timeout: float = 30.0, stop: asyncio.Event | None = None):
+    """
+    Замена app.run_polling(): на SIGINT/SIGTERM сначала перестаём забирать апдейты,
+    затем даём хендлерам доработать (drain) и только потом гасим Application.
+    stop — своё событие остановки (профиль старта гасит бота после первого getUpdates).
+    """
+    stop = stop or asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    async with app:
+        if app.post_init:
+            await app.post_init(app)
+        await app.updater.start_polling()
+        await app.start()
+        try:
+            await stop.wait()
+        finally:
+            logger.info("shutdown: stop polling, draining in-flight updates (up to %.0fs)", drain_timeout)
+            await app.updater.stop()
+            await graceful_stop(app, drain_timeout)
+    if app.post_shutdown:
+        await app.post_shutdown(app)
@@ -0,0 +1,269 @@
+# llm.py
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+
+from . import metrics
+from .logger import setup_logger
+
+logger = setup_logger()
+
+RETRY_STATUSES = {408, 409, 429}
+
+
+def is_retryable(e: Exception) -> bool:
+    """Временная ошибка: таймаут, обрыв соединения, 429 или 5xx. Ошибки запроса (400, 401, 404) — нет."""
+    if isinstance(e, (asyncio.TimeoutError, ConnectionError)):
+        return True
+    status = getattr(e, "status_code", None)
+    if status is not None:
+        return status in RETRY_STATUSES or status >= 500
+    return type(e).__name__ in ("APIConnectionError", "APITimeoutError")
+
+
+def _retry_after(e: Exception) -> float | None:
+    headers = getattr(getattr(e, "response", None), "headers", None)
+    try:
+        return float(headers.get("retry-after")) if headers and headers.get("retry-after") else None
+    except ValueError:
+        return None
+
+
+def parse_fallbacks(spec: str, make_client) -> list[tuple]:
+    """
+    "gpt-4o-mini, llama3@http://localhost:11434/v1, @http://backup/v1" → [(client | None, model | None)].
+    client=None — основной клиент, model=None — та же модель, что запрошена.
+    """
+    targets, clients = [], {}
+    for entry in filter(None, (e.strip() for e in (spec or "").split(","))):
+        model, _, base_url = entry.partition("@")
+        client = None
+        if base_url:
+            client = clients.get(base_url) or clients.setdefault(base_url, make_client(base_url))
+        targets.append((client, model or None))
+    return targets
+
+
+class LazyClient:
+    """
+    Клиент, создаваемый при первом обращении (client.chat, client.files, …).
+    Импорт openai — самая дорогая часть старта; до первого запроса к модели он не нужен.
+    preload() делает то же в фоновом потоке, чтобы первый запрос не ждал импорта.
+    Годится и для общего httpx.AsyncClient: его создание (SSL-контекст) тоже не бесплатно.
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._client is not None
+
+    def instance(self):
+        # не get(): у httpx.AsyncClient есть свой get, он должен проходить через __getattr__
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._factory()
+        return self._client
+
+    def preload(self):
+        return asyncio.get_running_loop().run_in_executor(None, self.instance)
+
+    def __getattr__(self, name):
+        return getattr(self.instance(), name)
+
+
+class AsyncLLM:
+    """
+    Асинхронный слой над AsyncOpenAI.
+    Не блокирует event loop и ограничивает число одновременных запросов к API.
+    Каждый вызов ограничен дедлайном; временные ошибки повторяются с экспоненциальной
+    задержкой и джиттером, затем — по очереди резервные модели/эндпоинты.
+    Для chat можно включить hedging: если ответа нет дольше перцентиля обычной задержки,
+    параллельно уходит второй запрос и берётся тот, что ответит первым.
+    """
+
+    def __init__(
+        self,
+        client,
+        max_concurrency: int = 8,
+        timeout: float | None = None,
+        retries: int = 0,
+        backoff: float = 0.5,
+        backoff_max: float = 8.0,
+        hedge_percentile: float = 0.0,
+        hedge_min_samples: int = 20,
+        hedge_min_delay: float = 0.5,
+        fallbacks: list[tuple] | None = None,
+    ):
+        self.client = client
+        self.max_concurrency = max(1, max_concurrency)
+        self.timeout = timeout
+        self.retries = max(0, retries)
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_min_delay = hedge_min_delay
+        self.fallbacks = fallbacks or []
+        self._sem = asyncio.Semaphore(self.max_concurrency)
+        self._latency: dict[str, deque] = {}
+
+    def targets(self, model: str) -> list[tuple]:
+        return [(self.client, model)] + [(client or self.client, fb_model or model) for client, fb_model in self.fallbacks]
+
+    async def chat(self, model: str, messages: list, **kwargs):
+        """Один вызов chat.completions; ждёт свободный слот, если потолок достигнут."""
+
+        async def call(client, target_model):
+            started = time.monotonic()
+            resp = await client.chat.completions.create(
+                model=target_model,
+                messages=messages,
+                **kwargs,
+            )
+            self._latency.setdefault(target_model, deque(maxlen=200)).append(time.monotonic() - started)
+            return resp
+
+        return await self._resilient(model, call, hedge=True)
+
+    async def transcribe(self, file, model: str = "whisper-1"):
+        """Распознавание речи через audio.transcriptions (только основной эндпоинт, с повторами)."""
+
+        async def call(client, target_model):
+            return await client.audio.transcriptions.create(
+                model=target_model,
+                file=file,
+            )
+
+        return await self._with_retries(self.client, model, call)
+
+    async def embed(self, model: str, text: str, user_id="cache") -> list[float]:
+        """
+        Вектор текста через embeddings (основной эндпоинт, тот же потолок и повторы, что у chat).
+        Расход уходит в метрики и ledger, как у остальных вызовов; user_id — на кого его записать.
+        """
+
+        async def call(client, target_model):
+            return await client.embeddings.create(model=target_model, input=text)
+
+        resp = await self._with_retries(self.client, model, call)
+        metrics.record_usage(model, user_id, getattr(resp, "usage", None))
+        return resp.data[0].embedding
+
+    async def stream_chat(self, model: str, messages: list, on_usage=None, **kwargs):
+        """
+        Потоковый вызов: отдаёт текст ответа кусками по мере генерации.
+        on_usage(usage) вызывается с итоговым resp.usage последнего чанка.
+        Повторы и фолбэк — только до первого чанка; дальше дедлайн действует на паузу между чанками.
+        """
+        if on_usage is not None:
+            kwargs.setdefault("stream_options", {"include_usage": True})
+
+        async def call(client, target_model):
+            return await client.chat.completions.create(
+                model=target_model,
+                messages=messages,
+                stream=True,
+                **kwargs,
+            )
+
+        async with self._sem:
+            stream = await self._resilient(model, call, slot=False)
+            chunks = stream.__aiter__()
+            while True:
+                try:
+                    chunk = await self._deadline(chunks.__anext__())
+                except StopAsyncIteration:
+                    break
+                if on_usage is not None and getattr(chunk, "usage", None):
+                    on_usage(chunk.usage)
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    yield delta
+
+    # --------------------
+    # Повторы, hedging, фолбэк
+    # --------------------
+    async def _resilient(self, model: str, call, hedge: bool = False, slot: bool = True):
+        last_error = None
+        for i, (client, target_model) in enumerate(self.targets(model)):
+            if i:
+                metrics.LLM_EVENTS.inc(event="fallback")
+                logger.warning("llm: %s недоступна (%s), переключаемся на %s", model, last_error, target_model)
+            try:
+                return await self._with_retries(client, target_model, call, hedge=hedge, slot=slot)
+            except Exception as e:
+                if not is_retryable(e):
+                    raise
+                last_error = e
+        raise last_error
+
+    async def _with_retries(self, client, model: str, call, hedge: bool = False, slot: bool = True):
+        for attempt in range(self.retries + 1):
+            try:
+                if hedge:
+                    return await self._hedged(client, model, call)
+                return await self._attempt(client, model, call, slot=slot)
+            except Exception as e:
+                if not is_retryable(e) or attempt == self.retries:
+                    raise
+                # full jitter: равномерно от 0 до экспоненциального потолка, Retry-After важнее
+                delay = min(self.backoff_max, _retry_after(e) or random.uniform(0, self.backoff * 2 ** attempt))
+                metrics.LLM_EVENTS.inc(event="retry")
+                logger.info("llm: %s, повтор %d/%d через %.2fs", type(e).__name__, attempt + 1, self.retries, delay)
+                await asyncio.sleep(delay)
+
+    async def _deadline(self, coro):
+        if self.timeout:
+            return await asyncio.wait_for(coro, self.timeout)
+        return await coro
+
+    async def _attempt(self, client, model: str, call, slot: bool = True):
+        if not slot:
+            return await self._deadline(call(client, model))
+        async with self._sem:
+            return await self._deadline(call(client, model))
+
+    def hedge_delay(self, model: str) -> float | None:
+        """Через сколько секунд дублировать запрос; None — hedging выключен или мало замеров."""
+        samples = self._latency.get(model)
+        if not self.hedge_percentile or not samples or len(samples) < self.hedge_min_samples:
+            return None
+        ordered = sorted(samples)
+        idx = min(len(ordered) - 1, int(round(self.hedge_percentile / 100 * (len(ordered) - 1))))
+        return max(self.hedge_min_delay, ordered[idx])
+
+    async def _hedged(self, client, model: str, call):
+        delay = self.hedge_delay(model)
+        if delay is None:
+            return await self._attempt(client, model, call)
+
+        tasks = [asyncio.create_task(self._attempt(client, model, call))]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done:
+                return tasks[0].result()
+
+            metrics.LLM_EVENTS.inc(event="hedge")
+            logger.info("llm: %s дольше %.2fs, дублируем запрос", model, delay)
+            tasks.append(asyncio.create_task(self._attempt(client, model, call)))
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+            # обе попытки упали — отдаём ошибку первой
+            return tasks[0].result()
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
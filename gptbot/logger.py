@@ -0,0 +1,137 @@
+# logger.py
+import atexit
+import contextvars
+import json
+import logging
+import os
+import queue
+import random
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+# лог — в корне проекта, рядом с gpt_bot.py, как и до переезда в пакет
+LOG_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bot.log")
+
+# correlation id текущего апдейта: задаётся один раз на апдейт и попадает в каждую запись
+request_id = contextvars.ContextVar("request_id", default="-")
+# имя тенанта, когда в процессе несколько ботов: записи выглядят как [tenant/u123]
+tenant = contextvars.ContextVar("tenant", default="")
+
+_listener: QueueListener | None = None
+
+
+class _RequestIdFilter(logging.Filter):
+    def filter(self, record):
+        name = tenant.get()
+        record.request_id = f"{name}/{request_id.get()}" if name else request_id.get()
+        return True
+
+
+class _DeferredQueueHandler(QueueHandler):
+    """
+    QueueHandler без форматирования в вызывающем потоке:
+    запись уходит в очередь как есть, сообщение собирается уже в потоке листенера.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        data = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", "-"),
+            "msg": record.getMessage(),
+        }
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False)
+
+
+class Payload:
+    """
+    Ленивое представление большого объекта для логов: строка строится только при записи,
+    обрезается до LOG_PAYLOAD_CHARS и сэмплируется LOG_PAYLOAD_SAMPLE.
+    Полный дамп — только при LOG_FULL_PAYLOADS=1.
+    """
+
+    __slots__ = ("obj",)
+
+    full = os.getenv("LOG_FULL_PAYLOADS", "0").lower() in ("1", "true", "yes")
+    limit = int(os.getenv("LOG_PAYLOAD_CHARS", "300"))
+    sample = float(os.getenv("LOG_PAYLOAD_SAMPLE", "1.0"))
+
+    def __init__(self, obj):
+        self.obj = obj
+
+    def __str__(self):
+        text = self.obj if isinstance(self.obj, str) else repr(self.obj)
+        if self.full:
+            return text
+        if self.sample < 1.0 and random.random() >= self.sample:
+            return f"<{len(text)} chars>"
+        if len(text) > self.limit:
+            return f"{text[:self.limit]}… <+{len(text) - self.limit} chars>"
+        return text
+
+
+def payload(obj) -> Payload:
+    return Payload(obj)
+
+
+async def bind_update(update, context):
+    """Хендлер группы -1: назначает correlation id на время обработки апдейта."""
+    request_id.set(f"u{update.update_id}")
+
+
+def setup_logger():
+    """
+    Создаёт и возвращает объект logger с ротацией логов.
+    Запись в файл идёт через QueueHandler/QueueListener — вне event loop.
+    """
+    global _listener
+    logger = logging.getLogger("gptbot")
+
+    if not logger.handlers:
+        full = Payload.full
+        logger.setLevel(logging.DEBUG if full else os.getenv("LOG_LEVEL", "INFO").upper())
+
+        # Ротация логов: 5 файлов по 5 МБ
+        file_handler = RotatingFileHandler(LOG_FILE, maxBytes=5 * 1024 * 1024, backupCount=5)
+        if os.getenv("LOG_FORMAT", "json").lower() == "json":
+            file_handler.setFormatter(JsonFormatter())
+        else:
+            file_handler.setFormatter(logging.Formatter(
+                "%(asctime)s - %(levelname)s - [%(request_id)s] %(message)s",
+                datefmt="%Y-%m-%d %H:%M:%S"
+            ))
+
+        log_queue = queue.SimpleQueue()
+        queue_handler = _DeferredQueueHandler(log_queue)
+        queue_handler.addFilter(_RequestIdFilter())
+        logger.addHandler(queue_handler)
+
+        _listener = QueueListener(log_queue, file_handler, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown_logger)
+
+    # 🔇 Отключаем лишние логи от сторонних библиотек
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    logging.getLogger("telegram.bot").setLevel(logging.INFO)
+    logging.getLogger("telegram.ext._application").setLevel(logging.WARNING)
+    logging.getLogger("telegram.ext._updater").setLevel(logging.WARNING)
+    logging.getLogger("telegram.request").setLevel(logging.INFO)
+
+    logger.propagate = False  # чтобы не дублировалось в stdout/stderr
+
+    return logger
+
+
+def shutdown_logger():
+    """Дописывает очередь в файл и останавливает поток листенера."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
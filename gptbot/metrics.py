@@ -0,0 +1,213 @@
+# metrics.py
+import bisect
+import time
+from contextlib import contextmanager
+
+from .http_listener import Response, start_server
+from .logger import setup_logger
+
+logger = setup_logger()
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0.0) + amount
+
+    def get(self, **labels) -> float:
+        return self.values.get(self._key(labels), 0.0)
+
+    def render(self) -> list[str]:
+        return [f"{self.name}{_labels(self.labelnames, k)} {v}" for k, v in self.values.items()]
+
+
+class Gauge(_Metric):
+    """Gauge, значение которого берётся из колбэка в момент скрейпа; по колбэку на набор меток."""
+
+    kind = "gauge"
+
+    def __init__(self, name, help_text, labelnames=()):
+        super().__init__(name, help_text, labelnames)
+        self.series: dict[tuple, object] = {}
+
+    def bind(self, fn, **labels):
+        self.series[self._key(labels)] = fn
+
+    def unbind(self, **labels):
+        self.series.pop(self._key(labels), None)
+
+    def render(self) -> list[str]:
+        lines = []
+        for key, fn in list(self.series.items()):
+            try:
+                lines.append(f"{self.name}{_labels(self.labelnames, key)} {float(fn())}")
+            except Exception:
+                logger.exception("metrics: gauge %s failed", self.name)
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(buckets)
+        # key -> [счётчики по бакетам (+Inf последним), сумма, количество]
+        self.values: dict[tuple, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        state = self.values.get(key)
+        if state is None:
+            state = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        state[0][bisect.bisect_left(self.buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+    def render(self) -> list[str]:
+        lines = []
+        for key, (counts, total, count) in self.values.items():
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                labels = _labels(self.labelnames, key, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+
+    def _add(self, metric):
+        return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, help_text, labelnames=()) -> Counter:
+        return self._add(Counter(name, help_text, labelnames))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help_text, labelnames, buckets))
+
+    def gauge(self, name, help_text, fn, **labels) -> Gauge:
+        """
+        Регистрирует (или перепривязывает) gauge на колбэк. С метками — отдельная серия
+        на каждый набор (gauge(..., tenant="a") и gauge(..., tenant="b") живут рядом).
+        """
+        gauge = self._metrics.get(name)
+        if not isinstance(gauge, Gauge) or gauge.labelnames != tuple(labels):
+            gauge = self._metrics[name] = Gauge(name, help_text, tuple(labels))
+        gauge.bind(fn, **labels)
+        return gauge
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines += metric.header()
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "gptbot_stage_seconds", "Длительность стадий обработки", ("handler", "stage")
+)
+TOKENS = REGISTRY.counter(
+    "gptbot_tokens_total", "Токены по resp.usage", ("model", "user", "kind")
+)
+ERRORS = REGISTRY.counter(
+    "gptbot_errors_total", "Ошибки обработки апдейтов", ("handler",)
+)
+LLM_EVENTS = REGISTRY.counter(
+    "gptbot_llm_events_total", "Повторы, hedged-запросы и фолбэки LLM-клиента", ("event",)
+)
+ROUTES = REGISTRY.counter(
+    "gptbot_routes_total", "Решения маршрутизатора моделей", ("model", "source", "web")
+)
+
+
+@contextmanager
+def stage(handler: str, name: str):
+    """with stage("handle_text", "llm"): ... — время стадии попадает в гистограмму."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - started, handler=handler, stage=name)
+
+
+_usage_hooks: list = []
+
+
+def add_usage_hook(fn):
+    """fn(model, user_id, usage, batch) вызывается на каждый record_usage — например, учёт расходов."""
+    if fn not in _usage_hooks:
+        _usage_hooks.append(fn)
+
+
+def remove_usage_hook(fn):
+    if fn in _usage_hooks:
+        _usage_hooks.remove(fn)
+
+
+def record_usage(model: str, user_id, usage, batch: bool = False):
+    if usage is None:
+        return
+    user = str(user_id) if user_id is not None else "-"
+    TOKENS.inc(getattr(usage, "prompt_tokens", 0) or 0, model=model, user=user, kind="prompt")
+    TOKENS.inc(getattr(usage, "completion_tokens", 0) or 0, model=model, user=user, kind="completion")
+    for fn in _usage_hooks:
+        try:
+            fn(model, user_id, usage, batch)
+        except Exception:
+            logger.exception("metrics: usage hook failed")
+
+
+async def serve(host: str, port: int, registry: Registry = REGISTRY):
+    """Локальный /metrics в текстовом формате Prometheus."""
+
+    async def handle(req):
+        if req.path != "/metrics":
+            return Response(404, "not found")
+        return Response(200, registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+    server = await start_server(handle, host, port)
+    logger.info("metrics listening on %s:%s/metrics", host, port)
+    return server
@@ -0,0 +1,152 @@
+# response_cache.py
+import asyncio
+import math
+import time
+
+from .cache import TTLCache
+from .context_window import count_tokens
+from .logger import setup_logger
+from .search import normalize_query
+
+logger = setup_logger()
+
+
+class VectorIndex:
+    """Маленький локальный индекс эмбеддингов: линейный поиск по косинусу, с TTL и лимитом размера."""
+
+    def __init__(self, maxsize: int = 500):
+        self.maxsize = maxsize
+        self._items: list[tuple[list[float], tuple, float]] = []
+
+    @staticmethod
+    def _normalize(vec):
+        norm = math.sqrt(sum(x * x for x in vec)) or 1.0
+        return [x / norm for x in vec]
+
+    def add(self, vec, key, ttl: float):
+        now = time.monotonic()
+        items = [it for it in self._items if it[2] >= now]
+        items.append((self._normalize(vec), key, now + ttl))
+        self._items = items[-self.maxsize:]
+
+    def nearest(self, vec, kind: str, model: str):
+        """Лучший (score, key) среди живых записей того же вида и модели."""
+        now = time.monotonic()
+        query = self._normalize(vec)
+        best = (0.0, None)
+        for item_vec, key, expires_at in self._items:
+            if expires_at < now or key[0] != kind or key[1] != model:
+                continue
+            score = sum(a * b for a, b in zip(query, item_vec))
+            if score > best[0]:
+                best = (score, key)
+        return best
+
+    def __len__(self):
+        return len(self._items)
+
+
+class ResponseCache:
+    """
+    Кэш готовых ответов для повторяющихся вопросов.
+    Сначала точное совпадение по (вид, модель, нормализованный запрос),
+    затем — опционально — поиск похожего вопроса по эмбеддингам.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        chat_ttl: float = 3600.0,
+        web_ttl: float = 600.0,
+        maxsize: int = 1000,
+        llm=None,
+        embedding_model: str | None = None,
+        similarity: float = 0.93,
+    ):
+        self.enabled = enabled
+        self.ttls = {"chat": chat_ttl, "web": web_ttl}
+        self.exact = TTLCache(maxsize=maxsize, ttl=chat_ttl)
+        self.llm = llm
+        self.embedding_model = embedding_model
+        self.similarity = similarity
+        self.index = VectorIndex(maxsize=min(maxsize, 500))
+        # эмбеддинг, посчитанный при промахе, переиспользуется при сохранении ответа
+        self._pending_vectors = TTLCache(maxsize=200, ttl=300)
+
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.tokens_saved = 0
+
+    @property
+    def semantic(self) -> bool:
+        return bool(self.llm and self.embedding_model)
+
+    @staticmethod
+    def cacheable(messages: list[dict]) -> bool:
+        """Кэшируем только вопросы без контекста: с историей ответ зависит от диалога."""
+        return len(messages) == 1 and messages[0].get("role") == "user"
+
+    async def lookup(self, model: str, prompt: str, kind: str = "chat") -> str | None:
+        if not self.enabled:
+            return None
+        key = (kind, model, normalize_query(prompt))
+        entry = self.exact.get(key)
+        if entry is None and self.semantic:
+            entry = await self._semantic_lookup(key, prompt)
+        if entry is None:
+            self.misses += 1
+            return None
+        answer, tokens = entry
+        self.hits += 1
+        self.tokens_saved += tokens
+        logger.info("response cache hit (%s, %s): saved ~%d tokens", kind, model, tokens)
+        return answer
+
+    async def store(self, model: str, prompt: str, answer: str, kind: str = "chat", tokens: int | None = None):
+        if not self.enabled or not answer:
+            return
+        key = (kind, model, normalize_query(prompt))
+        if tokens is None:
+            tokens = count_tokens(model, prompt) + count_tokens(model, answer)
+        ttl = self.ttls.get(kind, self.exact.ttl)
+        self.exact.set(key, (answer, tokens), ttl=ttl)
+
+        if self.semantic:
+            vec = self._pending_vectors.pop(key[2])
+            if vec is None:
+                vec = await self._embed(prompt)
+            if vec is not None:
+                self.index.add(vec, key, ttl)
+
+    async def _semantic_lookup(self, key, prompt):
+        vec = await self._embed(prompt)
+        if vec is None:
+            return None
+        self._pending_vectors.set(key[2], vec)
+        score, best = await asyncio.to_thread(self.index.nearest, vec, key[0], key[1])
+        if best is None or score < self.similarity:
+            return None
+        entry = self.exact.get(best)
+        if entry is not None:
+            self.semantic_hits += 1
+            logger.info("response cache semantic hit (score=%.3f)", score)
+        return entry
+
+    async def _embed(self, text: str):
+        try:
+            return await self.llm.embed(self.embedding_model, text)
+        except Exception:
+            logger.exception("response cache: embedding failed")
+            return None
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "tokens_saved": self.tokens_saved,
+            "entries": len(self.exact),
+        }
@@ -0,0 +1,226 @@
+# router.py
+import asyncio
+import json
+import re
+import time
+from collections import deque
+from dataclasses import dataclass
+
+from . import metrics
+from .cache import TTLCache
+from .logger import payload, setup_logger
+from .search import normalize_query
+
+logger = setup_logger()
+
+# явная просьба сходить в интернет (при MODEL_ROUTING=1); голое «в интернете» сюда не входит —
+# «что пишут в интернете о …» обычный вопрос, а не просьба о платном поиске
+_WEB_EXPLICIT = re.compile(
+    r"найди в интернете|поищи в (интернете|сети)|загугли|погугли|найди в сети|web search|google it",
+    re.I,
+)
+# без маршрутизации поиск включает только прежняя ключевая фраза
+_WEB_TRIGGER = "найди в интернете"
+# свежие данные, которых заведомо нет в модели
+_WEB_FRESH = re.compile(
+    r"\b(новост\w*|курс\w* (доллара|евро|валют\w*|рубля|биткоина)"
+    r"|погод\w+|расписани\w+|цен[аыу] на|сколько стоит|прогноз погоды|результат\w* матча|счёт матча)\b",
+    re.I,
+)
+# признаки сложного запроса → сильная модель
+_HARD = re.compile(
+    r"```|\b(код\w*|функци\w+|алгоритм\w*|докажи|доказательств\w+|проанализируй|анализ\w*|сравни\w*|оптимизир\w+"
+    r"|архитектур\w+|рефактор\w*|отлад\w+|ошибк\w+ в|пошагово|подробно|распиши|реши задач\w*|уравнени\w+|sql|python|regex)\b",
+    re.I,
+)
+
+_DECISION_PROMPT = (
+    "Ты маршрутизатор запросов Telegram-бота. Ответь ТОЛЬКО JSON-объектом вида "
+    '{"level": "simple" | "hard", "web": true | false}. '
+    "level=hard — если нужен код, многошаговые рассуждения, анализ или длинный развёрнутый ответ. "
+    "web=true — только если для ответа нужны свежие данные из интернета (новости, цены, курсы, события после обучения модели)."
+)
+
+
+@dataclass
+class Route:
+    model: str
+    web: bool
+    reason: str
+    source: str  # override | heuristic | decision | default
+
+
+class Router:
+    """
+    Выбор модели и необходимости веб-поиска под каждый запрос.
+    Модель, закреплённая за чатом через /model, имеет приоритет; иначе
+    короткие простые запросы идут в дешёвую модель, сложные — в сильную.
+    Неоднозначные случаи (если разрешено) решает быстрая DECISION_MODEL, решения кэшируются.
+    Каждое решение пишется в лог и в счётчик gptbot_routes_total, последние — в audit.
+    overrides — где хранить /model: по умолчанию dict в памяти, у воркеров — общая база
+    (shared_state.ChatModelMap).
+    """
+
+    def __init__(
+        self,
+        llm,
+        default_model: str,
+        cheap_model: str | None = None,
+        strong_model: str | None = None,
+        decision_model: str | None = None,
+        enabled: bool = False,
+        short_chars: int = 200,
+        long_chars: int = 1200,
+        decision_timeout: float = 2.0,
+        audit_size: int = 200,
+        overrides=None,
+    ):
+        self.llm = llm
+        self.default_model = default_model
+        self.cheap_model = cheap_model or default_model
+        self.strong_model = strong_model or default_model
+        self.decision_model = decision_model
+        self.enabled = enabled
+        self.short_chars = short_chars
+        self.long_chars = long_chars
+        self.decision_timeout = decision_timeout
+        self.overrides = overrides if overrides is not None else {}
+        self.audit: deque = deque(maxlen=audit_size)
+        self._decisions = TTLCache(maxsize=1024, ttl=3600)
+
+    # --------------------
+    # /model по чатам
+    # --------------------
+    def set_model(self, chat_id: int, model: str | None):
+        """Закрепляет модель за чатом; None (или /model auto) — вернуть автоматический выбор."""
+        if model:
+            self.overrides[chat_id] = model
+        else:
+            self.overrides.pop(chat_id, None)
+
+    def model_for(self, chat_id: int) -> str:
+        return self.overrides.get(chat_id, self.default_model)
+
+    # --------------------
+    # Классификация
+    # --------------------
+    @staticmethod
+    def wants_web(text: str) -> bool:
+        """Пользователь явно просит поиск в интернете."""
+        return bool(_WEB_EXPLICIT.search(text or ""))
+
+    @staticmethod
+    def trigger_web(text: str) -> bool:
+        """Поведение без MODEL_ROUTING: поиск только по фразе «найди в интернете»."""
+        return _WEB_TRIGGER in (text or "").lower()
+
+    def heuristic(self, text: str) -> tuple[str | None, bool | None, str]:
+        """(level, web, reason); None — эвристика не уверена."""
+        text = text or ""
+        if self.wants_web(text):
+            web, web_reason = True, "explicit"
+        elif _WEB_FRESH.search(text):
+            web, web_reason = True, "fresh"
+        else:
+            web, web_reason = None, ""
+
+        if len(text) > self.long_chars or _HARD.search(text):
+            level, reason = "hard", "hard-markers"
+        elif len(text) <= self.short_chars and text.count("\n") < 3:
+            level, reason = "simple", "short"
+        else:
+            level, reason = None, "ambiguous"
+        if web_reason:
+            reason = f"{reason},web-{web_reason}"
+        return level, web, reason
+
+    async def _decide(self, text: str) -> tuple[str | None, bool | None]:
+        key = normalize_query(text)
+        cached = self._decisions.get(key)
+        if cached is not None:
+            return cached
+
+        messages = [
+            {"role": "system", "content": _DECISION_PROMPT},
+            {"role": "user", "content": text[:2000]},
+        ]
+        try:
+            resp = await asyncio.wait_for(
+                self.llm.chat(self.decision_model, messages, temperature=0, max_tokens=30),
+                timeout=self.decision_timeout,
+            )
+        except Exception as e:
+            logger.warning("router: decision model failed: %s", e)
+            return None, None
+        metrics.record_usage(self.decision_model, "router", getattr(resp, "usage", None))
+
+        raw = resp.choices[0].message.content or ""
+        m = re.search(r"\{.*\}", raw, re.S)
+        try:
+            data = json.loads(m.group(0)) if m else {}
+        except ValueError:
+            data = {}
+        level = data.get("level") if data.get("level") in ("simple", "hard") else None
+        web = data.get("web") if isinstance(data.get("web"), bool) else None
+        self._decisions.set(key, (level, web))
+        return level, web
+
+    async def route(self, chat_id: int, user_id: int, text: str) -> Route:
+        override = self.overrides.get(chat_id)
+        if not self.enabled:
+            route = Route(
+                override or self.default_model, self.trigger_web(text), "routing-off", "override" if override else "default"
+            )
+            return self._record(chat_id, user_id, text, route)
+
+        level, web, reason = self.heuristic(text)
+        source = "heuristic"
+        # модель-классификатор спрашиваем только в неоднозначных случаях — она тоже стоит времени
+        if level is None and self.decision_model and not override:
+            started = time.perf_counter()
+            d_level, d_web = await self._decide(text)
+            metrics.STAGE_SECONDS.observe(time.perf_counter() - started, handler="router", stage="decision")
+            if d_level is not None:
+                level, source = d_level, "decision"
+            if web is None and d_web is not None:
+                web, source = d_web, "decision"
+
+        if override:
+            model, source = override, "override"
+        elif level == "hard":
+            model = self.strong_model
+        elif level == "simple":
+            model = self.cheap_model
+        else:
+            model, source = self.default_model, "default"
+
+        return self._record(chat_id, user_id, text, Route(model, bool(web), reason, source))
+
+    def _record(self, chat_id, user_id, text, route: Route) -> Route:
+        self.audit.append({
+            "ts": time.time(),
+            "chat_id": chat_id,
+            "user_id": user_id,
+            "model": route.model,
+            "web": route.web,
+            "reason": route.reason,
+            "source": route.source,
+        })
+        metrics.ROUTES.inc(model=route.model, source=route.source, web=str(route.web).lower())
+        logger.info(
+            "route chat=%s user=%s → %s web=%s (%s/%s): %s",
+            chat_id, user_id, route.model, route.web, route.source, route.reason, payload(text),
+        )
+        return route
+
+    def stats(self) -> dict:
+        by_model: dict[str, int] = {}
+        for item in self.audit:
+            by_model[item["model"]] = by_model.get(item["model"], 0) + 1
+        return {
+            "enabled": self.enabled,
+            "recent": len(self.audit),
+            "by_model": by_model,
+            "web": sum(1 for item in self.audit if item["web"]),
+            "overrides": len(self.overrides),
+        }
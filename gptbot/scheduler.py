@@ -0,0 +1,219 @@
+# scheduler.py
+import asyncio
+import inspect
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+
+from .logger import setup_logger
+
+logger = setup_logger()
+
+
+class RateLimited(Exception):
+    """Пользователь исчерпал лимит и ждать пришлось бы слишком долго."""
+
+    def __init__(self, retry_after: float):
+        self.retry_after = retry_after
+        super().__init__(f"Слишком много запросов, попробуй через {retry_after:.0f} с")
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self) -> float:
+        """Берёт токен (возможно, в долг) и возвращает, сколько секунд подождать до его появления."""
+        self._refill()
+        self.tokens -= 1
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.rate
+
+    def refund(self):
+        self.tokens = min(self.capacity, self.tokens + 1)
+
+
+class Scheduler:
+    """
+    Планировщик перед каждым походом в OpenAI / Google:
+      - per-user token bucket (для LIMITED_USERS — строже, админы без лимита);
+      - глобальный потолок одновременно выполняемых запросов;
+      - честная очередь round-robin по чатам, админы обслуживаются вне очереди.
+    buckets(user_id, rate, capacity) — откуда брать bucket'ы: по умолчанию локальные TokenBucket,
+    в режиме нескольких воркеров — общие для всех процессов (shared_state.SharedState.bucket);
+    у общих reserve/refund — корутины (запрос к базе уходит в поток).
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 8,
+        user_rate: float = 0.2,
+        user_burst: float = 3,
+        limited_rate: float = 0.05,
+        limited_burst: float = 1,
+        max_wait: float = 60.0,
+        admins=(),
+        limited=(),
+        buckets=None,
+    ):
+        self.max_concurrency = max(1, max_concurrency)
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.limited_rate = limited_rate
+        self.limited_burst = limited_burst
+        self.max_wait = max_wait
+        self.admins = set(admins)
+        self.limited = set(limited)
+        self.buckets = buckets or (lambda user_id, rate, capacity: TokenBucket(rate, capacity))
+
+        self._active = 0
+        self._buckets: dict[int, TokenBucket] = {}
+        self._admin_lane: deque = deque()
+        self._lanes: OrderedDict[int, deque] = OrderedDict()
+
+    def set_access(self, admins, limited):
+        """Новые списки доступа (перечитанный конфиг); bucket'ы создаются заново с нужными лимитами."""
+        self.admins = set(admins)
+        self.limited = set(limited)
+        self._buckets.clear()
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._admin_lane) + sum(len(lane) for lane in self._lanes.values())
+
+    @asynccontextmanager
+    async def slot(self, chat_id: int, user_id: int, on_queued=None):
+        """
+        async with scheduler.slot(chat_id, user_id): ...
+        on_queued(position) вызывается один раз, если запросу пришлось ждать.
+        """
+        notify = _Once(on_queued)
+        await self._throttle(user_id, notify)
+        await self._acquire(chat_id, user_id, notify)
+        try:
+            yield
+        finally:
+            self._release()
+
+    # --------------------
+    # Rate limiting
+    # --------------------
+    def _bucket(self, user_id: int) -> TokenBucket:
+        bucket = self._buckets.get(user_id)
+        if bucket is None:
+            if user_id in self.limited:
+                bucket = self.buckets(user_id, self.limited_rate, self.limited_burst)
+            else:
+                bucket = self.buckets(user_id, self.user_rate, self.user_burst)
+            self._buckets[user_id] = bucket
+        return bucket
+
+    async def _throttle(self, user_id: int, notify):
+        if user_id in self.admins:
+            return
+        bucket = self._bucket(user_id)
+        wait = await _resolve(bucket.reserve())
+        if wait <= 0:
+            return
+        if wait > self.max_wait:
+            await _resolve(bucket.refund())
+            raise RateLimited(wait)
+        logger.info("scheduler: user %s throttled for %.1fs", user_id, wait)
+        await notify(self.queue_depth + 1)
+        await asyncio.sleep(wait)
+
+    # --------------------
+    # Fair queue
+    # --------------------
+    async def _acquire(self, chat_id: int, user_id: int, notify):
+        if self._active < self.max_concurrency and not self.queue_depth:
+            self._active += 1
+            return
+
+        fut = asyncio.get_running_loop().create_future()
+        if user_id in self.admins:
+            self._admin_lane.append(fut)
+        else:
+            self._lanes.setdefault(chat_id, deque()).append(fut)
+
+        try:
+            await notify(self.queue_depth)
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                # слот уже передали нам — возвращаем его следующему
+                self._release()
+            else:
+                self._discard(chat_id, fut)
+            raise
+
+    def _release(self):
+        fut = self._next_waiter()
+        if fut is not None:
+            # слот переходит ожидающему, счётчик active не меняется
+            fut.set_result(None)
+        else:
+            self._active -= 1
+
+    def _next_waiter(self):
+        while self._admin_lane:
+            fut = self._admin_lane.popleft()
+            if not fut.done():
+                return fut
+        while self._lanes:
+            chat_id, lane = self._lanes.popitem(last=False)
+            fut = None
+            while lane and fut is None:
+                candidate = lane.popleft()
+                if not candidate.done():
+                    fut = candidate
+            if lane:
+                # чат уходит в конец круга
+                self._lanes[chat_id] = lane
+            if fut is not None:
+                return fut
+        return None
+
+    def _discard(self, chat_id: int, fut):
+        if fut in self._admin_lane:
+            self._admin_lane.remove(fut)
+        lane = self._lanes.get(chat_id)
+        if lane and fut in lane:
+            lane.remove(fut)
+            if not lane:
+                del self._lanes[chat_id]
+
+
+async def _resolve(value):
+    """Результат метода bucket'а: у локального — значение, у общего — корутина."""
+    return await value if inspect.isawaitable(value) else value
+
+
+class _Once:
+    """Обёртка над колбэком уведомления об очереди: срабатывает не больше одного раза."""
+
+    def __init__(self, callback):
+        self.callback = callback
+        self.fired = False
+
+    async def __call__(self, position: int):
+        if self.callback is None or self.fired:
+            return
+        self.fired = True
+        try:
+            await self.callback(position)
+        except Exception:
+            logger.exception("scheduler: queued notification failed")
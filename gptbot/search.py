@@ -0,0 +1,200 @@
+# search.py
+import asyncio
+import re
+import time
+from collections import deque
+from urllib.parse import urlparse
+
+import httpx
+
+from .cache import TTLCache
+from .logger import setup_logger
+
+logger = setup_logger()
+
+CSE_URL = "https://www.googleapis.com/customsearch/v1"
+
+_BAD_DOMAINS = {
+    "support.google.com", "policies.google.com",
+    "accounts.google.com", "blog.google", "chrome.google.com"
+}
+
+_SPACES = re.compile(r"\s+")
+
+
+def _is_bad_domain(url: str) -> bool:
+    try:
+        host = urlparse(url).netloc.lower()
+        return any(host.endswith(d) for d in _BAD_DOMAINS)
+    except Exception:
+        return False
+
+
+def normalize_query(query: str) -> str:
+    """Нормализация запроса для ключа кэша: регистр, пробелы, пунктуация по краям."""
+    q = _SPACES.sub(" ", (query or "").lower()).strip()
+    return q.strip(" ?!.,;:")
+
+
+def _percentile(samples, pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    idx = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+class SearchEngine:
+    """
+    Поиск через Google CSE: общий пул HTTP-соединений, LRU+TTL кэш
+    и фолбэк по вариантам. speculative=True запускает варианты параллельно: быстрее на пустой
+    выдаче, но каждый вариант — платный запрос к CSE, поэтому по умолчанию выключено (SEARCH_SPECULATIVE=1).
+    http — общий httpx.AsyncClient приложения; без него создаётся свой и закрывается в close().
+    """
+
+    def __init__(
+        self,
+        api_key: str | None,
+        cx: str | None,
+        cache_size: int = 512,
+        cache_ttl: float = 600.0,
+        speculative: bool = False,
+        timeout: float = 15.0,
+        base_url: str = CSE_URL,
+        http: httpx.AsyncClient | None = None,
+    ):
+        self.api_key = api_key
+        self.cx = cx
+        self.speculative = speculative
+        self.timeout = timeout
+        self.base_url = base_url
+        self.cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        self._http = http
+        self._own_http = http is None
+        self._latencies = deque(maxlen=1000)
+        self.searches = 0
+        self.errors = 0
+
+    @property
+    def http(self) -> httpx.AsyncClient:
+        if self._http is None:
+            self._http = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+            )
+        return self._http
+
+    async def close(self):
+        if self._http is not None and self._own_http:
+            await self._http.aclose()
+            self._http = None
+
+    @staticmethod
+    def variants(date_restrict: str | None):
+        """
+        Цепочка фолбэка в порядке приоритета:
+          1) любой язык + dateRestrict
+          2) любой язык, без ограничения свежести
+        """
+        chain = [(None, date_restrict)]
+        if date_restrict:
+            chain.append((None, None))
+        return chain
+
+    async def search(self, query: str, num_results: int = 8, date_restrict: str | None = "m6"):
+        if not self.api_key or not self.cx:
+            raise RuntimeError("Google CSE ключи не заданы (GOOGLE_CSE_API_KEY / GOOGLE_CSE_CX).")
+
+        started = time.monotonic()
+        self.searches += 1
+        try:
+            chain = self.variants(date_restrict)
+            if self.speculative and len(chain) > 1:
+                return await self._search_speculative(query, num_results, chain)
+            for lr, date in chain:
+                res = await self._cached_call(query, num_results, lr, date)
+                if res:
+                    return res
+            return []
+        finally:
+            self._latencies.append(time.monotonic() - started)
+
+    async def _search_speculative(self, query, num, chain):
+        """Все варианты стартуют сразу; берём первый непустой по приоритету, остальные отменяем."""
+        tasks = [
+            asyncio.create_task(self._cached_call(query, num, lr, date))
+            for lr, date in chain
+        ]
+        try:
+            for task in tasks:
+                res = await task
+                if res:
+                    return res
+            return []
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _cached_call(self, query, num, lr, date_restrict):
+        key = (normalize_query(query), max(1, min(num, 10)), lr, date_restrict)
+        cached = self.cache.get(key)
+        if cached is not None:
+            logger.info("CSE cache hit (lr=%s, date=%s)", lr, date_restrict)
+            return cached
+        res = await self._one_call(query, num, lr, date_restrict)
+        # ошибки не кэшируем, пустой ответ — кэшируем (это тоже ответ CSE)
+        if res is not None:
+            self.cache.set(key, res)
+        return res or []
+
+    async def _one_call(self, query: str, num: int, lr: str | None, date_restrict: str | None):
+        """Один вызов CSE + аккуратные логи. None — ошибка, [] — пустой ответ."""
+        params = {
+            "key": self.api_key,
+            "cx": self.cx,
+            "q": query,
+            "num": max(1, min(num, 10)),
+            "safe": "active",
+            "hl": "ru",
+        }
+        if lr:
+            params["lr"] = lr        # например, lang_ru
+        if date_restrict:
+            params["dateRestrict"] = date_restrict  # m6 / y1 / w4 / d7
+
+        try:
+            r = await self.http.get(self.base_url, params=params, timeout=self.timeout)
+            if r.status_code != 200:
+                self.errors += 1
+                logger.error("CSE HTTP %s: %s", r.status_code, r.text[:500])
+                return None
+            data = r.json()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.errors += 1
+            logger.exception("CSE request error: %s", e)
+            return None
+
+        items = []
+        for it in data.get("items", []) or []:
+            link = it.get("link", "")
+            if not link or _is_bad_domain(link):
+                continue
+            items.append({
+                "title": it.get("title", "Без названия"),
+                "link": link,
+                "snippet": it.get("snippet", "")
+            })
+        logger.info("CSE ok (lr=%s, date=%s): %d results", lr, date_restrict, len(items))
+        return items
+
+    def stats(self) -> dict:
+        return {
+            "searches": self.searches,
+            "errors": self.errors,
+            "cache_hits": self.cache.hits,
+            "cache_misses": self.cache.misses,
+            "cache_hit_rate": self.cache.hit_rate,
+            "p95_latency": _percentile(self._latencies, 95),
+        }
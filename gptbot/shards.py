@@ -0,0 +1,274 @@
+# shards.py
+import asyncio
+import json
+import queue
+import signal
+import threading
+import time
+
+import httpx
+from telegram import Update
+
+from .lifecycle import graceful_stop
+from .logger import setup_logger
+
+logger = setup_logger()
+
+# перезапуск упавшего воркера: 1, 2, 4 … до 60 с; проработавший минуту считается здоровым
+RESTART_BACKOFF = 1.0
+RESTART_BACKOFF_MAX = 60.0
+RESTART_STABLE_AFTER = 60.0
+
+# поля апдейта, у объекта в которых есть chat
+_CHAT_FIELDS = (
+    "message", "edited_message", "channel_post", "edited_channel_post",
+    "business_message", "edited_business_message", "my_chat_member", "chat_member",
+    "chat_join_request", "message_reaction", "message_reaction_count", "chat_boost", "removed_chat_boost",
+)
+
+
+def chat_id_of(data: dict) -> int | None:
+    """effective_chat.id по сырому JSON апдейта — супервизору не нужен Update.de_json."""
+    for field in _CHAT_FIELDS:
+        obj = data.get(field)
+        if obj and "chat" in obj:
+            return obj["chat"]["id"]
+    message = (data.get("callback_query") or {}).get("message")
+    if message and "chat" in message:
+        return message["chat"]["id"]
+    return None
+
+
+def user_id_of(data: dict) -> int | None:
+    """effective_user.id по сырому JSON апдейта."""
+    for obj in data.values():
+        if isinstance(obj, dict):
+            user = obj.get("from") or obj.get("user")
+            if isinstance(user, dict) and "id" in user:
+                return user["id"]
+    return None
+
+
+def shard_of(data: dict, shards: int) -> int:
+    """
+    Шард по отправителю: история, режим, лимиты и персональный бюджет хранятся по user_id,
+    и все апдейты пользователя — из лички и из группы — должны попадать в один воркер
+    с его LRU истории. Апдейты без отправителя (посты каналов) — по чату.
+    """
+    key = user_id_of(data)
+    if key is None:
+        key = chat_id_of(data)
+    return key % shards if key is not None else 0
+
+
+class Supervisor:
+    """
+    Приём апдейтов один раз (long polling или webhook) и раздача N процессам-воркерам
+    по effective_user.id (shard_of): апдейты одного пользователя всегда попадают в один процесс
+    в порядке приёма, а его история остаётся в LRU этого воркера. Очередь шарда принадлежит супервизору,
+    поэтому упавший воркер перезапускается и продолжает с того же места — с нарастающей паузой,
+    чтобы воркер, падающий на старте, не перезапускался в цикле.
+    target(index, inbox, *args) — точка входа воркера, см. serve_inbox.
+    """
+
+    def __init__(self, workers: int, target, args: tuple = ()):
+        # нужен только супервизору: одиночный бот и воркеры шардов его не импортируют
+        import multiprocessing
+
+        self.workers = max(1, workers)
+        self.target = target
+        self.args = args
+        self.ctx = multiprocessing.get_context("spawn")
+        self.inboxes = [self.ctx.Queue() for _ in range(self.workers)]
+        self.procs: list = [None] * self.workers
+        self.dispatched = [0] * self.workers
+        self.restarts = 0
+        self._stopping = False
+        self._started_at = [0.0] * self.workers
+        self._failures = [0] * self.workers
+        self._restart_at: list[float | None] = [None] * self.workers
+
+    def start(self):
+        for index in range(self.workers):
+            self._spawn(index)
+
+    def _spawn(self, index: int):
+        proc = self.ctx.Process(
+            target=self.target,
+            args=(index, self.inboxes[index], *self.args),
+            name=f"bot-shard-{index}",
+        )
+        proc.start()
+        self.procs[index] = proc
+        self._started_at[index] = time.monotonic()
+
+    def dispatch(self, data: dict, raw: str | None = None):
+        """Отправляет апдейт в очередь его шарда; raw — исходный JSON, чтобы не сериализовать заново."""
+        index = shard_of(data, self.workers)
+        self.inboxes[index].put(raw if raw is not None else json.dumps(data, ensure_ascii=False))
+        self.dispatched[index] += 1
+
+    def check(self, now: float | None = None):
+        """Перезапускает упавшие воркеры, каждый — после своей паузы (экспоненциальной, с потолком)."""
+        if self._stopping:
+            return
+        now = time.monotonic() if now is None else now
+        for index, proc in enumerate(self.procs):
+            if proc is None or proc.is_alive():
+                continue
+            if self._restart_at[index] is None:
+                if now - self._started_at[index] >= RESTART_STABLE_AFTER:
+                    self._failures[index] = 0
+                delay = min(RESTART_BACKOFF_MAX, RESTART_BACKOFF * 2 ** self._failures[index])
+                self._failures[index] += 1
+                self._restart_at[index] = now + delay
+                logger.error("shard %d exited with code %s, restarting in %.0fs", index, proc.exitcode, delay)
+            if now >= self._restart_at[index]:
+                self._restart_at[index] = None
+                self.restarts += 1
+                self._spawn(index)
+
+    def stop(self, timeout: float):
+        """None в конец каждой очереди: воркер доделывает всё, что уже принято, и выходит."""
+        self._stopping = True
+        for inbox in self.inboxes:
+            inbox.put(None)
+        deadline = time.monotonic() + timeout
+        for proc in self.procs:
+            if proc is not None:
+                proc.join(max(0.0, deadline - time.monotonic()))
+        for index, proc in enumerate(self.procs):
+            if proc is not None and proc.is_alive():
+                logger.warning("shard %d did not stop in %.0fs, terminating", index, timeout)
+                proc.terminate()
+                proc.join()
+
+    async def run(self, ingress, drain_timeout: float = 30.0):
+        """
+        ingress(dispatch, stop) — корутина приёма апдейтов (poll_updates или webhook.listen),
+        работает до stop. На SIGINT/SIGTERM сначала останавливается приём, затем воркеры.
+        """
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+
+        self.start()
+        logger.info("supervisor: %d shards started", self.workers)
+
+        async def watch():
+            while not stop.is_set():
+                self.check()
+                await asyncio.sleep(1.0)
+
+        watcher = asyncio.create_task(watch())
+        try:
+            await ingress(self.dispatch, stop)
+        finally:
+            stop.set()
+            watcher.cancel()
+            logger.info("supervisor: intake stopped, %d updates dispatched, stopping shards", sum(self.dispatched))
+            # воркеру нужен drain_timeout на хендлеры и немного на остановку Application
+            await asyncio.to_thread(self.stop, drain_timeout + 5)
+
+
+async def poll_updates(
+    token: str,
+    dispatch,
+    stop: asyncio.Event,
+    base_url: str = "https://api.telegram.org/bot",
+    timeout: int = 30,
+):
+    """
+    Long polling для супервизора: getUpdates сырым JSON, без разбора в объекты PTB.
+    offset подтверждается следующим запросом, поэтому при остановке делаем ещё один
+    getUpdates с timeout=0 — иначе Telegram пришлёт уже розданные апдейты повторно.
+    """
+    url = f"{base_url}{token}/"
+    offset = None
+    async with httpx.AsyncClient(timeout=httpx.Timeout(timeout + 10, connect=10)) as http:
+        await http.post(url + "deleteWebhook")
+        while not stop.is_set():
+            # form-urlencoded, как у PTB; массивы — JSON-строкой
+            params = {"timeout": timeout, "allowed_updates": json.dumps(Update.ALL_TYPES)}
+            if offset is not None:
+                params["offset"] = offset
+            fetch = asyncio.create_task(http.post(url + "getUpdates", data=params))
+            stopped = asyncio.create_task(stop.wait())
+            await asyncio.wait({fetch, stopped}, return_when=asyncio.FIRST_COMPLETED)
+            stopped.cancel()
+            if not fetch.done():
+                # не дождались ответа — эти апдейты не розданы, Telegram отдаст их после рестарта
+                fetch.cancel()
+                break
+            try:
+                body = fetch.result().json()
+            except (httpx.HTTPError, ValueError) as e:
+                logger.warning("supervisor: getUpdates failed: %s", e)
+                await asyncio.sleep(1.0)
+                continue
+            if not body.get("ok"):
+                logger.warning("supervisor: getUpdates error: %s", body.get("description"))
+                await asyncio.sleep(float((body.get("parameters") or {}).get("retry_after", 1)))
+                continue
+            for data in body["result"]:
+                dispatch(data)
+                offset = data["update_id"] + 1
+        if offset is not None:
+            try:
+                await http.post(url + "getUpdates", data={"offset": offset, "timeout": 0, "limit": 1})
+            except httpx.HTTPError as e:
+                logger.warning("supervisor: final offset commit failed: %s", e)
+
+
+async def serve_inbox(app, inbox, drain_timeout: float = 30.0):
+    """
+    Воркер шарда: Application без Updater, апдейты — из очереди супервизора.
+    None в очереди — штатная остановка после всего принятого; SIGTERM — аварийная:
+    непрочитанное из очереди уходит в drain и, если не успело, в checkpoint.
+    """
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    loop.add_signal_handler(signal.SIGTERM, stop.set)
+    # Ctrl+C получает вся группа процессов — останавливает нас супервизор, по порядку
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    def enqueue(raw: str):
+        app.update_queue.put_nowait(Update.de_json(json.loads(raw), app.bot))
+
+    closed = threading.Event()
+
+    def pump():
+        while not closed.is_set():
+            try:
+                raw = inbox.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            if raw is None:
+                loop.call_soon_threadsafe(stop.set)
+                return
+            loop.call_soon_threadsafe(enqueue, raw)
+
+    async with app:
+        if app.post_init:
+            await app.post_init(app)
+        await app.start()
+        reader = threading.Thread(target=pump, name="shard-inbox", daemon=True)
+        reader.start()
+        try:
+            await stop.wait()
+        finally:
+            closed.set()
+            await asyncio.to_thread(reader.join)
+            # колбэки enqueue, поставленные потоком до остановки, должны выполниться
+            await asyncio.sleep(0)
+            while True:
+                try:
+                    raw = inbox.get_nowait()
+                except queue.Empty:
+                    break
+                if raw is not None:
+                    enqueue(raw)
+            await graceful_stop(app, drain_timeout)
+    if app.post_shutdown:
+        await app.post_shutdown(app)
@@ -0,0 +1,202 @@
+# shared_state.py
+import asyncio
+import sqlite3
+import threading
+import time
+
+from .cache import TTLCache
+from .logger import setup_logger
+
+logger = setup_logger()
+
+_MISSING = object()
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS modes (
+    user_id INTEGER PRIMARY KEY,
+    mode    TEXT    NOT NULL
+);
+CREATE TABLE IF NOT EXISTS chat_models (
+    chat_id INTEGER PRIMARY KEY,
+    model   TEXT    NOT NULL
+);
+CREATE TABLE IF NOT EXISTS buckets (
+    user_id INTEGER PRIMARY KEY,
+    tokens  REAL    NOT NULL,
+    updated REAL    NOT NULL
+);
+"""
+
+
+class SharedState:
+    """
+    Состояние, которое видят все процессы-воркеры: режим пользователя (чат / веб-поиск),
+    модели, закреплённые за чатами (/model), и token bucket'ы лимитов запросов. Одна база SQLite (WAL) на машине;
+    операции короткие, а списание токена — одна транзакция BEGIN IMMEDIATE, поэтому
+    два воркера не могут потратить один и тот же токен.
+    """
+
+    def __init__(self, path: str, busy_timeout: float = 5.0, default_mode: str = "chat"):
+        self.path = path
+        self.default_mode = default_mode
+        # autocommit: транзакции открываем явно там, где нужна атомарность
+        self._conn = sqlite3.connect(path, timeout=busy_timeout, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+        self.modes = ModeMap(self)
+        self.chat_models = ChatModelMap(self)
+
+    # --------------------
+    # Режимы
+    # --------------------
+    def get_mode(self, user_id: int) -> str:
+        with self._lock:
+            row = self._conn.execute("SELECT mode FROM modes WHERE user_id = ?", (user_id,)).fetchone()
+        return row[0] if row else self.default_mode
+
+    def set_mode(self, user_id: int, mode: str):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO modes (user_id, mode) VALUES (?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET mode = excluded.mode",
+                (user_id, mode),
+            )
+
+    # --------------------
+    # Модели чатов
+    # --------------------
+    def get_chat_model(self, chat_id: int) -> str | None:
+        with self._lock:
+            row = self._conn.execute("SELECT model FROM chat_models WHERE chat_id = ?", (chat_id,)).fetchone()
+        return row[0] if row else None
+
+    def set_chat_model(self, chat_id: int, model: str | None):
+        with self._lock:
+            if model:
+                self._conn.execute(
+                    "INSERT INTO chat_models (chat_id, model) VALUES (?, ?) "
+                    "ON CONFLICT(chat_id) DO UPDATE SET model = excluded.model",
+                    (chat_id, model),
+                )
+            else:
+                self._conn.execute("DELETE FROM chat_models WHERE chat_id = ?", (chat_id,))
+
+    def count_chat_models(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM chat_models").fetchone()[0]
+
+    # --------------------
+    # Лимиты
+    # --------------------
+    def bucket(self, user_id: int, rate: float, capacity: float) -> "SharedBucket":
+        return SharedBucket(self, user_id, rate, capacity)
+
+    def reserve(self, user_id: int, rate: float, capacity: float) -> float:
+        """Как TokenBucket.reserve, но состояние в базе: секунды ожидания до появления токена."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT tokens, updated FROM buckets WHERE user_id = ?", (user_id,)).fetchone()
+                # стенные часы — monotonic у каждого процесса свои
+                now = time.time()
+                tokens = capacity if row is None else min(capacity, row[0] + max(0.0, now - row[1]) * rate)
+                tokens -= 1
+                self._conn.execute(
+                    "INSERT INTO buckets (user_id, tokens, updated) VALUES (?, ?, ?) "
+                    "ON CONFLICT(user_id) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated",
+                    (user_id, tokens, now),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return 0.0 if tokens >= 0 else -tokens / rate
+
+    def refund(self, user_id: int, capacity: float):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE buckets SET tokens = MIN(?, tokens + 1) WHERE user_id = ?",
+                (capacity, user_id),
+            )
+
+    def close(self):
+        self._conn.close()
+
+
+class ModeMap:
+    """
+    user_modes[user_id] / user_modes[user_id] = "web" поверх SharedState — как прежний defaultdict.
+    Режим читается на каждое сообщение, поэтому он кэшируется, а запись идёт сквозь кэш в базу:
+    апдейты пользователя шардируются по user_id, и его режим меняет только этот же воркер.
+    """
+
+    def __init__(self, state: SharedState, cache_size: int = 4096, cache_ttl: float = 3600.0):
+        self.state = state
+        self._cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+
+    def __getitem__(self, user_id: int) -> str:
+        mode = self._cache.get(user_id)
+        if mode is None:
+            mode = self.state.get_mode(user_id)
+            self._cache.set(user_id, mode)
+        return mode
+
+    def __setitem__(self, user_id: int, mode: str):
+        self.state.set_mode(user_id, mode)
+        self._cache.set(user_id, mode)
+
+
+class ChatModelMap:
+    """
+    Router.overrides поверх SharedState: /model в группе видят воркеры всех её участников.
+    Чтения кэшируются на cache_ttl секунд — смена модели доходит до соседних воркеров с этой задержкой.
+    """
+
+    def __init__(self, state: SharedState, cache_ttl: float = 5.0):
+        self.state = state
+        self._cache = TTLCache(maxsize=4096, ttl=cache_ttl)
+
+    def get(self, chat_id: int, default=None):
+        model = self._cache.get(chat_id, _MISSING)
+        if model is _MISSING:
+            model = self.state.get_chat_model(chat_id)
+            self._cache.set(chat_id, model)
+        return default if model is None else model
+
+    def __contains__(self, chat_id: int) -> bool:
+        return self.get(chat_id) is not None
+
+    def __setitem__(self, chat_id: int, model: str):
+        self.state.set_chat_model(chat_id, model)
+        self._cache.set(chat_id, model)
+
+    def pop(self, chat_id: int, default=None):
+        model = self.get(chat_id)
+        self.state.set_chat_model(chat_id, None)
+        self._cache.set(chat_id, None)
+        return default if model is None else model
+
+    def __len__(self):
+        return self.state.count_chat_models()
+
+
+class SharedBucket:
+    """
+    Интерфейс TokenBucket (reserve/refund) для Scheduler, состояние — в SharedState.
+    Методы асинхронные: BEGIN IMMEDIATE может ждать блокировку базы до busy_timeout,
+    и это ожидание уходит в поток, а не останавливает event loop.
+    """
+
+    def __init__(self, state: SharedState, user_id: int, rate: float, capacity: float):
+        self.state = state
+        self.user_id = user_id
+        self.rate = rate
+        self.capacity = capacity
+
+    async def reserve(self) -> float:
+        return await asyncio.to_thread(self.state.reserve, self.user_id, self.rate, self.capacity)
+
+    async def refund(self):
+        await asyncio.to_thread(self.state.refund, self.user_id, self.capacity)
@@ -0,0 +1,128 @@
+# startup.py
+"""
+Профиль старта (python gpt_bot.py --profile-startup): сколько заняли импорты модулей,
+сборка AppContext и Application и сколько прошло до первого запроса getUpdates.
+Модуль нарочно ничего не импортирует сверх stdlib — иначе он сам попал бы в замер.
+"""
+import builtins
+import sys
+import time
+
+FLAG = "--profile-startup"
+
+PROFILE = None
+
+
+class StartupProfile:
+    """
+    Время импорта — через обёртку над builtins.__import__: учитываются только модули,
+    которых ещё нет в sys.modules, время включительное (с вложенными импортами).
+    В отчёт идут внешние зависимости верхнего уровня — импортированные кодом бота (пакет gptbot)
+    или во время его работы, но не изнутри другой зависимости; в том числе отложенные.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.imports: list[tuple[str, float, int]] = []
+        self.marks: list[tuple[str, float]] = []
+        self.on_finish = None
+        self._depth = 0
+        self._import = None
+
+    def install(self):
+        self._import = builtins.__import__
+        builtins.__import__ = self._timed_import
+
+    def uninstall(self):
+        if self._import is not None:
+            builtins.__import__ = self._import
+            self._import = None
+
+    def _timed_import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        target = _resolve(name, globals, level)
+        fresh = [target] if target not in sys.modules else []
+        if not name and fromlist:
+            # from . import a, b — загружаются подмодули
+            fresh += [f"{target}.{item}" for item in fromlist if f"{target}.{item}" not in sys.modules]
+        if not fresh:
+            return self._import(name, globals, locals, fromlist, level)
+        label = ", ".join(fresh)
+        depth = self._depth
+        if not _is_bot(label):
+            self._depth += 1
+        started = time.perf_counter()
+        try:
+            return self._import(name, globals, locals, fromlist, level)
+        finally:
+            self._depth = depth
+            self.imports.append((label, time.perf_counter() - started, depth))
+
+    def mark(self, label: str):
+        self.marks.append((label, time.perf_counter()))
+
+    def finish(self):
+        """Первый getUpdates ушёл — замер окончен: отчёт в stderr и on_finish (остановка бота)."""
+        self.mark("первый getUpdates")
+        self.uninstall()
+        print(self.report(), file=sys.stderr, flush=True)
+        if self.on_finish is not None:
+            self.on_finish()
+
+    def report(self, top: int = 15) -> str:
+        end = self.marks[-1][1] if self.marks else time.perf_counter()
+        lines = [f"Старт до первого getUpdates: {(end - self.started) * 1000:.0f} ms"]
+        previous = self.started
+        for label, at in self.marks:
+            lines.append(f"  {label:<24}{(at - previous) * 1000:8.1f} ms")
+            previous = at
+
+        direct = sorted((i for i in self.imports if i[2] == 0 and not _is_bot(i[0])), key=lambda i: i[1], reverse=True)
+        lines.append(f"Внешние модули: {sum(i[1] for i in direct) * 1000:.0f} ms, самые дорогие:")
+        for name, seconds, _ in direct[:top]:
+            lines.append(f"  {name:<24}{seconds * 1000:8.1f} ms")
+        return "\n".join(lines)
+
+
+def _resolve(name: str, globals, level: int) -> str:
+    if not level:
+        return name
+    package = (globals or {}).get("__package__") or ""
+    base = package.rsplit(".", level - 1)[0]
+    return f"{base}.{name}" if name else base
+
+
+def _is_bot(name: str) -> bool:
+    return name == "gptbot" or name.startswith("gptbot.")
+
+
+def begin() -> StartupProfile | None:
+    """Включает профиль, если процесс запущен с --profile-startup; вызывать до остальных импортов."""
+    global PROFILE
+    if FLAG in sys.argv and PROFILE is None:
+        PROFILE = StartupProfile()
+        PROFILE.install()
+    return PROFILE
+
+
+def mark(label: str):
+    if PROFILE is not None:
+        PROFILE.mark(label)
+
+
+def probe_request(on_first):
+    """
+    Запрос для getUpdates, который сообщает о первом вызове: on_first() — в момент отправки,
+    то есть когда бот уже готов принимать апдейты (ответ long polling может ждать долго).
+    """
+    from telegram.request import HTTPXRequest
+
+    class ProbeRequest(HTTPXRequest):
+        fired = False
+
+        async def do_request(self, *args, **kwargs):
+            if not self.fired:
+                self.fired = True
+                on_first()
+            return await super().do_request(*args, **kwargs)
+
+    return ProbeRequest()
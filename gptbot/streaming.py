@@ -0,0 +1,131 @@
+# streaming.py
+import asyncio
+import time
+
+from telegram.constants import ParseMode
+from telegram.error import BadRequest, RetryAfter
+
+from .delivery import TELEGRAM_MAX_LEN, render_parts, retry_seconds, send_long
+from .logger import setup_logger
+
+logger = setup_logger()
+
+PLACEHOLDER = "⏳ …"
+
+# время последнего edit по каждому чату — общее для всех стримов в этом чате,
+# чтобы несколько параллельных ответов не превышали лимит Telegram на правки;
+# запись удаляется, когда в чате не остаётся активных стримов
+_last_edit_at: dict[int, float] = {}
+_active_streams: dict[int, int] = {}
+
+
+class StreamEditor:
+    """
+    Показывает ответ модели по мере генерации: отправляет заглушку,
+    затем редактирует её через edit_message_text, склеивая частые обновления.
+    """
+
+    def __init__(self, bot, message, min_interval: float = 1.0, min_delta: int = 40):
+        self.bot = bot
+        self.message = message
+        self.chat_id = message.chat_id
+        self.min_interval = min_interval
+        self.min_delta = min_delta
+        self.text = ""
+        self._shown = ""
+        self._placeholder = None
+        self._started_at = None
+        self.first_token_latency = None
+
+    async def start(self):
+        self._started_at = time.monotonic()
+        _active_streams[self.chat_id] = _active_streams.get(self.chat_id, 0) + 1
+        self._placeholder = await self.message.reply_text(PLACEHOLDER)
+
+    def close(self):
+        """Стрим чата закончен; последний закрывшийся убирает его время правки, если флуд-пауза уже прошла."""
+        left = _active_streams.get(self.chat_id, 1) - 1
+        if left > 0:
+            _active_streams[self.chat_id] = left
+            return
+        _active_streams.pop(self.chat_id, None)
+        if _last_edit_at.get(self.chat_id, 0.0) <= time.monotonic():
+            _last_edit_at.pop(self.chat_id, None)
+
+    async def push(self, delta: str):
+        self.text += delta
+        now = time.monotonic()
+
+        last = _last_edit_at.get(self.chat_id, 0.0)
+
+        # первый токен показываем сразу — это и есть time-to-first-token
+        if not self._shown:
+            if now >= last:
+                await self._edit(self.text)
+            return
+
+        if len(self.text) - len(self._shown) < self.min_delta:
+            return
+        if now - last < self.min_interval:
+            return
+        await self._edit(self.text)
+
+    async def finish(self) -> str:
+        """
+        Финальная правка с полным текстом в HTML, как у send_long; хвост длиннее лимита
+        уходит отдельными сообщениями по границам абзацев.
+        """
+        if not self.text:
+            await self._edit("Пустой ответ от модели.")
+            return self.text
+
+        (head, source), *tail = render_parts(self.text)
+        try:
+            await self._edit(head, final=True, parse_mode=ParseMode.HTML)
+        except BadRequest as e:
+            if "parse" not in str(e).lower():
+                raise
+            logger.warning("stream: HTML не принят (%s), правим текстом", e)
+            await self._edit(source, final=True)
+        for _, part in tail:
+            await send_long(self.message, part)
+        return self.text
+
+    async def _edit(self, text: str, final: bool = False, parse_mode: str | None = None):
+        visible = text[:TELEGRAM_MAX_LEN]
+        try:
+            await self.bot.edit_message_text(
+                visible,
+                chat_id=self.chat_id,
+                message_id=self._placeholder.message_id,
+                parse_mode=parse_mode,
+            )
+        except RetryAfter as e:
+            # флуд-контроль: на промежуточных правках просто пропускаем кадр
+            if not final:
+                _last_edit_at[self.chat_id] = time.monotonic() + retry_seconds(e)
+                return
+            await asyncio.sleep(retry_seconds(e))
+            await self._edit(text, final=True, parse_mode=parse_mode)
+            return
+        except BadRequest as e:
+            if "not modified" not in str(e).lower():
+                raise
+
+        _last_edit_at[self.chat_id] = time.monotonic()
+        if not self._shown and self._started_at is not None:
+            self.first_token_latency = time.monotonic() - self._started_at
+            logger.info("stream TTFT chat=%s: %.3fs", self.chat_id, self.first_token_latency)
+        self._shown = visible
+
+
+async def stream_reply(bot, message, chunks, min_interval: float = 1.0) -> str:
+    """Прокачивает поток кусков текста в сообщение Telegram и возвращает полный ответ."""
+    editor = StreamEditor(bot, message, min_interval=min_interval)
+    try:
+        await editor.start()
+        async for delta in chunks:
+            await editor.push(delta)
+        return await editor.finish()
+    finally:
+        editor.close()
@@ -0,0 +1,126 @@
+# tenants.py
+"""
+Несколько ботов в одном процессе (TENANTS_CONFIG=tenants.json):
+
+    {"tenants": [
+        {"name": "support", "TELEGRAM_TOKEN": "...", "BOT_USERNAME": "SupportBot",
+         "CHAT_ID": -1001234567890, "ADMINS": [1091992386], "BUDGET_HARD_LIMIT": 20},
+        {"name": "family", "TELEGRAM_TOKEN": "...", "BOT_USERNAME": "FamilyBot", "OPENAI_MODEL": "gpt-4o-mini"}
+    ]}
+
+Ключи тенанта — те же переменные, что у одиночного бота (регистр не важен), поверх окружения процесса.
+Базы (история, расходы, общее состояние), checkpoint и состояние батчей у каждого свои:
+history-<name>.sqlite3 и т.д. Клиент OpenAI, поиск с кэшем, пулы процессов (SharedClients) общие
+у тенантов с одинаковыми ключами OpenAI и CSE (context.credentials); у кого ключи свои — свои
+и клиенты, расход уходит на его аккаунт. Лимиты и кэши общего набора берутся у первого его тенанта.
+Реестр метрик один на процесс.
+"""
+import json
+import os
+import re
+
+from .config import BASE_DIR, Config
+from .context import AppContext, SharedClients, credentials
+from .logger import setup_logger
+
+logger = setup_logger()
+
+# у каждого тенанта свой файл: история, бюджеты и лимиты не смешиваются
+PER_TENANT_PATHS = {
+    "HISTORY_DB": "history.sqlite3",
+    "LEDGER_DB": "usage.sqlite3",
+    "STATE_DB": "state.sqlite3",
+    "UPDATE_CHECKPOINT": "pending_updates",
+    "BATCH_STATE": "batch_state.json",
+}
+# имя попадает в пути файлов и метки метрик
+_NAME = re.compile(r"[A-Za-z0-9_]+")
+# из окружения процесса тенантам не наследуются: это настройки одного конкретного бота
+_NOT_INHERITED = (*PER_TENANT_PATHS, "ACCESS_CONFIG", "SHARD_INDEX", "TENANT_NAME")
+
+
+def tenant_path(default: str, name: str) -> str:
+    root, ext = os.path.splitext(default)
+    return os.path.join(BASE_DIR, f"{root}-{name}{ext}")
+
+
+def _env_value(value) -> str:
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, (list, tuple, set)):
+        return ",".join(str(v) for v in value)
+    return str(value)
+
+
+def load_configs(path: str, env=None) -> list[Config]:
+    """Config на каждого тенанта из файла; env — окружение процесса (по умолчанию os.environ после load_dotenv)."""
+    if env is None:
+        from dotenv import load_dotenv
+
+        load_dotenv()
+        env = os.environ
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    entries = data["tenants"] if isinstance(data, dict) else data
+    if not entries:
+        raise ValueError(f"{path}: не описано ни одного тенанта")
+
+    base = {k: v for k, v in env.items() if k not in _NOT_INHERITED}
+    configs, names, tokens = [], set(), set()
+    for i, entry in enumerate(entries, 1):
+        overrides = {key.upper(): _env_value(value) for key, value in entry.items()}
+        name = overrides.pop("NAME", "") or f"bot{i}"
+        if not _NAME.fullmatch(name):
+            raise ValueError(f"{path}: имя тенанта {name!r} — только латиница, цифры и _")
+        if name in names:
+            raise ValueError(f"{path}: тенант {name} описан дважды")
+        tenant_env = dict(base, TENANT_NAME=name)
+        tenant_env.update({key: tenant_path(default, name) for key, default in PER_TENANT_PATHS.items()})
+        tenant_env.update(overrides)
+        config = Config.from_env(tenant_env)
+        if config.telegram_token in tokens:
+            raise ValueError(f"{path}: у тенанта {name} тот же TELEGRAM_TOKEN, что у другого")
+        names.add(name)
+        tokens.add(config.telegram_token)
+        configs.append(config)
+    return configs
+
+
+class TenantRegistry:
+    """
+    SharedClients на каждый набор ключей API и по AppContext на тенанта.
+    Закрытие — как у AppContext: shutdown() в loop, close() после.
+    """
+
+    def __init__(self, configs: list[Config]):
+        groups: dict[tuple, list[Config]] = {}
+        for config in configs:
+            groups.setdefault(credentials(config), []).append(config)
+        labelled = len(groups) > 1
+        self.shared: dict[tuple, SharedClients] = {}
+        self.contexts: dict[str, AppContext] = {}
+        for key, members in groups.items():
+            shared = self.shared[key] = SharedClients(members[0], name=members[0].name if labelled else "")
+            for config in members:
+                self.contexts[config.name] = AppContext(config, shared=shared)
+        logger.info(
+            "tenants: %s; client sets: %d",
+            ", ".join(self.contexts), len(self.shared),
+        )
+
+    def __iter__(self):
+        return iter(self.contexts.values())
+
+    def __len__(self):
+        return len(self.contexts)
+
+    async def shutdown(self):
+        # хранилища тенантов сбрасывает их on_shutdown; здесь — только общие клиенты
+        for shared in self.shared.values():
+            await shared.shutdown()
+
+    def close(self):
+        for ctx in self.contexts.values():
+            ctx.close()
+        for shared in self.shared.values():
+            shared.close()
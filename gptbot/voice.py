@@ -0,0 +1,74 @@
+# voice.py
+import asyncio
+import io
+from datetime import timedelta
+
+from .logger import setup_logger
+
+logger = setup_logger()
+
+
+def _ogg_to_wav(data: bytes) -> bytes:
+    """Транскодинг OGG/Opus → WAV в памяти. Выполняется в отдельном процессе."""
+    from pydub import AudioSegment
+
+    out = io.BytesIO()
+    AudioSegment.from_file(io.BytesIO(data), format="ogg").export(out, format="wav")
+    return out.getvalue()
+
+
+def duration_seconds(duration) -> float:
+    """Длительность голосового в секундах: PTB отдаёт int или timedelta (в зависимости от версии и настроек)."""
+    if duration is None:
+        return 0.0
+    if isinstance(duration, timedelta):
+        return duration.total_seconds()
+    return float(duration)
+
+
+class VoicePipeline:
+    """
+    Голосовые без временных файлов: скачиваем в буфер и отдаём в whisper как есть (OGG/Opus).
+    Если включён transcode — конвертация в WAV уходит в пул процессов, а не в event loop.
+    """
+
+    def __init__(self, llm, transcode: bool = False, workers: int = 2, model: str = "whisper-1"):
+        self.llm = llm
+        self.transcode = transcode
+        self.workers = workers
+        self.model = model
+        self._pool = None
+
+    @property
+    def pool(self):
+        if self._pool is None:
+            # concurrent.futures.process тянет multiprocessing — только когда пул действительно нужен
+            from concurrent.futures import ProcessPoolExecutor
+
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self._pool
+
+    async def download(self, voice) -> bytes:
+        tg_file = await voice.get_file()
+        buf = io.BytesIO()
+        await tg_file.download_to_memory(buf)
+        return buf.getvalue()
+
+    async def transcribe(self, voice) -> str:
+        return await self.transcribe_bytes(await self.download(voice))
+
+    async def transcribe_bytes(self, data: bytes) -> str:
+        if self.transcode:
+            loop = asyncio.get_running_loop()
+            data = await loop.run_in_executor(self.pool, _ogg_to_wav, data)
+            upload = ("voice.wav", data, "audio/wav")
+        else:
+            upload = ("voice.ogg", data, "audio/ogg")
+
+        transcript = await self.llm.transcribe(upload, model=self.model)
+        return transcript.text.strip()
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
@@ -0,0 +1,126 @@
+# webhook.py
+import asyncio
+import hmac
+import json
+import signal
+
+from telegram import Bot, Update
+
+from .http_listener import Response, start_server
+from .lifecycle import graceful_stop
+from .logger import setup_logger
+
+logger = setup_logger()
+
+SECRET_HEADER = "x-telegram-bot-api-secret-token"
+
+
+class WebhookServer:
+    """
+    Приём апдейтов от Telegram: проверка секретного токена,
+    разбор JSON и постановка в очередь Application. Отвечаем сразу, обработка — асинхронно.
+    dispatch(data, raw) вместо очереди — для супервизора шардов, у которого нет своего Application.
+    Без секрета порт принимал бы поддельные апдейты от кого угодно (в том числе «от админа»),
+    поэтому секрет обязателен.
+    """
+
+    def __init__(self, app, secret_token: str | None, path: str = "/telegram", dispatch=None):
+        if not secret_token:
+            raise ValueError("webhook: secret_token обязателен")
+        self.app = app
+        self.dispatch = dispatch
+        self.secret_token = secret_token
+        self.path = path
+        self.accepted = 0
+        self.rejected = 0
+
+    async def handle(self, req):
+        if req.path != self.path:
+            return Response(404, "not found")
+        if req.method != "POST":
+            return Response(405, "method not allowed")
+        if not hmac.compare_digest(
+            req.headers.get(SECRET_HEADER, ""), self.secret_token
+        ):
+            self.rejected += 1
+            logger.warning("webhook: bad secret token")
+            return Response(403, "forbidden")
+
+        try:
+            data = json.loads(req.body)
+            if self.dispatch is not None:
+                self.dispatch(data, req.body.decode())
+            else:
+                await self.app.update_queue.put(Update.de_json(data, self.app.bot))
+        except (ValueError, TypeError, KeyError):
+            return Response(400, "bad update")
+
+        self.accepted += 1
+        return Response(200, "ok")
+
+
+async def register_webhook(bot: Bot, url: str, secret_token: str | None):
+    await bot.set_webhook(url, secret_token=secret_token or None, allowed_updates=Update.ALL_TYPES)
+    logger.info("webhook registered: %s", url)
+
+
+async def register(token: str, url: str, secret_token: str | None, base_url: str = "https://api.telegram.org/bot"):
+    """Разовая регистрация вебхука отдельным Bot — для супервизора, у которого нет своего Application."""
+    async with Bot(token, base_url=base_url) as bot:
+        await register_webhook(bot, url, secret_token)
+
+
+async def serve(
+    app,
+    host: str,
+    port: int,
+    path: str = "/telegram",
+    secret_token: str | None = None,
+    webhook_url: str | None = None,
+    drain_timeout: float = 30.0,
+):
+    """
+    Запускает Application без Updater и слушает webhook до SIGINT/SIGTERM.
+    webhook_url=None — не регистрировать вебхук (он уже зарегистрирован).
+    При остановке сначала закрывается порт, затем хендлеры дорабатывают до drain_timeout.
+    """
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    async with app:
+        if app.post_init:
+            await app.post_init(app)
+        await app.start()
+        if webhook_url:
+            await register_webhook(app.bot, webhook_url, secret_token)
+
+        server = await start_server(WebhookServer(app, secret_token, path).handle, host, port)
+        logger.info("webhook listening on %s:%s%s", host, port, path)
+        try:
+            await stop.wait()
+        finally:
+            server.close()
+            await server.wait_closed()
+            await graceful_stop(app, drain_timeout)
+    if app.post_shutdown:
+        await app.post_shutdown(app)
+
+
+async def listen(
+    dispatch,
+    stop: asyncio.Event,
+    host: str,
+    port: int,
+    path: str = "/telegram",
+    secret_token: str | None = None,
+):
+    """Приём вебхука супервизором: апдейты уходят в dispatch, пока не выставлен stop."""
+    server = await start_server(WebhookServer(None, secret_token, path, dispatch=dispatch).handle, host, port)
+    logger.info("webhook listening on %s:%s%s (supervisor)", host, port, path)
+    try:
+        await stop.wait()
+    finally:
+        server.close()
+        await server.wait_closed()
@@ -0,0 +1,19 @@
+import pytest
+
+from gptbot.config import Config
+from gptbot.context import AppContext
+
+
+@pytest.fixture
+def ctx(tmp_path):
+    """AppContext на временных базах; клиенты OpenAI и HTTP создаются лениво, сети нет."""
+    config = Config.from_env({
+        "TELEGRAM_TOKEN": "1:test",
+        "OPENAI_API_KEY": "test",
+        "HISTORY_DB": str(tmp_path / "history.sqlite3"),
+        "LEDGER_DB": str(tmp_path / "usage.sqlite3"),
+        "STATE_DB": str(tmp_path / "state.sqlite3"),
+    })
+    app_ctx = AppContext(config)
+    yield app_ctx
+    app_ctx.close()
@@ -0,0 +1,83 @@
+import asyncio
+import json
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from gptbot.admission import Admission
+from gptbot.lifecycle import DrainingUpdateProcessor
+
+GROUP = -100500
+
+
+def make_update(user_id, chat_id, chat_type="supergroup", text=None, reply_from=None):
+    reply = SimpleNamespace(from_user=SimpleNamespace(username=reply_from)) if reply_from else None
+    message = SimpleNamespace(text=text, caption=None, reply_to_message=reply)
+    return SimpleNamespace(
+        effective_user=SimpleNamespace(id=user_id),
+        effective_chat=SimpleNamespace(id=chat_id, type=chat_type),
+        effective_message=message,
+        message=message,
+    )
+
+
+def test_only_addressed_updates_are_admitted():
+    gate = Admission({1}, GROUP, "TestBot")
+
+    assert gate.admit(make_update(1, 1, "private", "hi"))
+    assert not gate.admit(make_update(2, 2, "private", "hi"))
+    assert gate.admit(make_update(5, GROUP, text="эй, @testbot, привет"))
+    assert gate.admit(make_update(5, GROUP, text="а дальше?", reply_from="TestBot"))
+    assert not gate.admit(make_update(5, GROUP, text="всем привет", reply_from="someone"))
+    assert not gate.admit(make_update(5, -1, text="@TestBot"))
+    assert (gate.admitted, gate.dropped) == (3, 3)
+
+
+def test_access_config_is_reloaded_on_change(tmp_path):
+    path = tmp_path / "access.json"
+    path.write_text(json.dumps({"admins": [1], "chat_id": GROUP}))
+    reloads = []
+    gate = Admission({99}, 0, "TestBot", config_path=str(path), reload_interval=0, on_reload=reloads.append)
+    assert gate.admins == {1} and gate.chat_id == GROUP
+
+    path.write_text(json.dumps({"admins": [2], "limited_users": [7], "bot_username": "OtherBot"}))
+    os.utime(path, (1, 1))
+    assert gate.admit(make_update(2, 2, "private"))
+    assert gate.limited == {7} and gate.bot_username == "OtherBot"
+
+    # битый файл — остаются прежние настройки
+    path.write_text("{not json")
+    os.utime(path, (2, 2))
+    assert not gate.maybe_reload()
+    assert gate.admins == {2}
+    assert len(reloads) == 2
+
+
+@pytest.mark.asyncio
+async def test_processor_drops_rejected_updates_before_dispatch():
+    from telegram import Update
+
+    gate = Admission({1}, GROUP, "TestBot")
+    processor = DrainingUpdateProcessor(4, admit=gate.admit)
+    ran = []
+
+    async def dispatch(tag):
+        ran.append(tag)
+
+    noise = Update.de_json({
+        "update_id": 1,
+        "message": {"message_id": 1, "date": 0, "chat": {"id": GROUP, "type": "supergroup"},
+                    "from": {"id": 5, "is_bot": False, "first_name": "T"}, "text": "обед?"},
+    }, None)
+    addressed = Update.de_json({
+        "update_id": 2,
+        "message": {"message_id": 2, "date": 0, "chat": {"id": GROUP, "type": "supergroup"},
+                    "from": {"id": 5, "is_bot": False, "first_name": "T"}, "text": "@TestBot обед?"},
+    }, None)
+
+    async with processor:
+        await processor.process_update(noise, dispatch("noise"))
+        await processor.process_update(addressed, dispatch("addressed"))
+    await asyncio.sleep(0)
+    assert ran == ["addressed"]
@@ -0,0 +1,133 @@
+import io
+import zipfile
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+from gptbot.attachments import (
+    AttachmentPipeline,
+    DownloadFailed,
+    FileTooLarge,
+    document_kind,
+    extract_document,
+    fit_to_budget,
+    pick_photo,
+    vision_size,
+)
+
+
+def _docx(paragraphs: list[str]) -> bytes:
+    ns = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+    body = "".join(f"<w:p><w:r><w:t>{p}</w:t></w:r></w:p>" for p in paragraphs)
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as z:
+        z.writestr("word/document.xml", f'<w:document xmlns:w="{ns}"><w:body>{body}</w:body></w:document>')
+    return buf.getvalue()
+
+
+class FakeAttachment:
+    def __init__(self, data: bytes, unique_id: str = "u1", file_name=None, mime_type=None, file_size=None):
+        self.data = data
+        self.file_unique_id = unique_id
+        self.file_name = file_name
+        self.mime_type = mime_type
+        self.file_size = file_size
+        self.downloads = 0
+
+    async def get_file(self):
+        self.downloads += 1
+        return SimpleNamespace(file_path=f"https://files.test/{self.file_unique_id}")
+
+
+def _pipeline(files: dict[str, bytes], **kwargs) -> AttachmentPipeline:
+    pipeline = AttachmentPipeline(**kwargs)
+
+    def handler(request):
+        name = request.url.path.rsplit("/", 1)[-1]
+        if name not in files:
+            return httpx.Response(404)
+        return httpx.Response(200, content=files[name])
+
+    pipeline._http = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return pipeline
+
+
+def test_photo_size_is_the_smallest_that_vision_keeps():
+    sizes = [SimpleNamespace(width=w, height=h) for w, h in ((90, 68), (320, 240), (800, 600), (1280, 960))]
+    assert vision_size(4000, 3000) == (1024, 768)
+    assert pick_photo(sizes).width == 1280
+    assert pick_photo(sizes, detail="low").width == 800
+
+
+def test_document_text_extraction_stops_at_limit():
+    assert document_kind("report.DOCX", None) == "docx"
+    assert document_kind("notes", "text/plain") == "text"
+    assert document_kind("clip.mp4", "video/mp4") is None
+
+    data = _docx([f"Абзац номер {i}" for i in range(1000)])
+    text = extract_document(data, "docx", max_chars=100)
+    assert text.startswith("Абзац номер 0\nАбзац номер 1")
+    assert len(text) == 100
+
+    assert extract_document("привет".encode("cp1251"), "text", 100) == "привет"
+
+
+def test_long_document_is_cut_to_relevant_chunks():
+    paragraphs = [f"Раздел {i}: " + "общие слова " * 60 for i in range(30)]
+    paragraphs[17] = "Раздел 17: гарантийный срок составляет три года " + "общие слова " * 50
+    text, truncated = fit_to_budget("gpt-4o-mini", "\n".join(paragraphs), max_tokens=600, query="какой гарантийный срок?")
+    assert truncated
+    assert "гарантийный срок составляет три года" in text
+    assert text.startswith("Раздел 0")
+
+    short, truncated = fit_to_budget("gpt-4o-mini", "коротко", max_tokens=600)
+    assert (short, truncated) == ("коротко", False)
+
+
+@pytest.mark.asyncio
+async def test_download_is_capped_and_results_are_cached_by_unique_id():
+    doc = FakeAttachment(_docx(["Первый абзац", "Второй абзац"]), "doc1", file_name="a.docx")
+    big = FakeAttachment(b"x" * 5000, "big", file_name="b.txt")
+    pipeline = _pipeline({"doc1": doc.data, "big": big.data}, max_bytes=1000)
+    try:
+        assert await pipeline.document_text(doc) == "Первый абзац\nВторой абзац"
+        assert await pipeline.document_text(doc) == "Первый абзац\nВторой абзац"
+        assert doc.downloads == 1
+
+        with pytest.raises(FileTooLarge):
+            await pipeline.document_text(big)
+        # размер известен заранее — даже getFile не вызывается
+        with pytest.raises(FileTooLarge):
+            await pipeline.download(FakeAttachment(b"", "huge", file_size=10_000))
+    finally:
+        await pipeline.close()
+
+
+@pytest.mark.asyncio
+async def test_download_error_does_not_leak_the_file_url():
+    class TokenAttachment(FakeAttachment):
+        async def get_file(self):
+            return SimpleNamespace(file_path="https://files.test/file/bot123:SECRET/documents/gone.txt")
+
+    pipeline = _pipeline({})
+    try:
+        with pytest.raises(DownloadFailed) as info:
+            await pipeline.download(TokenAttachment(b"", "gone"))
+        assert "SECRET" not in str(info.value) and "404" in str(info.value)
+        assert info.value.__suppress_context__
+    finally:
+        await pipeline.close()
+
+
+@pytest.mark.asyncio
+async def test_cache_is_bounded_by_total_size():
+    files = {f"t{i}": b"x" * 400 for i in range(3)}
+    pipeline = _pipeline(files, cache_bytes=1000)
+    try:
+        for i in range(3):
+            await pipeline.document_text(FakeAttachment(files[f"t{i}"], f"t{i}", file_name="a.txt"))
+        assert len(pipeline.cache) == 2 and pipeline.cache.weight == 800
+        assert pipeline.cache.get(("text", "t0")) is None
+    finally:
+        await pipeline.close()
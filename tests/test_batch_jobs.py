@@ -0,0 +1,83 @@
+import pytest
+import pytest_asyncio
+from openai import AsyncOpenAI
+
+from gptbot import metrics
+from gptbot.batch_jobs import BatchQueue
+from bench.stubs import StubBackends
+from gptbot.http_listener import start_server
+
+
+@pytest_asyncio.fixture
+async def batch_api():
+    stubs = StubBackends(openai_latency=0, answer="Краткое содержание.")
+    server = await start_server(stubs.openai, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    client = AsyncOpenAI(api_key="test", base_url=f"http://127.0.0.1:{port}/v1", max_retries=0)
+    yield client, stubs
+    await client.close()
+    server.close()
+
+
+@pytest.mark.asyncio
+async def test_batch_roundtrip_writes_results_back(batch_api, tmp_path):
+    client, stubs = batch_api
+    state = str(tmp_path / "batch.json")
+    queue = BatchQueue(client, state)
+    results = {}
+
+    async def apply(meta, content):
+        results[meta["user_id"]] = content
+
+    queue.register("fold", apply)
+    for user_id in (1, 2):
+        body = {"model": "gpt-4o-mini", "messages": [{"role": "user", "content": f"диалог {user_id}"}]}
+        assert queue.submit("fold", body, meta={"user_id": user_id}, key=f"fold:{user_id}")
+    # пока задача не выполнена, дубль не ставится
+    assert not queue.submit("fold", {}, key="fold:1")
+
+    assert await queue.flush()
+    # очередь и отправленные батчи переживают рестарт (остановка дожидается записи — AppContext.shutdown)
+    await queue.save()
+    queue = BatchQueue(client, state)
+    queue.register("fold", apply)
+    assert queue.stats()["in_batches"] == 2
+
+    spent = []
+    hook = lambda model, user_id, usage, batch: spent.append((user_id, batch))
+    metrics.add_usage_hook(hook)
+    try:
+        await queue.poll()
+        assert results == {}
+        await queue.poll()
+    finally:
+        metrics.remove_usage_hook(hook)
+    # расход свёртки записывается на пользователя, чью историю сворачивали
+    assert sorted(spent) == [(1, True), (2, True)]
+
+    assert results == {1: "Краткое содержание.", 2: "Краткое содержание."}
+    assert queue.stats() == {"pending": 0, "batches": 0, "in_batches": 0, "completed": 2, "failed": 0}
+    assert stubs.calls["openai.chat"] == 0
+
+
+@pytest.mark.asyncio
+async def test_flush_waits_for_size_or_age(tmp_path):
+    queue = BatchQueue(None, str(tmp_path / "batch.json"), max_batch=2, flush_interval=3600)
+    queue.submit("warm", {})
+    assert not queue.due()
+    queue.submit("warm", {})
+    assert queue.due()
+
+
+@pytest.mark.asyncio
+async def test_submit_saves_state_off_the_loop(tmp_path):
+    path = tmp_path / "batch.json"
+    queue = BatchQueue(None, str(path))
+    for i in range(3):
+        queue.submit("warm", {"n": i}, key=f"warm:{i}")
+    # в event loop файл не пишется — запись ушла фоновой задачей
+    assert not path.exists()
+    await queue.save()
+
+    restored = BatchQueue(None, str(path))
+    assert [item["body"]["n"] for item in restored.pending] == [0, 1, 2]
@@ -0,0 +1,30 @@
+from bench.replay import build_update, load_corpus, run_benchmark
+
+
+def test_corpus_builds_valid_updates():
+    from telegram import Update
+
+    for i, entry in enumerate(load_corpus(), 1):
+        update = Update.de_json(build_update(entry, i), None)
+        assert update.effective_chat.id == entry["chat"]["id"]
+
+
+def test_replay_smoke():
+    report = run_benchmark(
+        load_corpus(),
+        repeat=1,
+        openai_latency=0.01,
+        transcribe_latency=0.01,
+        cse_latency=0.01,
+        telegram_latency=0.0,
+    )
+
+    handlers = report["handlers"]
+    assert set(handlers) == {"handle_text", "handle_voice", "handle_attachment", "do_web_search", "search_cmd", "ignored"}
+    assert report["updates_per_sec"] > 0
+    # каждый адресованный боту апдейт получил ответ
+    assert report["backend_calls"]["telegram.sendMessage"] == sum(
+        st["count"] for name, st in handlers.items() if name != "ignored"
+    )
+    # веб-поиск действительно дошёл до CSE, а не измерял путь с ошибкой
+    assert report["backend_calls"]["cse"] > 0
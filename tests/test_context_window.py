@@ -0,0 +1,63 @@
+from types import SimpleNamespace
+
+import pytest
+
+from gptbot import metrics
+from gptbot.context_window import ContextBuilder, count_tokens, message_tokens
+from gptbot.history import HistoryStore
+
+MODEL = "gpt-4o"
+
+
+def turn(role, content):
+    return {"role": role, "content": content}
+
+
+def test_newest_turns_are_packed_into_budget():
+    history = [turn("user", f"сообщение номер {i} " * 20) for i in range(10)]
+    budget = sum(message_tokens(MODEL, m) for m in history[-3:]) + 50
+    builder = ContextBuilder(budget_tokens=budget)
+
+    messages, dropped = builder.build(MODEL, history, "вопрос")
+
+    assert messages[-1] == turn("user", "вопрос")
+    assert messages[:-1] == history[-3:]
+    assert dropped == history[:-3]
+
+
+def test_short_turns_keep_more_context_than_fixed_deque():
+    history = [turn("user", "ок") for _ in range(30)]
+    messages, dropped = ContextBuilder(budget_tokens=3000).build(MODEL, history, "и?")
+    assert len(messages) == 31
+    assert dropped == []
+
+
+def test_oversized_user_message_is_truncated():
+    builder = ContextBuilder(budget_tokens=200)
+    messages, _ = builder.build(MODEL, [], "лог " * 5000)
+    assert count_tokens(MODEL, messages[-1]["content"]) <= 210
+
+
+@pytest.mark.asyncio
+async def test_fold_records_summary_usage_for_the_user(tmp_path):
+    usage = SimpleNamespace(prompt_tokens=100, completion_tokens=20)
+
+    class FakeLLM:
+        async def chat(self, model, messages, **kwargs):
+            message = SimpleNamespace(content="кратко")
+            return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=usage)
+
+    store = HistoryStore(str(tmp_path / "h.sqlite3"), max_turns=10)
+    spent = []
+    hook = lambda model, user_id, u, batch: spent.append((model, user_id, u))
+    metrics.add_usage_hook(hook)
+    try:
+        for i in range(4):
+            store.append(5, "user", f"ход {i}")
+        dropped = store.get(5)[:2]
+        await ContextBuilder(summary_model="gpt-4o-mini", llm=FakeLLM()).fold(store, 5, dropped)
+    finally:
+        metrics.remove_usage_hook(hook)
+        store.close()
+
+    assert spent == [("gpt-4o-mini", 5, usage)]
@@ -0,0 +1,65 @@
+import asyncio
+
+import httpx
+import pytest
+
+from gptbot.deep_search import DeepSearch, extract_text
+
+PAGE = (
+    "<html><head><script>var x = 1;</script></head><body><nav>Меню сайта</nav>"
+    "<p>Курс евро на сегодня установлен Центробанком на уровне девяносто рублей за один евро.</p>"
+    "<p>Погода в другом городе никак не связана с валютным рынком и этим вопросом вообще.</p>"
+    "</body></html>"
+)
+
+
+def make_deep(tmp_path, handler, **kwargs):
+    deep = DeepSearch(str(tmp_path), workers=0, **kwargs)
+    deep._http = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return deep
+
+
+def test_extract_text_drops_scripts_and_menus():
+    text = extract_text(PAGE.encode(), "text/html; charset=utf-8")
+    assert "Центробанком" in text
+    assert "var x" not in text
+    assert "Меню сайта" not in text
+
+
+@pytest.mark.asyncio
+async def test_pages_cached_by_etag(tmp_path):
+    seen = []
+
+    def handler(request):
+        seen.append(request.headers.get("if-none-match"))
+        if request.headers.get("if-none-match") == '"v1"':
+            return httpx.Response(304)
+        return httpx.Response(200, text=PAGE, headers={"content-type": "text/html", "etag": '"v1"'})
+
+    deep = make_deep(tmp_path, handler)
+    results = [{"link": "https://a.example/page"}]
+    first = await deep.enrich("курс евро", results)
+    second = await deep.enrich("курс евро", results)
+    await deep.close()
+
+    assert first == second
+    assert "Центробанком" in first[0][1]
+    assert seen == [None, '"v1"']
+
+
+@pytest.mark.asyncio
+async def test_slow_host_does_not_block_past_deadline(tmp_path):
+    async def handler(request):
+        if request.url.host == "slow.example":
+            await asyncio.sleep(5)
+        return httpx.Response(200, text=PAGE, headers={"content-type": "text/html"})
+
+    deep = make_deep(tmp_path, handler, total_timeout=0.3)
+    results = [{"link": "https://slow.example/"}, {"link": "https://fast.example/"}]
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    pages = await deep.enrich("курс евро", results)
+    await deep.close()
+
+    assert loop.time() - started < 1.0
+    assert {url for url, _ in pages} == {"https://fast.example/"}
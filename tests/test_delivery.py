@@ -0,0 +1,70 @@
+from types import SimpleNamespace
+
+import pytest
+from telegram.error import BadRequest, RetryAfter
+
+from gptbot import delivery
+from gptbot.delivery import markdown_to_html, send_long, split_message
+
+
+class FakeMessage:
+    def __init__(self, fail_with=None):
+        self.chat_id = 1
+        self.sent = []
+        self.fail_with = list(fail_with or [])
+
+    async def reply_text(self, text, parse_mode=None, **kwargs):
+        if self.fail_with:
+            raise self.fail_with.pop(0)
+        self.sent.append((text, parse_mode, kwargs))
+        return SimpleNamespace(message_id=len(self.sent))
+
+
+def test_split_keeps_paragraphs_and_code_blocks():
+    code = "```python\n" + "print(1)\n" * 600 + "```"
+    text = "Вступление.\n\n" + "слово " * 700 + "\n\n" + code + "\n\nИтог."
+
+    parts = split_message(text, limit=4096)
+
+    assert all(len(p) <= 4096 for p in parts)
+    assert parts[0].startswith("Вступление.")
+    assert parts[-1].endswith("Итог.")
+    # каждая часть с кодом открывает и закрывает блок
+    for p in parts:
+        assert p.count("```") % 2 == 0
+
+
+def test_markdown_to_html_escapes_and_formats():
+    html = markdown_to_html("**Итог**: a < b, `x<y>` и [док](https://e.com/?a=1&b=2)\n\n```\n<tag>\n```")
+
+    assert "<b>Итог</b>" in html
+    assert "a &lt; b" in html
+    assert "<code>x&lt;y&gt;</code>" in html
+    assert '<a href="https://e.com/?a=1&amp;b=2">док</a>' in html
+    assert "<pre><code>&lt;tag&gt;</code></pre>" in html
+
+
+@pytest.mark.asyncio
+async def test_send_long_backs_off_on_flood_control(monkeypatch):
+    slept = []
+
+    async def fake_sleep(delay):
+        slept.append(delay)
+
+    monkeypatch.setattr(delivery.asyncio, "sleep", fake_sleep)
+    message = FakeMessage(fail_with=[RetryAfter(3)])
+
+    sent = await send_long(message, "абзац\n\n" * 1500)
+
+    assert slept == [3.0]
+    assert len(sent) == len(message.sent) > 1
+    assert "".join(t for t, _, _ in message.sent).count("абзац") == 1500
+
+
+@pytest.mark.asyncio
+async def test_send_long_falls_back_to_plain_text_on_parse_error():
+    message = FakeMessage(fail_with=[BadRequest("Can't parse entities: unsupported start tag")])
+
+    await send_long(message, "**жирный**")
+
+    assert message.sent == [("**жирный**", None, {})]
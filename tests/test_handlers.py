@@ -3,16 +3,12 @@ import asyncio
 from unittest.mock import AsyncMock, MagicMock
 
 
-from gpt_bot import (
+from gptbot.config import ADMINS, BOT_USERNAME, CHAT_ID
+from gptbot.handlers import (
     start,
     help_cmd,
     set_model,
     handle_text,
-    is_allowed,
-    ADMINS,
-    CHAT_ID,
-    BOT_USERNAME,
-    current_model,
 )
 
 class DummyUser:
@@ -41,38 +37,47 @@ class DummyUpdate:
         self.message = DummyMessage(text=text, caption=caption)
 
 @pytest.mark.asyncio
-async def test_start_admin():
+async def test_start_admin(ctx):
     update = DummyUpdate(user_id=list(ADMINS)[0], chat_id=CHAT_ID)
     context = MagicMock()
-    await start(update, context)
+    await start(ctx, update, context)
     assert any("сменить модель" in r for r in update.message.replies)
 
 
-def test_is_allowed_admin():
+def test_is_allowed_admin(ctx):
     update = DummyUpdate(user_id=list(ADMINS)[0], chat_id=CHAT_ID)
-    assert is_allowed(update)
+    assert ctx.is_allowed(update)
 
-def test_is_allowed_group_with_mention():
+def test_is_allowed_group_with_mention(ctx):
     update = DummyUpdate(user_id=999999, chat_id=CHAT_ID, chat_type="group", text=f"@{BOT_USERNAME}")
-    assert is_allowed(update)
+    assert ctx.is_allowed(update)
 
-def test_is_allowed_group_without_mention():
+def test_is_allowed_group_without_mention(ctx):
     update = DummyUpdate(user_id=999999, chat_id=CHAT_ID, chat_type="group", text="Привет")
-    assert not is_allowed(update)
+    assert not ctx.is_allowed(update)
 
 @pytest.mark.asyncio
-async def test_help_command_admin():
+async def test_help_command_admin(ctx):
     update = DummyUpdate(user_id=list(ADMINS)[0], chat_id=CHAT_ID)
     context = MagicMock()
-    await help_cmd(update, context)
+    await help_cmd(ctx, update, context)
     assert any("/quota" in r for r in update.message.replies)
 
 @pytest.mark.asyncio
-async def test_set_model_as_admin():
+async def test_set_model_as_admin(ctx):
     update = DummyUpdate(user_id=list(ADMINS)[0], chat_id=CHAT_ID, text="/model gpt-3.5-turbo")
     context = MagicMock()
     context.args = ["gpt-3.5-turbo"]
-    await set_model(update, context)
+    await set_model(ctx, update, context)
     assert "gpt-3.5-turbo" in update.message.replies[0]
 
 
+
+@pytest.mark.asyncio
+async def test_hard_budget_skips_paid_routing(ctx):
+    update = DummyUpdate(user_id=list(ADMINS)[0], chat_id=CHAT_ID, text="сложный вопрос")
+    ctx.ledger.hard_limit = 0.0
+    ctx.router.route = AsyncMock()
+    await handle_text(ctx, update, MagicMock())
+    ctx.router.route.assert_not_called()
+    assert "Лимит бюджета" in update.message.replies[0]
@@ -0,0 +1,76 @@
+import pytest
+
+from gptbot.history import HistoryStore
+
+
+def test_history_survives_restart(tmp_path):
+    db = str(tmp_path / "h.sqlite3")
+    store = HistoryStore(db, max_turns=4)
+    store.append(1, "user", "привет")
+    store.append(1, "assistant", "здравствуйте")
+    store.close()
+
+    restarted = HistoryStore(db, max_turns=4)
+    assert restarted.get(1) == [
+        {"role": "user", "content": "привет"},
+        {"role": "assistant", "content": "здравствуйте"},
+    ]
+    restarted.close()
+
+
+def test_idle_users_are_evicted_and_lazily_reloaded(tmp_path):
+    store = HistoryStore(str(tmp_path / "h.sqlite3"), max_turns=2, max_users_in_memory=2)
+    for uid in (1, 2, 3):
+        # append базу не читает — в память пользователя поднимает чтение
+        store.get(uid)
+        for i in range(3):
+            store.append(uid, "user", f"{uid}-{i}")
+
+    assert len(store) == 2  # пользователь 1 вытеснен из памяти
+    assert [t["content"] for t in store.get(1)] == ["1-1", "1-2"]
+    store.close()
+
+
+def test_clear(tmp_path):
+    store = HistoryStore(str(tmp_path / "h.sqlite3"))
+    store.append(7, "user", "x")
+    store.clear(7)
+    store.flush()
+    assert store.get(7) == []
+    store.close()
+
+
+@pytest.mark.asyncio
+async def test_aget_loads_cold_user_with_its_pending_writes(tmp_path):
+    store = HistoryStore(str(tmp_path / "h.sqlite3"), max_turns=3, max_users_in_memory=1)
+    try:
+        await store.aget(1)
+        store.append(1, "user", "a")
+        store.append(1, "assistant", "c")
+        await store.aget(2)  # пользователь 1 вытеснен, его записи ещё могут быть в очереди
+        store.append(2, "user", "b")
+        assert len(store) == 1
+
+        assert await store.aget(1) == [
+            {"role": "user", "content": "a"},
+            {"role": "assistant", "content": "c"},
+        ]
+        store.flush()
+        assert store._pending == {}
+    finally:
+        store.close()
+
+
+@pytest.mark.asyncio
+async def test_append_to_evicted_user_does_not_read_the_database(tmp_path):
+    store = HistoryStore(str(tmp_path / "h.sqlite3"), max_turns=3, max_users_in_memory=1)
+    try:
+        await store.aget(1)
+        await store.aget(2)  # 1 вытеснен между чтением истории и ответом
+        store._load = None  # синхронная подгрузка в event loop упала бы здесь
+        store.append(1, "assistant", "ответ")
+        assert 1 not in store._mem
+        del store._load
+        assert await store.aget(1) == [{"role": "assistant", "content": "ответ"}]
+    finally:
+        store.close()
@@ -1,5 +1,5 @@
 from types import SimpleNamespace
-from gpt_bot import is_allowed, ADMINS, CHAT_ID
+from gptbot.config import ADMINS, CHAT_ID
 
 def make_fake_update(user_id, chat_type, chat_id, text=None, caption=None):
     return SimpleNamespace(
@@ -8,18 +8,18 @@ def make_fake_update(user_id, chat_type, chat_id, text=None, caption=None):
         message=SimpleNamespace(text=text, caption=caption)
     )
 
-def test_admin_private_allowed():
+def test_admin_private_allowed(ctx):
     update = make_fake_update(user_id=list(ADMINS)[0], chat_type="private", chat_id=123)
-    assert is_allowed(update)
+    assert ctx.is_allowed(update)
 
-def test_group_mention_required():
+def test_group_mention_required(ctx):
     update = make_fake_update(user_id=999999, chat_type="supergroup", chat_id=CHAT_ID, text="Привет @DunaevAssistentBot")
-    assert is_allowed(update)
+    assert ctx.is_allowed(update)
 
-def test_group_without_mention_denied():
+def test_group_without_mention_denied(ctx):
     update = make_fake_update(user_id=999999, chat_type="supergroup", chat_id=CHAT_ID, text="Привет")
-    assert not is_allowed(update)
+    assert not ctx.is_allowed(update)
 
-def test_other_group_denied():
+def test_other_group_denied(ctx):
     update = make_fake_update(user_id=999999, chat_type="supergroup", chat_id=11111, text="Привет @DunaevAssistentBot")
-    assert not is_allowed(update)
+    assert not ctx.is_allowed(update)
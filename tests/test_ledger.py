@@ -0,0 +1,90 @@
+from types import SimpleNamespace
+
+import pytest
+
+from gptbot import metrics
+from gptbot.ledger import UsageLedger, load_prices
+
+
+def usage(prompt, completion):
+    return SimpleNamespace(prompt_tokens=prompt, completion_tokens=completion)
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    led = UsageLedger(str(tmp_path / "usage.sqlite3"), flush_interval=0.01)
+    yield led
+    led.close()
+
+
+def test_cost_uses_longest_model_prefix(ledger):
+    mini = ledger.record("gpt-4o-mini-2024-07-18", 1, usage(1_000_000, 0))
+    full = ledger.record("gpt-4o-2024-08-06", 1, usage(1_000_000, 0))
+    batched = ledger.record("gpt-4o", 2, usage(0, 1_000_000), batch=True)
+
+    assert mini == pytest.approx(0.15)
+    assert full == pytest.approx(2.5)
+    assert batched == pytest.approx(5.0)
+    assert ledger.summary()["users"][0] == ("2", pytest.approx(5.0))
+
+
+def test_totals_survive_restart(tmp_path):
+    path = str(tmp_path / "usage.sqlite3")
+    led = UsageLedger(path, flush_interval=0.01)
+    led.record("gpt-4o", 7, usage(1000, 500))
+    led.record_audio("whisper-1", 7, 60)
+    led.close()
+
+    reopened = UsageLedger(path)
+    try:
+        assert reopened.total == pytest.approx(0.0025 + 0.005 + 0.006)
+        assert reopened.by_model["gpt-4o"][:2] == [1000, 500]
+    finally:
+        reopened.close()
+
+
+def test_budget_limits(tmp_path):
+    led = UsageLedger(str(tmp_path / "usage.sqlite3"), soft_limit=1.0, hard_limit=2.0, user_hard_limit=0.5)
+    try:
+        assert led.check(1) == "ok"
+        led.record("gpt-4o", 1, usage(0, 60_000))  # $0.60 у пользователя 1
+        assert led.check(1) == "hard"
+        assert led.check(2) == "ok"
+        led.record("gpt-4o", 3, usage(0, 50_000))  # общий расход $1.10
+        assert led.check(2) == "soft"
+    finally:
+        led.close()
+
+
+def test_prices_override_and_usage_hook(ledger):
+    ledger.prices = load_prices('{"local-llama": [0, 0], "gpt-4o": [5, 20]}')
+    metrics.add_usage_hook(ledger.record)
+    try:
+        metrics.record_usage("gpt-4o", 1, usage(1_000_000, 0))
+    finally:
+        metrics._usage_hooks.remove(ledger.record)
+
+    assert ledger.total == pytest.approx(5.0)
+    assert ledger.price("local-llama") == (0, 0)
+
+
+def test_workers_share_one_budget(tmp_path):
+    path = str(tmp_path / "usage.sqlite3")
+    a = UsageLedger(path, hard_limit=1.0, flush_interval=0.01, refresh_interval=0)
+    b = UsageLedger(path, hard_limit=1.0, flush_interval=0.01, refresh_interval=0)
+    try:
+        a.record("gpt-4o", 1, usage(0, 60_000))  # $0.60 в воркере a
+        b.record("gpt-4o", 2, usage(0, 60_000))  # $0.60 в воркере b
+        assert a.check(3) == b.check(3) == "ok"  # каждый по отдельности под лимитом
+        a.flush()
+        b.flush()
+        assert a.stale() and b.stale()
+        a.refresh()
+        b.refresh()
+        b.refresh()  # повторное чтение ничего не добавляет, свои строки не считаются дважды
+        assert a.total == pytest.approx(1.2) and b.total == pytest.approx(1.2)
+        assert a.check(3) == b.check(3) == "hard"
+        assert a.by_user == pytest.approx({"1": 0.6, "2": 0.6})
+    finally:
+        a.close()
+        b.close()
@@ -0,0 +1,113 @@
+import asyncio
+import json
+import os
+import time
+from types import SimpleNamespace
+
+import pytest
+from telegram import Update
+
+from gptbot.lifecycle import DrainingUpdateProcessor, cleanup_temp, restore_checkpoint
+
+
+async def _handler(delay, done):
+    await asyncio.sleep(delay)
+    done.append(delay)
+
+
+@pytest.mark.asyncio
+async def test_drain_waits_for_inflight_handlers(tmp_path):
+    processor = DrainingUpdateProcessor(4, checkpoint_path=str(tmp_path / "pending"))
+    done = []
+    tasks = [asyncio.create_task(processor.process_update(Update(i), _handler(0.05, done))) for i in range(3)]
+    await asyncio.sleep(0)
+
+    saved = await processor.drain(asyncio.Queue(), timeout=2)
+
+    assert saved == 0
+    assert len(done) == 3
+    assert all(t.done() for t in tasks)
+    assert not list(tmp_path.iterdir())
+
+
+@pytest.mark.asyncio
+async def test_unfinished_updates_are_checkpointed_and_restored(tmp_path):
+    checkpoint = str(tmp_path / "pending")
+    processor = DrainingUpdateProcessor(4, checkpoint_path=checkpoint)
+    done = []
+    fast = asyncio.create_task(processor.process_update(Update(1), _handler(0.01, done)))
+    slow = asyncio.create_task(processor.process_update(Update(2), _handler(10, done)))
+    queue = asyncio.Queue()
+    await queue.put(Update(3))
+    await asyncio.sleep(0)
+
+    started = time.monotonic()
+    saved = await processor.drain(queue, timeout=0.2)
+
+    assert time.monotonic() - started < 2
+    assert saved == 2
+    assert fast.done() and slow.cancelled()
+
+    app = SimpleNamespace(update_queue=asyncio.Queue(), bot=None)
+    assert await restore_checkpoint(app, checkpoint) == 2
+    restored = sorted([app.update_queue.get_nowait().update_id for _ in range(2)])
+    assert restored == [2, 3]
+    # повторный старт ничего не восстанавливает
+    assert await restore_checkpoint(app, checkpoint) == 0
+
+
+@pytest.mark.asyncio
+async def test_updates_waiting_for_a_slot_are_checkpointed(tmp_path):
+    checkpoint = str(tmp_path / "pending")
+    processor = DrainingUpdateProcessor(1, checkpoint_path=checkpoint)
+    done = []
+    slow = asyncio.create_task(processor.process_update(Update(1), _handler(10, done)))
+    waiting = [asyncio.create_task(processor.process_update(Update(i), _handler(0, done))) for i in (2, 3)]
+    await asyncio.sleep(0)
+
+    saved = await processor.drain(asyncio.Queue(), timeout=0.1)
+    await asyncio.gather(*waiting)
+
+    assert saved == 3
+    assert slow.cancelled() and done == []
+    app = SimpleNamespace(update_queue=asyncio.Queue(), bot=None)
+    assert await restore_checkpoint(app, checkpoint) == 3
+
+
+def test_cleanup_removes_only_stale_temp_files(tmp_path):
+    stale = [tmp_path / "pending_updates-12.json.tmp", tmp_path / "0a1b.json.12.345.tmp"]
+    fresh = tmp_path / "state.json.tmp"
+    # не наши: чужой *.tmp и голосовые — не трогаем, даже старые
+    foreign = [tmp_path / "notes.tmp", tmp_path / "voice.ogg"]
+    keep = tmp_path / "notes.txt"
+    old = time.time() - 3600
+    for path in (*stale, fresh, *foreign, keep):
+        path.write_bytes(b"x")
+    for path in (*stale, *foreign):
+        os.utime(path, (old, old))
+
+    assert cleanup_temp(str(tmp_path)) == 2
+    assert not any(path.exists() for path in stale)
+    assert fresh.exists() and keep.exists() and all(path.exists() for path in foreign)
+
+
+@pytest.mark.asyncio
+async def test_restore_takes_only_its_own_checkpoints(tmp_path):
+    base = str(tmp_path / "pending")
+    # одиночный бот, тенант «a», процесс с базой pending-a-b и шарды 0 и 1 в одном каталоге
+    for name, update_id in (
+        ("pending-11", 1), ("pending-a-12", 2), ("pending-a-b-13", 3), ("pending-0-14", 4), ("pending-1-15", 5),
+    ):
+        (tmp_path / f"{name}.json").write_text(json.dumps([{"update_id": update_id}]))
+
+    async def restore(path):
+        app = SimpleNamespace(update_queue=asyncio.Queue(), bot=None)
+        await restore_checkpoint(app, path)
+        return [app.update_queue.get_nowait().update_id for _ in range(app.update_queue.qsize())]
+
+    assert await restore(f"{base}-a") == [2]
+    assert await restore(base) == [1]
+    assert await restore(f"{base}-a-b") == [3]
+    # шард (Config.shard_suffix) берёт только свой файл
+    assert await restore(f"{base}-1") == [5]
+    assert await restore(f"{base}-0") == [4]
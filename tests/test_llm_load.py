@@ -0,0 +1,101 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from openai import AsyncOpenAI
+
+from gptbot.llm import AsyncLLM
+
+DELAY = 0.3
+
+
+class FakeCompletionHandler(BaseHTTPRequestHandler):
+    """Локальный стаб /v1/chat/completions с фиксированной задержкой; считает пик одновременных запросов."""
+
+    lock = threading.Lock()
+    active = 0
+    peak = 0
+
+    @classmethod
+    def reset(cls):
+        with cls.lock:
+            cls.active = cls.peak = 0
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        cls = type(self)
+        with cls.lock:
+            cls.active += 1
+            cls.peak = max(cls.peak, cls.active)
+        try:
+            time.sleep(DELAY)
+        finally:
+            with cls.lock:
+                cls.active -= 1
+        payload = json.dumps({
+            "id": "chatcmpl-test",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "gpt-test"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": "ok"},
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def fake_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeCompletionHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/v1"
+    server.shutdown()
+    server.server_close()
+
+
+async def _run_chats(base_url, n, max_concurrency):
+    client = AsyncOpenAI(api_key="test", base_url=base_url, max_retries=0)
+    llm = AsyncLLM(client, max_concurrency=max_concurrency)
+    messages = [{"role": "user", "content": "привет"}]
+    # прогрев: ленивые импорты SDK и первое соединение не должны попасть в замер
+    await llm.chat("gpt-test", messages)
+    FakeCompletionHandler.reset()
+    start = time.perf_counter()
+    results = await asyncio.gather(*(llm.chat("gpt-test", messages) for _ in range(n)))
+    elapsed = time.perf_counter() - start
+    await client.close()
+    assert all(r.choices[0].message.content == "ok" for r in results)
+    return elapsed
+
+
+@pytest.mark.asyncio
+async def test_parallel_chats_take_about_one_delay(fake_server):
+    n = 8
+    elapsed = await _run_chats(fake_server, n, max_concurrency=n)
+    # все запросы были на сервере одновременно — стенное время на загруженной машине не показатель
+    assert FakeCompletionHandler.peak == n
+    # последовательная версия заняла бы n * DELAY; запас — половина от неё
+    assert elapsed < n * DELAY / 2
+
+
+@pytest.mark.asyncio
+async def test_concurrency_ceiling_is_respected(fake_server):
+    elapsed = await _run_chats(fake_server, 4, max_concurrency=2)
+    assert FakeCompletionHandler.peak == 2
+    assert elapsed >= DELAY * 2
@@ -0,0 +1,135 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from gptbot import metrics
+from gptbot.llm import AsyncLLM, parse_fallbacks
+
+
+class StatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+class FakeClient:
+    """Имитация AsyncOpenAI: script[i] — исключение или задержка для i-го вызова."""
+
+    def __init__(self, script=(), delay=0.0):
+        self.script = list(script)
+        self.delay = delay
+        self.calls = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, model, messages, **kwargs):
+        self.calls.append(model)
+        step = self.script.pop(0) if self.script else self.delay
+        if isinstance(step, Exception):
+            raise step
+        await asyncio.sleep(step)
+        return SimpleNamespace(model=model, n=len(self.calls))
+
+
+MESSAGES = [{"role": "user", "content": "привет"}]
+
+
+@pytest.mark.asyncio
+async def test_transient_errors_are_retried():
+    client = FakeClient([StatusError(429), StatusError(502)])
+    llm = AsyncLLM(client, retries=2, backoff=0.001)
+
+    resp = await llm.chat("gpt-4o", MESSAGES)
+
+    assert resp.n == 3
+
+
+@pytest.mark.asyncio
+async def test_client_errors_are_not_retried():
+    client = FakeClient([StatusError(400)])
+    llm = AsyncLLM(client, retries=3, backoff=0.001, fallbacks=[(None, "gpt-4o-mini")])
+
+    with pytest.raises(StatusError):
+        await llm.chat("gpt-4o", MESSAGES)
+    assert client.calls == ["gpt-4o"]
+
+
+@pytest.mark.asyncio
+async def test_falls_back_in_order_after_retries():
+    primary = FakeClient([StatusError(503)] * 2)
+    local = FakeClient()
+    llm = AsyncLLM(primary, retries=1, backoff=0.001, fallbacks=[(local, "llama3")])
+
+    resp = await llm.chat("gpt-4o", MESSAGES)
+
+    assert primary.calls == ["gpt-4o", "gpt-4o"]
+    assert resp.model == "llama3"
+
+
+@pytest.mark.asyncio
+async def test_hung_call_hits_deadline_and_retries():
+    client = FakeClient([5.0])
+    llm = AsyncLLM(client, timeout=0.05, retries=1, backoff=0.001)
+
+    started = time.perf_counter()
+    resp = await llm.chat("gpt-4o", MESSAGES)
+
+    assert resp.n == 2
+    assert time.perf_counter() - started < 1.0
+
+
+@pytest.mark.asyncio
+async def test_slow_call_is_hedged():
+    client = FakeClient(delay=0.01)
+    llm = AsyncLLM(client, hedge_percentile=95, hedge_min_samples=5, hedge_min_delay=0.05)
+    for _ in range(5):
+        await llm.chat("gpt-4o", MESSAGES)
+
+    client.script = [2.0, 0.01]
+    started = time.perf_counter()
+    resp = await llm.chat("gpt-4o", MESSAGES)
+
+    assert time.perf_counter() - started < 1.0
+    assert resp.n == 7
+
+
+@pytest.mark.asyncio
+async def test_embed_is_retried_and_reported():
+    usage = SimpleNamespace(prompt_tokens=7, total_tokens=7)
+    attempts = []
+
+    async def create(model, input):
+        attempts.append(model)
+        if len(attempts) == 1:
+            raise StatusError(503)
+        return SimpleNamespace(data=[SimpleNamespace(embedding=[0.1, 0.2])], usage=usage)
+
+    llm = AsyncLLM(SimpleNamespace(embeddings=SimpleNamespace(create=create)), retries=1, backoff=0.001)
+    spent = []
+    hook = lambda model, user_id, u, batch: spent.append((model, user_id, u))
+    metrics.add_usage_hook(hook)
+    try:
+        assert await llm.embed("text-embedding-3-small", "вопрос") == [0.1, 0.2]
+    finally:
+        metrics.remove_usage_hook(hook)
+
+    assert len(attempts) == 2
+    assert spent == [("text-embedding-3-small", "cache", usage)]
+
+
+def test_parse_fallbacks_shares_clients_per_endpoint():
+    made = []
+
+    def make_client(base_url):
+        made.append(base_url)
+        return base_url
+
+    targets = parse_fallbacks("gpt-4o-mini, llama3@http://localhost:11434/v1, @http://localhost:11434/v1", make_client)
+
+    assert targets == [
+        (None, "gpt-4o-mini"),
+        ("http://localhost:11434/v1", "llama3"),
+        ("http://localhost:11434/v1", None),
+    ]
+    assert made == ["http://localhost:11434/v1"]
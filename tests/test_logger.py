@@ -0,0 +1,25 @@
+import json
+import logging
+
+from gptbot.logger import JsonFormatter, Payload, payload, request_id
+
+
+def test_payload_is_truncated_lazily():
+    big = "x" * (Payload.limit + 50)
+    text = str(payload(big))
+    assert text.startswith("x" * Payload.limit)
+    assert text.endswith("<+50 chars>")
+
+
+def test_json_record_carries_request_id():
+    token = request_id.set("u42")
+    try:
+        record = logging.LogRecord("gptbot", logging.INFO, __file__, 1, "ответ: %s", (payload("ok"),), None)
+        record.request_id = request_id.get()
+    finally:
+        request_id.reset(token)
+
+    data = json.loads(JsonFormatter().format(record))
+    assert data["request_id"] == "u42"
+    assert data["msg"] == "ответ: ok"
+    assert data["level"] == "INFO"
@@ -0,0 +1,34 @@
+import httpx
+import pytest
+
+from gptbot.metrics import Registry, serve
+
+
+def test_histogram_and_counter_exposition():
+    reg = Registry()
+    hist = reg.histogram("t_seconds", "help", ("stage",), buckets=(0.1, 1.0))
+    hist.observe(0.05, stage="llm")
+    hist.observe(0.5, stage="llm")
+    reg.counter("t_errors_total", "help", ("handler",)).inc(handler="handle_text")
+    reg.gauge("t_queue", "help", lambda: 3)
+
+    text = reg.render()
+    assert 't_seconds_bucket{stage="llm",le="0.1"} 1' in text
+    assert 't_seconds_bucket{stage="llm",le="+Inf"} 2' in text
+    assert 't_seconds_count{stage="llm"} 2' in text
+    assert 't_errors_total{handler="handle_text"} 1.0' in text
+    assert "t_queue 3.0" in text
+
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint():
+    reg = Registry()
+    reg.counter("t_total", "help").inc()
+    server = await serve("127.0.0.1", 0, registry=reg)
+    port = server.sockets[0].getsockname()[1]
+    async with httpx.AsyncClient() as http:
+        resp = await http.get(f"http://127.0.0.1:{port}/metrics")
+    server.close()
+    await server.wait_closed()
+    assert resp.status_code == 200
+    assert "t_total 1.0" in resp.text
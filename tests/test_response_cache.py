@@ -0,0 +1,52 @@
+from types import SimpleNamespace
+
+import pytest
+
+from gptbot.llm import AsyncLLM
+from gptbot.response_cache import ResponseCache
+
+VECTORS = {
+    "какая столица франции": [1.0, 0.0, 0.1],
+    "столица франции это": [0.99, 0.0, 0.12],
+    "рецепт борща": [0.0, 1.0, 0.0],
+}
+
+
+class FakeEmbeddings:
+    async def create(self, model, input):
+        return SimpleNamespace(data=[SimpleNamespace(embedding=VECTORS[input.lower().strip("?")])])
+
+
+def FakeLLM():
+    # эмбеддинги идут через AsyncLLM.embed — с его потолком и повторами
+    return AsyncLLM(SimpleNamespace(embeddings=FakeEmbeddings()))
+
+
+@pytest.mark.asyncio
+async def test_exact_hit_after_normalization():
+    cache = ResponseCache(enabled=True)
+    assert await cache.lookup("gpt-4o", "Какая столица Франции?") is None
+    await cache.store("gpt-4o", "Какая столица Франции?", "Париж", tokens=50)
+
+    assert await cache.lookup("gpt-4o", "какая   столица франции") == "Париж"
+    assert await cache.lookup("gpt-4o-mini", "какая столица франции") is None
+    assert cache.stats()["tokens_saved"] == 50
+
+
+@pytest.mark.asyncio
+async def test_semantic_tier_matches_paraphrase_only():
+    cache = ResponseCache(enabled=True, llm=FakeLLM(), embedding_model="emb")
+    await cache.lookup("gpt-4o", "какая столица франции")
+    await cache.store("gpt-4o", "какая столица франции", "Париж")
+
+    assert await cache.lookup("gpt-4o", "столица франции это") == "Париж"
+    assert await cache.lookup("gpt-4o", "рецепт борща") is None
+    assert cache.stats()["semantic_hits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_disabled_and_history_bypass():
+    cache = ResponseCache(enabled=False)
+    await cache.store("m", "q", "a")
+    assert await cache.lookup("m", "q") is None
+    assert not ResponseCache.cacheable([{"role": "assistant", "content": "x"}, {"role": "user", "content": "q"}])
@@ -0,0 +1,107 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from gptbot.router import Router
+
+
+class FakeLLM:
+    def __init__(self, answer='{"level": "hard", "web": false}', delay=0.0):
+        self.answer = answer
+        self.delay = delay
+        self.calls = []
+
+    async def chat(self, model, messages, **kwargs):
+        self.calls.append(model)
+        await asyncio.sleep(self.delay)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=self.answer))],
+            usage=None,
+        )
+
+
+def make_router(llm=None, **kwargs):
+    return Router(
+        llm or FakeLLM(),
+        "gpt-4o",
+        cheap_model="gpt-4o-mini",
+        strong_model="gpt-4o",
+        decision_model="gpt-4o-mini",
+        enabled=True,
+        **kwargs,
+    )
+
+
+@pytest.mark.asyncio
+async def test_short_prompt_goes_to_cheap_model_without_classifier():
+    llm = FakeLLM()
+    router = make_router(llm)
+
+    route = await router.route(1, 1, "Привет, как дела?")
+
+    assert route.model == "gpt-4o-mini"
+    assert route.web is False
+    assert llm.calls == []
+    assert router.audit[-1]["model"] == "gpt-4o-mini"
+
+
+@pytest.mark.asyncio
+async def test_hard_and_web_prompts():
+    router = make_router()
+
+    code = await router.route(1, 1, "Напиши функцию на python для сортировки")
+    web = await router.route(1, 1, "Найди в интернете курс евро")
+
+    assert code.model == "gpt-4o"
+    assert web.web is True
+
+
+@pytest.mark.asyncio
+async def test_ambiguous_prompt_uses_decision_model_once():
+    llm = FakeLLM()
+    router = make_router(llm, short_chars=10)
+    text = "Расскажи, чем отличаются разные виды чая и как их заваривать"
+
+    first = await router.route(1, 1, text)
+    second = await router.route(2, 2, text)
+
+    assert first.model == second.model == "gpt-4o"
+    assert first.source == "decision"
+    assert llm.calls == ["gpt-4o-mini"]
+
+
+@pytest.mark.asyncio
+async def test_slow_classifier_falls_back_to_default():
+    router = make_router(FakeLLM(delay=1), short_chars=10, decision_timeout=0.05)
+
+    route = await router.route(1, 1, "Расскажи что-нибудь интересное про космос")
+
+    assert route.model == "gpt-4o"
+    assert route.source == "default"
+
+
+@pytest.mark.asyncio
+async def test_model_override_is_per_chat():
+    router = make_router()
+    router.set_model(10, "gpt-5")
+
+    assert (await router.route(10, 1, "Привет")).model == "gpt-5"
+    assert (await router.route(11, 1, "Привет")).model == "gpt-4o-mini"
+
+    router.set_model(10, None)
+    assert router.model_for(10) == "gpt-4o"
+
+
+@pytest.mark.asyncio
+async def test_routing_off_keeps_the_original_web_trigger():
+    llm = FakeLLM()
+    router = make_router(llm)
+    router.enabled = False
+
+    ordinary = await router.route(1, 1, "Что пишут в интернете о новом iPhone?")
+    explicit = await router.route(1, 1, "Найди в интернете расписание электричек")
+    assert (ordinary.web, explicit.web) == (False, True)
+    assert ordinary.source == "default" and not llm.calls
+    # и с маршрутизацией голое «в интернете» — не явная просьба
+    assert not Router.wants_web("что пишут в интернете о погоде на Марсе")
@@ -0,0 +1,81 @@
+import asyncio
+
+import pytest
+
+from gptbot.scheduler import RateLimited, Scheduler
+from gptbot.shared_state import SharedState
+
+
+@pytest.mark.asyncio
+async def test_round_robin_across_chats():
+    sched = Scheduler(max_concurrency=1, user_rate=100, user_burst=100)
+    order = []
+    gate = asyncio.Event()
+
+    async def job(chat_id, user_id, tag):
+        async with sched.slot(chat_id, user_id):
+            order.append(tag)
+            await gate.wait()
+
+    first = asyncio.create_task(job(1, 10, "spam-0"))
+    await asyncio.sleep(0)
+    tasks = [asyncio.create_task(job(1, 10, f"spam-{i}")) for i in range(1, 4)]
+    tasks.append(asyncio.create_task(job(2, 20, "other")))
+    await asyncio.sleep(0)
+    assert sched.queue_depth == 4
+
+    gate.set()
+    await asyncio.gather(first, *tasks)
+    assert order.index("other") == 2  # второй чат не ждёт весь хвост спамера
+
+
+@pytest.mark.asyncio
+async def test_queued_position_is_reported_and_admins_go_first():
+    sched = Scheduler(max_concurrency=1, admins={1})
+    order, positions = [], []
+    gate = asyncio.Event()
+
+    async def job(chat_id, user_id):
+        async def on_queued(pos):
+            positions.append(pos)
+        async with sched.slot(chat_id, user_id, on_queued=on_queued):
+            order.append(user_id)
+            await gate.wait()
+
+    tasks = [asyncio.create_task(job(100, 5))]
+    await asyncio.sleep(0)
+    tasks.append(asyncio.create_task(job(100, 6)))
+    await asyncio.sleep(0)
+    tasks.append(asyncio.create_task(job(1, 1)))
+    await asyncio.sleep(0)
+    gate.set()
+    await asyncio.gather(*tasks)
+
+    assert order == [5, 1, 6]
+    assert positions == [1, 2]
+
+
+@pytest.mark.asyncio
+async def test_limited_user_is_rejected_when_wait_is_too_long():
+    sched = Scheduler(limited={7}, limited_rate=0.001, limited_burst=1, max_wait=5)
+    async with sched.slot(1, 7):
+        pass
+    with pytest.raises(RateLimited):
+        async with sched.slot(1, 7):
+            pass
+
+
+@pytest.mark.asyncio
+async def test_shared_buckets_are_awaited_off_the_loop(tmp_path):
+    state = SharedState(str(tmp_path / "state.sqlite3"))
+    sched = Scheduler(user_rate=0.001, user_burst=1, max_wait=5, buckets=state.bucket)
+    try:
+        async with sched.slot(1, 10):
+            pass
+        with pytest.raises(RateLimited):
+            async with sched.slot(1, 10):
+                pass
+        # отклонённый запрос возвращает токен в общий bucket
+        assert state.reserve(10, rate=0.001, capacity=1) == pytest.approx(1000, rel=0.05)
+    finally:
+        state.close()
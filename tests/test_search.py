@@ -0,0 +1,94 @@
+import httpx
+import pytest
+
+from gptbot.search import SearchEngine, normalize_query
+
+
+def make_engine(handler, **kwargs):
+    engine = SearchEngine("key", "cx", **kwargs)
+    engine._http = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return engine
+
+
+def test_normalize_query():
+    assert normalize_query("  Курс   Доллара?? ") == "курс доллара"
+
+
+@pytest.mark.asyncio
+async def test_repeated_query_served_from_cache():
+    calls = []
+
+    def handler(request):
+        calls.append(dict(request.url.params))
+        return httpx.Response(200, json={"items": [{"title": "t", "link": "https://example.com", "snippet": "s"}]})
+
+    engine = make_engine(handler)
+    first = await engine.search("Курс доллара")
+    calls_after_first = len(calls)
+    second = await engine.search("курс   доллара?")
+    await engine.close()
+
+    assert first == second
+    assert len(calls) == calls_after_first
+    assert engine.stats()["cache_hits"] >= 1
+
+
+@pytest.mark.asyncio
+async def test_speculative_fallback_takes_first_non_empty():
+    def handler(request):
+        if "dateRestrict" in request.url.params:
+            return httpx.Response(200, json={"items": []})
+        return httpx.Response(200, json={"items": [{"title": "old", "link": "https://example.org"}]})
+
+    engine = make_engine(handler, speculative=True)
+    res = await engine.search("редкий запрос", date_restrict="m6")
+    await engine.close()
+
+    assert [it["title"] for it in res] == ["old"]
+
+
+@pytest.mark.asyncio
+async def test_fallback_is_sequential_by_default():
+    calls = []
+
+    def handler(request):
+        calls.append(dict(request.url.params))
+        return httpx.Response(200, json={"items": [{"title": "fresh", "link": "https://example.org"}]})
+
+    engine = make_engine(handler)
+    res = await engine.search("запрос", date_restrict="m6")
+    await engine.close()
+
+    # первый вариант дал результат — остальные платные запросы не отправлялись
+    assert [it["title"] for it in res] == ["fresh"]
+    assert len(calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_search_through_app_context_pool(tmp_path):
+    from gptbot.config import Config
+    from gptbot.context import AppContext
+
+    config = Config.from_env({
+        "TELEGRAM_TOKEN": "1:test",
+        "OPENAI_API_KEY": "test",
+        "GOOGLE_CSE_API_KEY": "key",
+        "GOOGLE_CSE_CX": "cx",
+        "HISTORY_DB": str(tmp_path / "history.sqlite3"),
+        "LEDGER_DB": str(tmp_path / "usage.sqlite3"),
+        "STATE_DB": str(tmp_path / "state.sqlite3"),
+    })
+    ctx = AppContext(config)
+
+    def handler(request):
+        return httpx.Response(200, json={"items": [{"title": "pool", "link": "https://example.org"}]})
+
+    # общий ленивый пул приложения (LazyClient), а не httpx-клиент, подставленный напрямую
+    ctx.http._factory = lambda: httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    try:
+        res = await ctx.search.search("запрос")
+        assert [it["title"] for it in res] == ["pool"]
+        assert ctx.search.errors == 0
+    finally:
+        await ctx.http.aclose()
+        ctx.close()
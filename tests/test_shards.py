@@ -0,0 +1,134 @@
+import asyncio
+import json
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from gptbot.shards import Supervisor, chat_id_of, shard_of, user_id_of
+from gptbot.shared_state import SharedState
+
+
+def _message(update_id, chat_id, user_id=None):
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "supergroup"},
+            "from": {"id": user_id or abs(chat_id), "is_bot": False, "first_name": "T"},
+            "text": f"m{update_id}",
+        },
+    }
+
+
+def record_worker(index, inbox, out_dir):
+    """Воркер для теста: пишет update_id в файл своего шарда до сигнала остановки."""
+    with open(os.path.join(out_dir, f"shard-{index}.jsonl"), "a", encoding="utf-8") as f:
+        while True:
+            raw = inbox.get()
+            if raw is None:
+                return
+            data = json.loads(raw)
+            f.write(json.dumps({"user": user_id_of(data), "update_id": data["update_id"]}) + "\n")
+
+
+def test_shard_is_stable_per_user():
+    callback = {"update_id": 3, "callback_query": {"id": "1", "from": {"id": 9}, "message": {"chat": {"id": -100}}}}
+    inline = {"update_id": 4, "inline_query": {"id": "1", "from": {"id": 9}, "query": "q"}}
+    channel = {"update_id": 6, "channel_post": {"message_id": 1, "date": 0, "chat": {"id": -101, "type": "channel"}}}
+
+    assert chat_id_of(_message(1, -100)) == -100
+    # история по user_id: личка и группа одного пользователя — в одном воркере
+    assert shard_of(_message(1, -100, user_id=9), 4) == shard_of(_message(2, 9), 4) == 9 % 4
+    assert shard_of(callback, 4) == shard_of(inline, 4) == 9 % 4
+    assert shard_of(channel, 4) == -101 % 4
+    assert shard_of({"update_id": 5}, 4) == 0
+
+
+def test_supervisor_keeps_user_order_within_one_shard(tmp_path):
+    supervisor = Supervisor(3, record_worker, args=(str(tmp_path),))
+    supervisor.start()
+    chats = [5, 6, 7, -100, 11]
+    for i in range(60):
+        supervisor.dispatch(_message(i, chats[i % len(chats)]))
+    supervisor.stop(timeout=30)
+
+    seen: dict[int, list] = {}
+    for index in range(3):
+        path = tmp_path / f"shard-{index}.jsonl"
+        rows = [json.loads(line) for line in path.read_text().splitlines()] if path.exists() else []
+        for row in rows:
+            assert row["user"] % 3 == index
+            seen.setdefault(row["user"], []).append(row["update_id"])
+    assert sorted(seen) == sorted(abs(chat) for chat in chats)
+    for ids in seen.values():
+        assert ids == sorted(ids)
+    assert sum(len(ids) for ids in seen.values()) == 60
+
+
+def test_crashing_worker_is_restarted_with_backoff():
+    supervisor = Supervisor(1, record_worker)
+    spawned = []
+    dead = SimpleNamespace(is_alive=lambda: False, exitcode=1)
+
+    def spawn(index):
+        spawned.append(index)
+        supervisor.procs[index] = dead
+
+    supervisor._spawn = spawn
+    supervisor.procs[0] = dead
+    # падает сразу после старта: паузы 1, 2, 4 с
+    supervisor.check(now=0.0)
+    supervisor.check(now=0.5)
+    assert spawned == []
+    supervisor.check(now=1.0)
+    supervisor.check(now=2.5)
+    assert spawned == [0]
+    supervisor.check(now=4.0)
+    assert spawned == [0]
+    supervisor.check(now=4.5)
+    assert spawned == [0, 0]
+    supervisor.check(now=5.0)
+    supervisor.check(now=8.9)
+    assert spawned == [0, 0]
+    supervisor.check(now=9.0)
+    assert spawned == [0, 0, 0] and supervisor.restarts == 3
+
+
+def test_shared_state_is_visible_across_connections(tmp_path):
+    path = str(tmp_path / "state.sqlite3")
+    a, b = SharedState(path), SharedState(path)
+    try:
+        assert a.modes[1] == "chat"
+        a.modes[1] = "web"
+        assert b.modes[1] == "web"
+
+        def reserve(state):
+            # у общего bucket'а reserve — корутина: запрос к базе идёт в потоке, а не в event loop
+            return asyncio.run(state.bucket(7, rate=0.01, capacity=2).reserve())
+
+        # один bucket на пользователя на все процессы: burst=2 тратится вместе
+        assert reserve(a) == 0
+        assert reserve(b) == 0
+        assert reserve(a) == pytest.approx(100, rel=0.05)
+        b.refund(7, capacity=2)
+        assert reserve(b) > 0
+    finally:
+        a.close()
+        b.close()
+
+
+def test_chat_models_are_shared_between_workers(tmp_path):
+    path = str(tmp_path / "state.sqlite3")
+    a, b = SharedState(path), SharedState(path)
+    b.chat_models._cache.ttl = 0
+    try:
+        a.chat_models[-100] = "gpt-4o"
+        assert b.chat_models.get(-100) == "gpt-4o" and -100 in b.chat_models
+        assert len(b.chat_models) == 1
+        assert a.chat_models.pop(-100) == "gpt-4o"
+        assert b.chat_models.get(-100, "default") == "default"
+    finally:
+        a.close()
+        b.close()
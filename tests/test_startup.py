@@ -0,0 +1,68 @@
+import builtins
+import os
+import subprocess
+import sys
+
+from gptbot.llm import LazyClient
+from gptbot.startup import StartupProfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHECK = """
+import sys
+from gptbot.app import build_app
+from gptbot.config import Config
+from gptbot.context import AppContext
+ctx = AppContext(Config.from_env())
+build_app(ctx)
+heavy = ("openai", "requests", "dotenv", "gptbot.deep_search", "gptbot.batch_jobs", "pydub", "concurrent.futures.process", "multiprocessing")
+print(",".join(m for m in heavy if m in sys.modules), ctx.client.loaded)
+"""
+
+
+def test_heavy_subsystems_are_not_imported_at_startup(tmp_path):
+    env = dict(
+        os.environ,
+        PYTHONPATH=ROOT,
+        TELEGRAM_TOKEN="1:test",
+        OPENAI_API_KEY="test",
+        HISTORY_DB=str(tmp_path / "history.sqlite3"),
+        LEDGER_DB=str(tmp_path / "usage.sqlite3"),
+        STATE_DB=str(tmp_path / "state.sqlite3"),
+    )
+    out = subprocess.run([sys.executable, "-c", CHECK], cwd=tmp_path, env=env, capture_output=True, text=True, timeout=60)
+    assert out.returncode == 0, out.stderr
+    # dotenv нужен Config.from_env, остальное — только при первом использовании
+    assert out.stdout.split() == ["dotenv", "False"]
+
+    created = []
+    client = LazyClient(lambda: created.append(1) or os.path)
+    assert not client.loaded
+    assert client.join is os.path.join and client.sep == os.path.sep
+    assert created == [1]
+
+
+def test_profile_reports_phases_and_imports(tmp_path, monkeypatch):
+    (tmp_path / "slow_module_for_profile.py").write_text("import time\ntime.sleep(0.05)\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    original = builtins.__import__
+    finished = []
+
+    profile = StartupProfile()
+    profile.on_finish = lambda: finished.append(True)
+    profile.install()
+    try:
+        import slow_module_for_profile  # noqa: F401
+
+        profile.mark("импорты")
+    finally:
+        profile.finish()
+    sys.modules.pop("slow_module_for_profile", None)
+
+    assert builtins.__import__ is original
+    assert finished == [True]
+    (name, seconds, depth), = [i for i in profile.imports if i[0] == "slow_module_for_profile"]
+    assert seconds >= 0.05 and depth == 0
+    report = profile.report()
+    assert "импорты" in report and "первый getUpdates" in report
+    assert "slow_module_for_profile" in report
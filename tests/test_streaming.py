@@ -0,0 +1,80 @@
+from types import SimpleNamespace
+
+import pytest
+
+from gptbot import streaming
+from gptbot.streaming import stream_reply
+
+
+class FakeBot:
+    def __init__(self):
+        self.edits = []
+        self.modes = []
+
+    async def edit_message_text(self, text, chat_id, message_id, parse_mode=None):
+        self.edits.append(text)
+        self.modes.append(parse_mode)
+
+
+class FakeMessage:
+    def __init__(self, chat_id):
+        self.chat_id = chat_id
+        self.replies = []
+
+    async def reply_text(self, text, parse_mode=None):
+        self.replies.append(text)
+        return SimpleNamespace(message_id=len(self.replies))
+
+
+async def _chunks(parts):
+    for p in parts:
+        yield p
+
+
+@pytest.mark.asyncio
+async def test_stream_edits_are_coalesced():
+    bot = FakeBot()
+    message = FakeMessage(chat_id=101)
+    parts = ["слово "] * 200
+
+    answer = await stream_reply(bot, message, _chunks(parts), min_interval=60)
+
+    assert answer == "".join(parts)
+    # первый токен + финальная правка, всё остальное склеено
+    assert len(bot.edits) == 2
+    assert bot.edits[0] == "слово "
+    assert bot.edits[-1] == answer
+
+
+@pytest.mark.asyncio
+async def test_stream_long_answer_overflows_into_new_messages():
+    bot = FakeBot()
+    message = FakeMessage(chat_id=102)
+
+    answer = await stream_reply(bot, message, _chunks(["x" * 5000]), min_interval=0)
+
+    assert len(answer) == 5000
+    assert message.replies[-1] == "x" * (5000 - 4096)
+
+
+@pytest.mark.asyncio
+async def test_stream_final_edit_is_rendered_as_html():
+    bot = FakeBot()
+    message = FakeMessage(chat_id=103)
+
+    answer = await stream_reply(bot, message, _chunks(["**жирный** и `код`"]), min_interval=0)
+
+    assert answer == "**жирный** и `код`"
+    assert bot.edits[-1] == "<b>жирный</b> и <code>код</code>"
+    assert bot.modes[-1] == "HTML"
+
+
+@pytest.mark.asyncio
+async def test_stream_forgets_chat_after_last_stream():
+    bot = FakeBot()
+    message = FakeMessage(chat_id=104)
+
+    await stream_reply(bot, message, _chunks(["ответ"]), min_interval=0)
+
+    assert 104 not in streaming._last_edit_at
+    assert 104 not in streaming._active_streams
@@ -0,0 +1,101 @@
+import json
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from gptbot import context, metrics
+from gptbot.tenants import TenantRegistry, load_configs, tenant_path
+
+ENV = {"TELEGRAM_TOKEN": "0:process", "OPENAI_API_KEY": "test", "HISTORY_DB": "/shared/history.sqlite3"}
+
+
+def write_tenants(tmp_path, tenants):
+    path = tmp_path / "tenants.json"
+    path.write_text(json.dumps({"tenants": tenants}))
+    return str(path)
+
+
+def test_load_configs_overrides_environment_per_tenant(tmp_path):
+    path = write_tenants(tmp_path, [
+        {"name": "support", "telegram_token": "1:a", "BOT_USERNAME": "SupportBot", "CHAT_ID": -100, "ADMINS": [5, 6]},
+        {"name": "family", "TELEGRAM_TOKEN": "2:b", "OPENAI_MODEL": "gpt-4o-mini", "MODEL_ROUTING": True},
+    ])
+    support, family = load_configs(path, ENV)
+
+    assert (support.name, support.telegram_token, support.bot_username) == ("support", "1:a", "SupportBot")
+    assert support.chat_id == -100 and support.admins == {5, 6}
+    assert family.default_model == "gpt-4o-mini" and family.model_routing
+    # ключ OpenAI общий из окружения, а базы — свои, даже если в окружении задана одна на всех
+    assert family.openai_api_key == "test"
+    assert support.history_db == tenant_path("history.sqlite3", "support")
+    assert family.ledger_db == tenant_path("usage.sqlite3", "family")
+    assert os.path.basename(family.update_checkpoint) == "pending_updates-family"
+
+
+def test_load_configs_rejects_duplicates(tmp_path):
+    with pytest.raises(ValueError):
+        load_configs(write_tenants(tmp_path, [{"name": "a", "TELEGRAM_TOKEN": "1:a"}] * 2), ENV)
+    with pytest.raises(ValueError):
+        load_configs(write_tenants(tmp_path, [{"name": "a", "TELEGRAM_TOKEN": "1:a"}, {"name": "b", "TELEGRAM_TOKEN": "1:a"}]), ENV)
+    with pytest.raises(ValueError):
+        load_configs(write_tenants(tmp_path, [{"name": "a-b", "TELEGRAM_TOKEN": "1:a"}]), ENV)
+
+
+def test_tenants_share_clients_but_not_budgets(tmp_path):
+    tenants = [
+        {
+            "name": name,
+            "TELEGRAM_TOKEN": f"{i}:t",
+            "HISTORY_DB": str(tmp_path / f"history-{name}.sqlite3"),
+            "LEDGER_DB": str(tmp_path / f"usage-{name}.sqlite3"),
+            "STATE_DB": str(tmp_path / f"state-{name}.sqlite3"),
+        }
+        for i, name in enumerate(("a", "b"), 1)
+    ]
+    registry = TenantRegistry(load_configs(write_tenants(tmp_path, tenants), ENV))
+    a, b = registry.contexts["a"], registry.contexts["b"]
+    try:
+        assert a.llm is b.llm and a.search is b.search and a.http is b.http
+        assert a.ledger is not b.ledger and a.history is not b.history
+
+        # расход пишется в ledger того тенанта, чья задача сейчас работает
+        token = context.active.set(b)
+        try:
+            metrics.record_usage("gpt-4o", 7, SimpleNamespace(prompt_tokens=1_000_000, completion_tokens=0))
+        finally:
+            context.active.reset(token)
+        assert a.ledger.total == 0.0
+        assert b.ledger.total == pytest.approx(2.5)
+
+        rendered = metrics.REGISTRY.render()
+        assert 'gptbot_spend_usd{tenant="b"} 2.5' in rendered
+        assert 'gptbot_spend_usd{tenant="a"} 0.0' in rendered
+    finally:
+        registry.close()
+
+
+def test_tenants_with_own_openai_key_get_own_clients(tmp_path):
+    tenants = [
+        {
+            "name": name,
+            "TELEGRAM_TOKEN": f"{i}:t",
+            "HISTORY_DB": str(tmp_path / f"history-{name}.sqlite3"),
+            "LEDGER_DB": str(tmp_path / f"usage-{name}.sqlite3"),
+            "STATE_DB": str(tmp_path / f"state-{name}.sqlite3"),
+            **extra,
+        }
+        for i, (name, extra) in enumerate(
+            [("a", {}), ("b", {}), ("c", {"OPENAI_API_KEY": "other"}), ("d", {"GOOGLE_CSE_API_KEY": "cse"})], 1
+        )
+    ]
+    registry = TenantRegistry(load_configs(write_tenants(tmp_path, tenants), ENV))
+    ctx = registry.contexts
+    try:
+        assert len(registry.shared) == 3
+        assert ctx["a"].llm is ctx["b"].llm
+        assert ctx["c"].llm is not ctx["a"].llm and ctx["c"].config.openai_api_key == "other"
+        assert ctx["d"].search is not ctx["a"].search
+        assert 'gptbot_search_p95_seconds{clients="c"}' in metrics.REGISTRY.render()
+    finally:
+        registry.close()
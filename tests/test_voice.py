@@ -0,0 +1,43 @@
+from datetime import timedelta
+from types import SimpleNamespace
+
+import pytest
+
+from gptbot.voice import VoicePipeline, duration_seconds
+
+
+class FakeTelegramFile:
+    async def download_to_memory(self, out):
+        out.write(b"OggS-fake-opus")
+
+
+class FakeVoice:
+    async def get_file(self):
+        return FakeTelegramFile()
+
+
+class FakeLLM:
+    def __init__(self):
+        self.uploads = []
+
+    async def transcribe(self, file, model="whisper-1"):
+        self.uploads.append(file)
+        return SimpleNamespace(text="  привет  ")
+
+
+@pytest.mark.asyncio
+async def test_ogg_goes_to_whisper_from_memory():
+    llm = FakeLLM()
+    pipeline = VoicePipeline(llm)
+
+    text = await pipeline.transcribe(FakeVoice())
+
+    assert text == "привет"
+    assert llm.uploads == [("voice.ogg", b"OggS-fake-opus", "audio/ogg")]
+    pipeline.close()
+
+
+def test_duration_seconds_accepts_int_and_timedelta():
+    assert duration_seconds(7) == 7.0
+    assert duration_seconds(timedelta(seconds=7.5)) == 7.5
+    assert duration_seconds(None) == 0.0
@@ -0,0 +1,90 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from gptbot.app import webhook_settings
+from gptbot.config import Config
+from gptbot.http_listener import Response, start_server
+from gptbot.webhook import SECRET_HEADER, WebhookServer
+
+UPDATE = {
+    "update_id": 1,
+    "message": {
+        "message_id": 10,
+        "date": 0,
+        "chat": {"id": 5, "type": "private"},
+        "from": {"id": 5, "is_bot": False, "first_name": "T"},
+        "text": "привет",
+    },
+}
+
+
+class FakeApp:
+    bot = None
+
+    def __init__(self):
+        self.update_queue = asyncio.Queue()
+
+
+@pytest.mark.asyncio
+async def test_webhook_verifies_secret_and_enqueues_update():
+    app = FakeApp()
+    hook = WebhookServer(app, "s3cret", path="/telegram")
+    server = await start_server(hook.handle, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    url = f"http://127.0.0.1:{port}/telegram"
+
+    async with httpx.AsyncClient() as http:
+        bad = await http.post(url, content=json.dumps(UPDATE), headers={SECRET_HEADER: "nope"})
+        ok = await http.post(url, content=json.dumps(UPDATE), headers={SECRET_HEADER: "s3cret"})
+        missing = await http.post(f"http://127.0.0.1:{port}/other", content=b"{}")
+
+    server.close()
+    await server.wait_closed()
+
+    assert (bad.status_code, ok.status_code, missing.status_code) == (403, 200, 404)
+    update = app.update_queue.get_nowait()
+    assert update.message.text == "привет"
+    assert app.update_queue.empty()
+
+
+def test_webhook_requires_secret():
+    with pytest.raises(ValueError):
+        WebhookServer(FakeApp(), None)
+    config = Config.from_env({"TELEGRAM_TOKEN": "1:t", "OPENAI_API_KEY": "k"})
+    first, second = webhook_settings(config)["secret_token"], webhook_settings(config)["secret_token"]
+    assert len(first) >= 32 and first != second
+
+
+def test_webhook_settings_come_from_config():
+    config = Config.from_env({
+        "TELEGRAM_TOKEN": "1:t",
+        "OPENAI_API_KEY": "k",
+        "RUN_MODE": "Webhook",
+        "WEBHOOK_WORKERS": "3",
+        "WEBHOOK_URL": "https://bot.example/",
+        "WEBHOOK_PATH": "/hook",
+        "WEBHOOK_SECRET": "s3cret",
+        "WEBHOOK_PORT": "9000",
+    })
+    assert (config.run_mode, config.workers) == ("webhook", 3)
+    assert config.webhook_url == "https://bot.example/hook"
+    assert webhook_settings(config) == {"host": "0.0.0.0", "port": 9000, "path": "/hook", "secret_token": "s3cret"}
+
+
+@pytest.mark.asyncio
+async def test_idle_connection_is_closed_after_read_timeout():
+    async def handle(req):
+        return Response(200, "ok")
+
+    server = await start_server(handle, "127.0.0.1", 0, read_timeout=0.1)
+    port = server.sockets[0].getsockname()[1]
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(b"POST /telegram HTTP/1.1\r\n")  # заголовки так и не приходят
+    await writer.drain()
+    assert await asyncio.wait_for(reader.read(), 2) == b""
+    writer.close()
+    server.close()
+    await server.wait_closed()
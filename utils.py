@@ -1,30 +0,0 @@
-import logging
-from telegram import Update
-from .config import ADMINS, CHAT_ID, BOT_USERNAME
-
-def format_exc(e: Exception) -> str:
-    return f"{type(e).__name__}: {e}"
-
-def is_admin(user_id: int) -> bool:
-    return user_id in ADMINS
-
-def is_allowed(update: Update) -> bool:
-    user_id = update.effective_user.id
-    chat = update.effective_chat
-    message = update.message
-
-    text = (message.text or message.caption or "") if message else ""
-    logging.info(f"[{user_id}] - chat_id: {chat.id} - type: {chat.type} - Text: {text}")
-
-    # приватка для админов
-    if chat.type == "private" and user_id in ADMINS:
-        return True
-
-    # группы — только при упоминании или reply
-    if chat.id == CHAT_ID and chat.type in ("group", "supergroup"):
-        if BOT_USERNAME.lower() in text.lower():
-            return True
-        if message and message.reply_to_message and message.reply_to_message.from_user.username == BOT_USERNAME:
-            return True
-
-    return False